@@ -1,5 +1,101 @@
-from django.contrib import admin
-from .models import Source, Category, SiteCategory, News, Tag, LogStats
+from django.contrib import admin, messages
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.contrib.postgres.search import SearchQuery
+from django.core.paginator import Paginator
+from django.db import OperationalError, connections, transaction
+from django.db.models import Case, OuterRef, Prefetch, Subquery, Value, When
+from django.forms import Media, ModelChoiceField
+from django.http import HttpResponse
+from django.utils.functional import cached_property
+from django.utils.html import format_html, format_html_join
+from .models import (
+    Source, Category, SiteCategory, News, Tag, LogStats, WebSubSubscription, DailyCount, SEARCH_CONFIG,
+    news_search_vector,
+)
+from .profiling import format_profile_report
+from .rollups import DIMENSION_MODELS
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that does not count millions of rows exactly on PostgreSQL
+
+    Unfiltered lists use the planner's row estimate of the table (pg_class.reltuples) once the
+    table is large; filtered lists are counted exactly unless that takes longer than
+    COUNT_TIMEOUT_MS, in which case the estimate of the query plan is used
+    """
+    # Tables estimated smaller than this are counted exactly
+    ESTIMATE_THRESHOLD = 10000
+    COUNT_TIMEOUT_MS = 200
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return super().count
+
+        if not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= self.ESTIMATE_THRESHOLD:
+                return int(row[0])
+
+        try:
+            with transaction.atomic(using=queryset.db), connection.cursor() as cursor:
+                cursor.execute(f"SET LOCAL statement_timeout = {int(self.COUNT_TIMEOUT_MS)}")
+                return super().count
+        except OperationalError:
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cursor.fetchone()[0]
+            return int(plan[0]['Plan']['Plan Rows'])
+
+
+class AutocompleteFilter(admin.RelatedFieldListFilter):
+    """
+    List filter on a relation picked with an autocomplete box (like autocomplete_fields) instead of
+    a list of every related object
+
+    The related model's admin must define search_fields; the model admin using the filter must
+    include autocomplete_media() in its media
+    """
+    template = 'admin/news/autocomplete_filter.html'
+
+    def field_choices(self, field, request, model_admin):
+        # Nothing is listed: the choices are searched for by the widget
+        return []
+
+    def has_output(self):
+        return True
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        form_field = ModelChoiceField(
+            queryset=field.remote_field.model._default_manager.all(),
+            required=False,
+            widget=AutocompleteSelect(field, model_admin.admin_site),
+        )
+        self.widget = form_field.widget.render(self.lookup_kwarg, self.lookup_val)
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.lookup_val is not None,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg, self.lookup_kwarg_isnull]),
+            'display': self.title,
+        }
+
+
+def autocomplete_media(model, field_name, admin_site):
+    """
+    Scripts and styles of the autocomplete widget, for changelists with an AutocompleteFilter
+    """
+    widget_media = AutocompleteSelect(model._meta.get_field(field_name), admin_site).media
+    return widget_media + Media(js=['js/admin_autocomplete_filter.js'])
 
 
 @admin.register(Source)
@@ -10,6 +106,19 @@ class SourceAdmin(admin.ModelAdmin):
     date_hierarchy = 'created_at'
 
 
+@admin.register(WebSubSubscription)
+class WebSubSubscriptionAdmin(admin.ModelAdmin):
+    list_display = ('source', 'hub_url', 'is_active', 'lease_expires_at', 'last_pushed_at', 'last_polled_at')
+    search_fields = ('source__name', 'hub_url', 'topic_url')
+    readonly_fields = ('lease_expires_at', 'requested_at', 'last_pushed_at', 'last_polled_at')
+    exclude = ('secret',)
+    autocomplete_fields = ('source',)
+
+    @admin.display(boolean=True, description="Active")
+    def is_active(self, obj):
+        return obj.is_active
+
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'slug')
@@ -19,32 +128,187 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(SiteCategory)
 class SiteCategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category')
+    list_display = ('name', 'category', 'auto_mapped')
+    list_filter = ('auto_mapped', ('category', admin.EmptyFieldListFilter))
     search_fields = ('name',)
+    ordering = ('name',)
     autocomplete_fields = ('category',)
+    readonly_fields = ('auto_mapped',)
+
+    def save_model(self, request, obj, form, change):
+        # A category chosen here is a manual mapping, which the automatic mapper never overrides
+        if 'category' in form.changed_data:
+            obj.auto_mapped = False
+        super().save_model(request, obj, form, change)
+
+
+class NewsTagInline(admin.TabularInline):
+    """
+    Tags of a news, picked with an autocomplete box (tags are linked from the Tag side of the relation)
+    """
+    model = Tag.news.through
+    autocomplete_fields = ('tag',)
+    extra = 0
+    verbose_name = "tag"
+    verbose_name_plural = "tags"
+
 
 @admin.register(News)
 class NewsAdmin(admin.ModelAdmin):
-    list_display = ('title', 'source', 'created_at', 'display_tags')
-    list_filter = ('source', 'site_categories')
-    search_fields = ('title', 'content')
+    list_display = ('title', 'source', 'published_at', 'created_at', 'revision', 'display_tags')
+    readonly_fields = ('content_hash', 'revision', 'updated_at')
+    list_filter = ('source', ('site_categories', AutocompleteFilter))
+    list_select_related = ('source',)
+    # Used on databases other than PostgreSQL only, see get_search_results
+    search_fields = ('title',)
     prepopulated_fields = {'slug': ('title',)}
-    date_hierarchy = 'created_at'
-    filter_horizontal = ('site_categories', 'tags')
-    
+    date_hierarchy = 'published_at'
+    autocomplete_fields = ('source', 'site_categories')
+    inlines = (NewsTagInline,)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        return super().media + autocomplete_media(News, 'site_categories', self.admin_site)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.only('id', 'name'))
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Search titles and bodies through the full-text index instead of ILIKE over every body
+        """
+        search_term = search_term.strip()
+        if not search_term or connections[queryset.db].vendor != 'postgresql':
+            return super().get_search_results(request, queryset, search_term)
+
+        query = SearchQuery(search_term, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.alias(search=news_search_vector()).filter(search=query), False
+
+    @admin.display(description="Tags")
     def display_tags(self, obj):
+        # Served by the prefetch in get_queryset
         return ", ".join([tag.name for tag in obj.tags.all()])
-    
-    display_tags.short_description = "Tags"
 
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     list_display = ('name', 'slug')
     prepopulated_fields = {'slug': ('name',)}
+    # Searched by get_search_results; also required for the tag autocomplete of the news inline
     search_fields = ('name',)
-    filter_horizontal = ('news',)
+    # A tag can be on any number of news: pick them by ID rather than listing every article
+    raw_id_fields = ('news',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Tags whose name starts with the lowercased term, served by the name prefix index
+
+        The importer stores tag names lowercased (see news.autocomplete.suggest_tags). A '^name'
+        search would compare UPPER(name), which the index cannot serve, and scan every tag
+        """
+        search_term = search_term.strip().lower()
+        if not search_term:
+            return queryset, False
+        return queryset.filter(name__startswith=search_term), False
+
+
+@admin.register(DailyCount)
+class DailyCountAdmin(admin.ModelAdmin):
+    """
+    Read-only view of the daily counts kept by the importer (repair them with repair_daily_counts)
+    """
+    list_display = ('date', 'dimension', 'display_object', 'count')
+    list_filter = ('dimension',)
+    date_hierarchy = 'date'
+    ordering = ('-date', 'dimension', '-count')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Name of the source, category or tag, looked up for the rows of the page only
+        names = [
+            When(dimension=dimension, then=Subquery(model.objects.filter(id=OuterRef('object_id')).values('name')[:1]))
+            for dimension, model in DIMENSION_MODELS.items()
+        ]
+        return super().get_queryset(request).annotate(object_name=Case(*names, default=Value("All news")))
+
+    @admin.display(description="Object")
+    def display_object(self, obj):
+        return obj.object_name or f"#{obj.object_id}"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(LogStats)
 class ImportStatsAdmin(admin.ModelAdmin):
-    list_display = ('started_at', 'completed_at', 'imported', 'skipped', 'errors')
\ No newline at end of file
+    list_display = (
+        'started_at', 'completed_at', 'imported', 'updated', 'skipped', 'errors', 'display_slowest_source',
+        'display_profiled'
+    )
+    readonly_fields = ('display_stages', 'display_sources')
+    exclude = ('metrics', 'profile')
+    actions = ('download_profile',)
+
+    @admin.action(description="Download profile (hot functions and slowest queries)")
+    def download_profile(self, request, queryset):
+        reports = []
+        for stats in queryset.order_by('started_at'):
+            for step, report in stats.profile.items():
+                reports.append(format_profile_report(report, title=f"{stats} - {step}"))
+
+        if not reports:
+            self.message_user(request, "None of the selected runs were profiled", messages.WARNING)
+            return None
+
+        response = HttpResponse('\n'.join(reports), content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="pipeline-profile.txt"'
+        return response
+
+    def display_profiled(self, obj):
+        return bool(obj.profile)
+
+    display_profiled.boolean = True
+    display_profiled.short_description = "Profiled"
+
+    def display_slowest_source(self, obj):
+        sources = obj.metrics.get('sources', {})
+        if not sources:
+            return "-"
+        name, values = max(sources.items(), key=lambda item: item[1].get('fetch_seconds', 0))
+        return f"{name} ({values.get('fetch_seconds', 0):.1f}s)"
+
+    display_slowest_source.short_description = "Slowest fetch"
+
+    def display_stages(self, obj):
+        rows = [
+            (name, values['calls'], f"{values['seconds']:.3f}", f"{values['max_seconds']:.3f}", values['queries'])
+            for name, values in obj.metrics.get('stages', {}).items()
+        ]
+        return format_html(
+            "<table><tr><th>Stage</th><th>Calls</th><th>Seconds</th><th>Max</th><th>Queries</th></tr>{}</table>",
+            format_html_join('', "<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>", rows)
+        )
+
+    display_stages.short_description = "Stages"
+
+    def display_sources(self, obj):
+        rows = [
+            (name, ", ".join(f"{key}: {value:g}" for key, value in sorted(values.items())))
+            for name, values in sorted(obj.metrics.get('sources', {}).items())
+        ]
+        return format_html(
+            "<table><tr><th>Source</th><th>Metrics</th></tr>{}</table>",
+            format_html_join('', "<tr><td>{}</td><td>{}</td></tr>", rows)
+        )
+
+    display_sources.short_description = "Sources"
@@ -0,0 +1,235 @@
+import hashlib
+
+from django.conf import settings
+from django.db.models import Max, Prefetch
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import filters, viewsets
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from .cache import import_etag, import_last_modified, public_cache_control
+from .models import DailyCount, News, Source, SiteCategory, Tag
+from .queries import parse_news_filters, parse_stats_period, filter_news
+from .rollups import DIMENSION_MODELS, daily_totals, resolve_slugs, top_objects
+from .serializers import NewsSerializer, SourceSerializer, TagSerializer, get_requested_fields
+from .trending import KINDS, available_windows, get_trending
+
+
+def _sources_last_modified(request, *args, **kwargs):
+    return Source.objects.aggregate(latest=Max('created_at'))['latest']
+
+
+def _sources_etag(request, *args, **kwargs):
+    last_modified = _sources_last_modified(request)
+    if last_modified is None:
+        return None
+
+    key = f"{last_modified.isoformat()}|{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}"
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def _trending_window(request):
+    window = request.query_params.get('window') or available_windows()[0]
+    if window not in available_windows():
+        raise ValidationError({'window': [f"Choose one of: {', '.join(available_windows())}"]})
+    return window
+
+
+def _trending_etag(request, *args, **kwargs):
+    trending = get_trending(_trending_window(request))
+    if trending is None:
+        return None
+
+    key = f"{trending['generated_at']}|{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}"
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def conditional(etag_func, last_modified_func):
+    """
+    Decorate a viewset action with ETag and Last-Modified support, and the Cache-Control policy of the HTML views
+    """
+    return method_decorator([
+        public_cache_control,
+        condition(etag_func=etag_func, last_modified_func=last_modified_func),
+    ])
+
+
+class NewsCursorPagination(CursorPagination):
+    """
+    Cursor pagination ordered by the same `sort` parameter the HTML index accepts
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        sort_by = parse_news_filters(request.query_params)['sort']
+        tie_breaker = '-id' if sort_by.startswith('-') else 'id'
+        return (sort_by, tie_breaker)
+
+
+class NewsFilterBackend(filters.BaseFilterBackend):
+    """
+    Apply the same filters as the HTML index view (q, source, category, tag, date_range, sort)
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        try:
+            filters = parse_news_filters(request.query_params, strict=True)
+        except ValueError as e:
+            raise ValidationError({'source': [str(e)]})
+        return filter_news(queryset, filters)
+
+
+class NewsViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only news API with cursor pagination and sparse fieldsets
+    """
+    serializer_class = NewsSerializer
+    pagination_class = NewsCursorPagination
+    filter_backends = [NewsFilterBackend]
+    lookup_field = 'slug'
+
+    def get_queryset(self):
+        queryset = News.objects.all()
+        requested = get_requested_fields(self.request)
+
+        # Only join and prefetch the relations the client actually asked for
+        if requested is None or 'source' in requested:
+            queryset = queryset.select_related('source').defer(
+                'source__url', 'source__rss_url', 'source__needs_scraping', 'source__active',
+                'source__created_at',
+            )
+        if requested is None or 'site_categories' in requested:
+            queryset = queryset.prefetch_related(Prefetch(
+                'site_categories',
+                queryset=SiteCategory.objects.select_related('category').only(
+                    'id', 'name', 'slug', 'category__id', 'category__slug',
+                ),
+            ))
+        if requested is None or 'tags' in requested:
+            queryset = queryset.prefetch_related(Prefetch('tags', queryset=Tag.objects.only('id', 'name', 'slug')))
+        if requested is not None and 'content' not in requested:
+            queryset = queryset.defer('content')
+
+        return queryset
+
+    @conditional(import_etag, import_last_modified)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional(import_etag, import_last_modified)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class SourceViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only API for news sources
+    """
+    queryset = Source.objects.all().order_by('name')
+    serializer_class = SourceSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['active']
+
+    @conditional(_sources_etag, _sources_last_modified)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional(_sources_etag, _sources_last_modified)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class TagViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only API for tags
+    """
+    queryset = Tag.objects.all().order_by('name')
+    serializer_class = TagSerializer
+    lookup_field = 'slug'
+
+    @conditional(import_etag, import_last_modified)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional(import_etag, import_last_modified)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class TrendingViewSet(viewsets.ViewSet):
+    """
+    Tags and site categories rising fastest over a time window
+
+    Query parameters: `window` (1h, 6h or 24h), `kind` (tag or site_category) and `limit`.
+    Served from the results cached by the scoring task, so reads never touch the database
+    """
+
+    @conditional(_trending_etag, None)
+    def list(self, request, *args, **kwargs):
+        window = _trending_window(request)
+        kind = request.query_params.get('kind')
+        if kind and kind not in KINDS:
+            raise ValidationError({'kind': [f"Choose one of: {', '.join(KINDS)}"]})
+        try:
+            limit = max(int(request.query_params.get('limit', settings.TRENDING_TOP_K)), 0)
+        except ValueError:
+            raise ValidationError({'limit': ["A whole number is required"]})
+
+        trending = get_trending(window) or {'window': window, 'generated_at': None, 'results': {}}
+        kinds = [kind] if kind else list(KINDS)
+        response = Response({
+            'window': window,
+            'generated_at': trending['generated_at'],
+            'results': {name: trending['results'].get(name, [])[:limit] for name in kinds},
+        })
+        patch_cache_control(response, public=True, max_age=settings.TRENDING_SCORE_INTERVAL)
+        return response
+
+
+class StatsViewSet(viewsets.ViewSet):
+    """
+    Number of news per day, in total or per source, category or tag
+
+    Query parameters: `dimension` (total, source, category or tag), `days` or `date_range`
+    (as on the index page), `slug` (repeatable; source IDs for sources) and `limit`.
+    Without `slug` the sources, categories or tags with the most news in the range are returned.
+    Read from the daily counts kept by the importer, never from the news table
+    """
+    default_limit = 20
+    max_limit = 100
+
+    @conditional(import_etag, import_last_modified)
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        dimension = params.get('dimension') or DailyCount.TOTAL
+        if dimension != DailyCount.TOTAL and dimension not in DIMENSION_MODELS:
+            raise ValidationError({'dimension': [f"Choose one of: {DailyCount.TOTAL}, {', '.join(DIMENSION_MODELS)}"]})
+        try:
+            date_from, date_to = parse_stats_period(params)
+        except ValueError as e:
+            raise ValidationError({'date_range': [str(e)]})
+        try:
+            limit = min(max(int(params.get('limit', self.default_limit)), 0), self.max_limit)
+        except ValueError:
+            raise ValidationError({'limit': ["A whole number is required"]})
+
+        if dimension == DailyCount.TOTAL:
+            daily = daily_totals(date_from, date_to)
+            results = [{'slug': None, 'name': 'All news', 'count': sum(day['count'] for day in daily), 'daily': daily}]
+        else:
+            slugs = params.getlist('slug')
+            object_ids = resolve_slugs(dimension, slugs) if slugs else None
+            results = top_objects(dimension, date_from, date_to, limit, object_ids, daily=True)
+
+        return Response({
+            'dimension': dimension,
+            'date_from': date_from,
+            'date_to': date_to,
+            'results': results,
+        })
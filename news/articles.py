@@ -0,0 +1,118 @@
+import hashlib
+import json
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from .models import News
+
+
+def url_hash(url: str) -> str:
+    return hashlib.md5(url.encode('utf-8')).hexdigest()
+
+
+def content_hash(title: str, content: str) -> str:
+    """
+    Fingerprint of an article's title and content, compared on re-ingest to detect changes
+    """
+    return hashlib.md5(f"{title}\n{content}".encode('utf-8')).hexdigest()
+
+
+@dataclass(frozen=True, slots=True)
+class Article:
+    """
+    Parsed article handed from the RSS parser to the importer
+
+    Built once by the parser with every field already within the News column limits and
+    the slug and URL hash derived, so the importer uses it as is. Stored in Redis as a JSON
+    array in field order, which is read back without validating or deriving anything again
+    """
+    title: str
+    content: str
+    url: str
+    source: str
+    site_category: str = ''
+    tags: Tuple[str, ...] = ()
+    published_at: Optional[str] = None  # ISO 8601 publish time reported by the feed
+    slug: str = ''
+    url_hash: str = ''
+    content_hash: str = ''
+
+    @classmethod
+    def build(cls, title: str, content: str, url: str, source: str, site_category: str = '',
+              tags: Iterable[str] = (), published_at: Optional[str] = None,
+              hashed_content: Optional[str] = None) -> 'Article':
+        """
+        Create an article, truncating its fields to the News limits and deriving its slug and URL hash
+
+        `hashed_content` is the content hash computed by the parser from the feed's raw content;
+        by default the hash of the title and content is used
+        """
+        title = News.truncate_for_field(title, 'title')
+        url = News.truncate_for_field(url, 'url')
+        content = News.truncate_for_field(content or '', 'content')
+        return cls(
+            title=title,
+            content=content,
+            url=url,
+            source=source,
+            site_category=site_category or '',
+            tags=tuple(tags or ()),
+            published_at=published_at,
+            slug=News.get_safe_slug(title),
+            url_hash=url_hash(url),
+            content_hash=hashed_content or content_hash(title, content),
+        )
+
+    @classmethod
+    def from_dict(cls, item: Dict) -> Optional['Article']:
+        """
+        Create an article from a dict in the older hand-off format; returns None if it is not usable
+        """
+        if not isinstance(item, dict) or not item.get('title') or not item.get('url'):
+            return None
+        tags = item.get('tags')
+        return cls.build(
+            title=item['title'],
+            content=item.get('content') or '',
+            url=item['url'],
+            source=item.get('source') or '',
+            site_category=item.get('site_category') or '',
+            tags=tags if isinstance(tags, list) else (),
+            published_at=item.get('published_at'),
+        )
+
+    @classmethod
+    def from_json(cls, data) -> Optional['Article']:
+        """
+        Read an article stored with to_json (or a dict in the older format); returns None if it is malformed
+        """
+        try:
+            values = json.loads(data)
+        except (TypeError, ValueError):
+            return None
+        if isinstance(values, dict):
+            return cls.from_dict(values)
+        # Articles queued before content hashes were added have no hash
+        if not isinstance(values, list) or len(values) not in (9, 10):
+            return None
+        title, content, url, source, site_category, tags, published_at, slug, hashed_url, *rest = values
+        strings = (title, content, url, source, site_category, slug, hashed_url, *rest)
+        if (not all(isinstance(value, str) for value in strings) or not title or not url
+                or not isinstance(tags, list) or not isinstance(published_at, (str, type(None)))):
+            return None
+        hashed_content = rest[0] if rest else content_hash(title, content)
+        return cls(title, content, url, source, site_category, tuple(tags), published_at, slug, hashed_url,
+                   hashed_content)
+
+    def to_json(self) -> str:
+        """
+        Compact JSON array in field order, without repeating the field names for every article
+        """
+        return json.dumps(
+            [self.title, self.content, self.url, self.source, self.site_category, self.tags,
+             self.published_at, self.slug, self.url_hash, self.content_hash],
+            ensure_ascii=False,
+        )
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
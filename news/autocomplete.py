@@ -0,0 +1,73 @@
+import logging
+from collections import defaultdict
+
+from django.db import DatabaseError, models, transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Tag
+
+logger = logging.getLogger(__name__)
+
+# Tags per update of the usage counts
+UPDATE_CHUNK = 500
+
+
+def record_tag_usage(counts):
+    """
+    Add a Counter of tag ID -> newly linked news to the tag usage counts
+
+    Called once per committed import batch. Each chunk of tags is locked in ID order, so concurrent
+    importers cannot deadlock, then updated with one UPDATE adding each tag's count (a CASE over the
+    distinct counts). A failure is only logged: `recount_tag_usage` recounts every tag
+    """
+    rows = sorted((tag_id, count) for tag_id, count in counts.items() if count)
+    if not rows:
+        return
+
+    try:
+        with transaction.atomic():
+            for start in range(0, len(rows), UPDATE_CHUNK):
+                chunk = rows[start:start + UPDATE_CHUNK]
+                tag_ids = [tag_id for tag_id, _ in chunk]
+                tag_ids_by_count = defaultdict(list)
+                for tag_id, count in chunk:
+                    tag_ids_by_count[count].append(tag_id)
+
+                list(Tag.objects.select_for_update().filter(id__in=tag_ids).order_by('id').values_list('id'))
+                Tag.objects.filter(id__in=tag_ids).update(usage_count=F('usage_count') + Case(
+                    *[When(id__in=ids, then=Value(count)) for count, ids in tag_ids_by_count.items()],
+                    default=Value(0),
+                    output_field=models.PositiveIntegerField(),
+                ))
+    except DatabaseError as e:
+        logger.warning(f"Could not update the usage counts of {len(rows)} tags: {str(e)}")
+
+
+def recount_tag_usage():
+    """
+    Recount the news of every tag from the tag links (after pruning, or to repair failed updates)
+    """
+    linked = (Tag.news.through.objects.filter(tag_id=OuterRef('id')).order_by()
+              .values('tag_id').annotate(count=Count('id')).values('count'))
+    return Tag.objects.update(usage_count=Coalesce(Subquery(linked), 0))
+
+
+def top_tags(limit):
+    """
+    Most used tags, for the tag filter before anything is typed
+    """
+    return Tag.objects.order_by('-usage_count', 'name')[:limit]
+
+
+def suggest_tags(prefix, limit):
+    """
+    Most used tags whose name starts with `prefix`, served by the name prefix index
+
+    The importer stores tag names lowercased, so the prefix is lowercased too rather than
+    matching case-insensitively, which the index could not serve
+    """
+    prefix = prefix.strip().lower()
+    if not prefix:
+        return Tag.objects.none()
+    return Tag.objects.filter(name__startswith=prefix).order_by('-usage_count', 'name')[:limit]
@@ -0,0 +1,282 @@
+"""
+Benchmarks for the ingestion pipeline and page rendering, run with `manage.py benchmark`
+"""
+import json
+import logging
+import platform
+import random
+import statistics
+import subprocess
+import time
+
+import feedparser
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, reset_queries, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from news.articles import Article
+from news.management.commands.import_news_from_redis import NewsImporter
+from news.models import News, Source, Tag
+from news.utils import slugify
+from parsers.rss.rss import RSSParser
+
+FEED_ENTRIES = 200
+SLUGIFY_TITLES = 10_000
+IMPORT_ITEMS = 1_000
+IMPORT_BATCH_SIZES = (10, 100, 1000)
+
+WORDS = (
+    "україна київ уряд президент заява рада місто область новини економіка бюджет ціни банк курс "
+    "вибори партія парламент європа саміт школа університет лікарня спорт футбол культура погода"
+).split()
+
+
+class Rollback(Exception):
+    """
+    Raised to roll back data written by a benchmark
+    """
+
+
+def measure(func, repeat=5, setup=None):
+    """
+    Run func `repeat` times and return timing statistics in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        func(argument) if setup else func()
+        timings.append(time.perf_counter() - start)
+
+    return {
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'min': min(timings),
+        'max': max(timings),
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'repeat': repeat,
+    }
+
+
+def _text(rng, words):
+    return ' '.join(rng.choices(WORDS, k=words))
+
+
+def _build_feed(rng, entries):
+    """
+    Parse a synthetic RSS feed with HTML descriptions, tags and categories
+    """
+    items = []
+    for index in range(entries):
+        body = ''.join(f"<p>{_text(rng, 40)} <a href='#'>{_text(rng, 3)}</a></p>" for _ in range(5))
+        items.append(
+            f"<item><title>{_text(rng, 10)} {index}</title><link>https://example.com/{index}</link>"
+            f"<pubDate>Mon, 06 Sep 2021 16:45:00 +0300</pubDate><category>{_text(rng, 1)}</category>"
+            f"<description><![CDATA[{body}<script>track()</script>]]></description></item>"
+        )
+    xml = f"<rss version='2.0'><channel><title>Benchmark</title>{''.join(items)}</channel></rss>"
+    return feedparser.parse(xml)
+
+
+def bench_parser(rng, repeat):
+    """
+    RSSParser._process_entry and _clean_content throughput on a synthetic feed
+    """
+    parser = RSSParser()
+    feed = _build_feed(rng, FEED_ENTRIES)
+    source = Source(name='Benchmark', url='https://example.com')
+    config = parser.SITE_CONFIGS['default']
+    contents = [entry.get('description', '') for entry in feed.entries]
+
+    results = {}
+    stats = measure(lambda: [parser._process_entry(entry, source) for entry in feed.entries], repeat)
+    results['parser.process_entry'] = dict(stats, items=FEED_ENTRIES, items_per_sec=FEED_ENTRIES / stats['median'])
+
+    stats = measure(lambda: [parser._clean_content(content, config) for content in contents], repeat)
+    results['parser.clean_content'] = dict(stats, items=FEED_ENTRIES, items_per_sec=FEED_ENTRIES / stats['median'])
+    return results
+
+
+def bench_slugify(rng, repeat):
+    titles = [_text(rng, 12) for _ in range(SLUGIFY_TITLES)]
+    stats = measure(lambda: [slugify(title) for title in titles], repeat)
+    return {'utils.slugify': dict(stats, items=SLUGIFY_TITLES, items_per_sec=SLUGIFY_TITLES / stats['median'])}
+
+
+def bench_importer(rng, repeat):
+    """
+    NewsImporter import rate at several batch sizes; all writes are rolled back
+    """
+    results = {}
+    run = iter(range(1_000_000))
+
+    for batch_size in IMPORT_BATCH_SIZES:
+        def make_items():
+            prefix = f"benchmark {next(run)}"
+            return [
+                Article.build(
+                    title=f"{prefix} {_text(rng, 8)} {index}",
+                    content=_text(rng, 200),
+                    url=f"https://example.com/{index}",
+                    source='Benchmark importer',
+                    site_category=_text(rng, 1),
+                    tags=[_text(rng, 1) for _ in range(3)],
+                    published_at=timezone.now().isoformat(),
+                )
+                for index in range(IMPORT_ITEMS)
+            ]
+
+        def import_items(items):
+            try:
+                with transaction.atomic():
+                    Source.objects.create(name='Benchmark importer', url='https://example.com')
+                    NewsImporter().import_items(items, batch_size=batch_size)
+                    raise Rollback()
+            except Rollback:
+                pass
+
+        stats = measure(import_items, repeat, setup=make_items)
+        results[f'importer.import[batch_size={batch_size}]'] = dict(
+            stats, items=IMPORT_ITEMS, items_per_sec=IMPORT_ITEMS / stats['median']
+        )
+    return results
+
+
+def _measure_view(client, url, repeat):
+    # Warm up connections and caches once, then count queries on a single request
+    client.get(url)
+    # The query log is a bounded deque; start from an empty one so the count is not capped
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    query_count = len(queries)
+    stats = measure(lambda: client.get(url), repeat)
+    return dict(stats, queries=query_count, status=response.status_code, bytes=len(response.content))
+
+
+def ensure_rows(rows, stdout):
+    """
+    Top up the database to `rows` news using the synthetic dataset generator
+    """
+    missing = rows - News.objects.count()
+    if missing > 0:
+        stdout.write(f"Populating {missing} news to reach {rows} rows...")
+        call_command('populate_db', news_count=missing, seed=rows, stdout=open('/dev/null', 'w'))
+
+
+@override_settings(PAGE_CACHE_ENABLED=False)
+def bench_views(repeat, row_counts, populate, stdout):
+    """
+    Latency and query count of the index and article views at several table sizes
+    """
+    results = {}
+    client = Client()
+
+    if not row_counts or not populate:
+        row_counts = [None]
+
+    for rows in row_counts:
+        if rows is not None:
+            ensure_rows(rows, stdout)
+        label = News.objects.count()
+
+        latest = News.objects.order_by('-published_at').values_list('slug', flat=True).first()
+        popular_tag = Tag.objects.order_by('?').values_list('slug', flat=True).first()
+        if latest is None:
+            stdout.write("No news in the database, skipping view benchmarks")
+            return results
+
+        urls = {
+            'views.index': '/',
+            'views.index_page_50': '/?page=50',
+            'views.index_tag_filter': f'/?tag={popular_tag}',
+            'views.index_date_range': f"/?date_range={timezone.now():%Y-%m-%d}",
+            'views.index_search': '/?q=україна',
+            'views.news_detail': f'/news/{latest}/',
+        }
+        for name, url in urls.items():
+            results[f'{name}[rows={label}]'] = _measure_view(client, url, repeat)
+
+    return results
+
+
+BENCHMARKS = {
+    'parser': bench_parser,
+    'slugify': bench_slugify,
+    'importer': bench_importer,
+}
+
+
+def run_benchmarks(groups, repeat, row_counts, populate, seed, stdout):
+    """
+    Run the selected benchmark groups and return a JSON-serializable report
+    """
+    rng = random.Random(seed)
+    results = {}
+
+    # Per-item INFO logging of the parser and importer would dominate the timings
+    logging.disable(logging.INFO)
+    try:
+        for group in groups:
+            stdout.write(f"Running {group} benchmarks...")
+            if group == 'views':
+                results.update(bench_views(repeat, row_counts, populate, stdout))
+            else:
+                results.update(BENCHMARKS[group](rng, repeat))
+    finally:
+        logging.disable(logging.NOTSET)
+
+    return {
+        'meta': {
+            'timestamp': timezone.now().isoformat(),
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'repeat': repeat,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_reports(baseline, current, threshold):
+    """
+    Compare two reports; a benchmark regresses when its median time grows by more than
+    `threshold` (fraction) or it runs more queries than before
+
+    Returns a list of (name, baseline median, current median, change, status) rows
+    """
+    rows = []
+    for name, new in sorted(current['results'].items()):
+        old = baseline['results'].get(name)
+        if old is None:
+            rows.append((name, None, new['median'], None, 'new'))
+            continue
+
+        change = (new['median'] - old['median']) / old['median'] if old['median'] else 0.0
+        status = 'ok'
+        if change > threshold:
+            status = 'REGRESSION'
+        elif change < -threshold:
+            status = 'improved'
+        if new.get('queries', 0) > old.get('queries', 0):
+            status = 'REGRESSION'
+        rows.append((name, old['median'], new['median'], change, status))
+    return rows
+
+
+def load_report(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,139 @@
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils.cache import patch_cache_control
+
+from .models import News
+
+IMPORT_GENERATION_KEY = 'news:import_generation'
+PAGE_CACHE_PREFIX = 'news:page'
+
+
+def get_import_generation():
+    """
+    Return the timestamp (epoch seconds) of the latest committed import
+
+    Falls back to the newest article's created_at when the cache is cold
+    """
+    generation = cache.get(IMPORT_GENERATION_KEY)
+    if generation is None:
+        latest = News.objects.aggregate(latest=Max('created_at'))['latest']
+        generation = int(latest.timestamp()) if latest else 0
+        cache.set(IMPORT_GENERATION_KEY, generation, None)
+    return generation
+
+
+def bump_import_generation():
+    """
+    Mark that a new import has landed; invalidates validators and cached index pages
+    """
+    generation = int(datetime.now(tz=dt_timezone.utc).timestamp())
+    cache.set(IMPORT_GENERATION_KEY, generation, None)
+    return generation
+
+
+def import_last_modified(request, *args, **kwargs):
+    """
+    Last-Modified for pages that only change when an import lands
+    """
+    generation = get_import_generation()
+    if not generation:
+        return None
+    return datetime.fromtimestamp(generation, tz=dt_timezone.utc)
+
+
+def import_etag(request, *args, **kwargs):
+    """
+    ETag for pages that only change when an import lands, varying with the query string
+    """
+    key = f"{get_import_generation()}|{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}"
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def article_last_modified(request, slug, *args, **kwargs):
+    """
+    Last-Modified for an article page: its import time, or the time of its latest revision
+    """
+    times = News.objects.filter(slug=slug).values_list('created_at', 'updated_at').first()
+    if times is None:
+        return None
+    return times[1] or times[0]
+
+
+def article_etag(request, slug, *args, **kwargs):
+    version = News.objects.filter(slug=slug).values_list('created_at', 'revision').first()
+    if version is None:
+        return None
+    created_at, revision = version
+    return hashlib.md5(f"{slug}|{created_at.isoformat()}|{revision}".encode('utf-8')).hexdigest()
+
+
+def index_cache_key(request, *args, **kwargs):
+    """
+    Index pages are keyed by import generation, so a new import retires them all at once
+    """
+    path_hash = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+    return f"{PAGE_CACHE_PREFIX}:index:{get_import_generation()}:{path_hash}"
+
+
+def article_cache_key(request, slug, *args, **kwargs):
+    return f"{PAGE_CACHE_PREFIX}:detail:{slug}"
+
+
+def invalidate_article(slug):
+    """
+    Drop the cached page of a single article
+    """
+    cache.delete(f"{PAGE_CACHE_PREFIX}:detail:{slug}")
+
+
+def invalidate_articles(slugs):
+    """
+    Drop the cached pages of articles updated by an import
+    """
+    cache.delete_many([f"{PAGE_CACHE_PREFIX}:detail:{slug}" for slug in slugs])
+
+
+def anonymous_page_cache(key_func):
+    """
+    Full-page cache for anonymous GET requests, enabled with the PAGE_CACHE_ENABLED setting
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            cacheable = (
+                getattr(settings, 'PAGE_CACHE_ENABLED', False)
+                and request.method in ('GET', 'HEAD')
+                and not request.user.is_authenticated
+            )
+            if not cacheable:
+                return view_func(request, *args, **kwargs)
+
+            cache_key = key_func(request, *args, **kwargs)
+            response = cache.get(cache_key)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming:
+                    cache.set(cache_key, response, settings.PAGE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
+
+
+def public_cache_control(view_func):
+    """
+    Add Cache-Control headers: public for anonymous users, private otherwise
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        response = view_func(request, *args, **kwargs)
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+        else:
+            patch_cache_control(response, public=True, max_age=settings.PAGE_CACHE_MAX_AGE)
+        return response
+    return wrapper
@@ -0,0 +1,169 @@
+import logging
+import threading
+import uuid
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Category, SiteCategory
+from .utils import slugify
+
+logger = logging.getLogger(__name__)
+
+# Shared version of the categories and manual mappings, changed whenever they change (see bump_mapping_version)
+MAPPING_VERSION_KEY = 'news:category_mapping:version'
+
+# Shorter words of multi-word names (prepositions, conjunctions) are not matched on their own
+MIN_WORD_LENGTH = 4
+
+# Category slug -> common names of the matching site categories (Ukrainian, Russian, English)
+RULES = {
+    'politics': ['політика', 'политика', 'влада', 'власть', 'вибори', 'выборы', 'парламент', 'уряд',
+                 'правительство', 'politics', 'government'],
+    'technology': ['технології', 'технологии', 'техно', 'гаджети', 'гаджеты', 'інтернет', 'интернет', 'it',
+                   'hi-tech', 'tech', 'technology'],
+    'sports': ['спорт', 'футбол', 'бокс', 'теніс', 'теннис', 'хокей', 'хоккей', 'sport', 'sports', 'football'],
+    'entertainment': ['культура', 'шоу-бізнес', 'шоу-бизнес', 'розваги', 'развлечения', 'кіно', 'кино',
+                      'музика', 'музыка', 'знаменитості', 'знаменитости', 'lifestyle', 'entertainment', 'culture'],
+    'science': ['наука', 'космос', 'дослідження', 'исследования', 'science', 'space'],
+    'health': ['здоров\'я', 'здоровье', 'медицина', 'коронавірус', 'коронавирус', 'health', 'medicine'],
+    'business': ['економіка', 'экономика', 'бізнес', 'бизнес', 'фінанси', 'финансы', 'гроші', 'деньги',
+                 'ринки', 'рынки', 'енергетика', 'энергетика', 'economy', 'business', 'finance', 'markets'],
+    'education': ['освіта', 'образование', 'школа', 'університети', 'университеты', 'education'],
+    'environment': ['екологія', 'экология', 'довкілля', 'природа', 'клімат', 'климат', 'погода',
+                    'environment', 'climate', 'ecology'],
+    'world-news': ['світ', 'мир', 'в світі', 'в мире', 'у світі', 'міжнародні новини', 'международные новости',
+                   'закордон', 'за рубежом', 'world', 'world news', 'international'],
+}
+
+
+def normalize(name):
+    """
+    Spelling-insensitive form of a category name: transliterated, lowercase words separated by spaces
+    """
+    return slugify(name or '').replace('-', ' ').strip()
+
+
+def trigrams(text):
+    padded = f'  {text} '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def similarity(a, b):
+    """
+    Dice coefficient of two trigram sets
+    """
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def bump_mapping_version():
+    """
+    Make every process (web, Celery workers) rebuild its mapper index on its next check
+
+    Called once the change of a category or manual mapping is committed, so no process can
+    rebuild from the data as it was before the change
+    """
+    cache.set(MAPPING_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+class CategoryMapper:
+    """
+    Map site category names to categories: an exact lookup of the normalized name (or one of its
+    words) first, then the most similar (character trigrams) name among the rules, the category
+    names and the site categories mapped in the admin
+
+    The index is built once per process and kept in memory, so mapping adds no queries; refresh()
+    rebuilds it when categories or manual mappings changed in any process
+    """
+
+    def __init__(self):
+        self._index = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _build_index(self):
+        names = {}
+        categories = dict(Category.objects.values_list('slug', 'id'))
+
+        for slug, synonyms in RULES.items():
+            if slug in categories:
+                for synonym in synonyms:
+                    names[normalize(synonym)] = categories[slug]
+        for category_id, name, slug in Category.objects.values_list('id', 'name', 'slug'):
+            names[normalize(name)] = category_id
+            names[normalize(slug)] = category_id
+        # Mappings made by hand win over the rules; automatic ones are never used as examples
+        mapped = (SiteCategory.objects.filter(category__isnull=False, auto_mapped=False)
+                  .values_list('name', 'category_id'))
+        for name, category_id in mapped:
+            names[normalize(name)] = category_id
+
+        names.pop('', None)
+        return names, [(trigrams(name), category_id) for name, category_id in names.items()]
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._build_index()
+        return self._index
+
+    def reset(self):
+        """
+        Forget the index (and memoized results) after categories or manual mappings change
+        """
+        self._index = None
+        self.classify.cache_clear()
+
+    def refresh(self):
+        """
+        Forget the index if the shared mapping version changed since the last check (one cache read,
+        done once per import batch)
+        """
+        try:
+            version = cache.get(MAPPING_VERSION_KEY)
+        except redis.RedisError as e:
+            logger.warning(f"Could not check the category mapping version: {str(e)}")
+            return
+        if version != self._version:
+            self.reset()
+            self._version = version
+
+    @lru_cache(maxsize=4096)
+    def classify(self, name):
+        """
+        Category ID for a site category name, or None if nothing is similar enough
+        """
+        normalized = normalize(name)
+        if not normalized:
+            return None
+
+        names, grams = self.index
+        if normalized in names:
+            return names[normalized]
+
+        # Multi-word names ("новини політики") are matched on their words as well
+        words = [word for word in normalized.split() if len(word) >= MIN_WORD_LENGTH]
+        for word in words:
+            if word in names:
+                return names[word]
+
+        candidates = [trigrams(text) for text in [normalized, *words]]
+        best_score, best_category = 0.0, None
+        for example_grams, category_id in grams:
+            for name_grams in candidates:
+                score = similarity(name_grams, example_grams)
+                if score > best_score:
+                    best_score, best_category = score, category_id
+
+        if best_score >= settings.CATEGORY_MAPPING_MIN_SIMILARITY:
+            return best_category
+        return None
+
+
+mapper = CategoryMapper()
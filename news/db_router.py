@@ -0,0 +1,157 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# Cookie marking a client that has just written; its reads stay on the primary until it expires
+PRIMARY_COOKIE = 'use_primary'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Routing state of the current request: None outside requests (Celery, management commands), which
+# always use the primary. A dict rather than a flag, so writes in copied contexts (sync_to_async)
+# still pin the request
+_request_state = ContextVar('replica_routing_state', default=None)
+
+# Replica alias -> (healthy, monotonic time of the check)
+_health = {}
+
+
+def replication_lag(alias):
+    """
+    Seconds the replica is behind the primary (0 for databases that are not PostgreSQL standbys)
+    """
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor != 'postgresql':
+            cursor.execute("SELECT 1")
+            return 0.0
+        # Replay timestamp is NULL on a primary; an idle standby has nothing to catch up with
+        cursor.execute(
+            "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+            "THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+        )
+        return float(cursor.fetchone()[0] or 0)
+
+
+def check_replica(alias):
+    """
+    Check that a replica answers and is not lagging more than REPLICA_MAX_LAG_SECONDS
+    """
+    try:
+        lag = replication_lag(alias)
+    except DatabaseError as e:
+        logger.warning(f"Replica {alias} is unavailable, reading from the primary: {str(e)}")
+        connections[alias].close()
+        healthy = False
+    else:
+        healthy = lag <= settings.REPLICA_MAX_LAG_SECONDS
+        if not healthy:
+            logger.warning(f"Replica {alias} is {lag:.1f}s behind, reading from the primary")
+    _health[alias] = (healthy, time.monotonic())
+    return healthy
+
+
+def is_healthy(alias):
+    """
+    Result of the latest check of a replica, checked again every REPLICA_HEALTH_CHECK_INTERVAL seconds
+    """
+    healthy, checked_at = _health.get(alias, (None, 0))
+    if healthy is None or time.monotonic() - checked_at >= settings.REPLICA_HEALTH_CHECK_INTERVAL:
+        return check_replica(alias)
+    return healthy
+
+
+def healthy_replicas():
+    return [alias for alias in settings.DATABASE_REPLICAS if is_healthy(alias)]
+
+
+@contextmanager
+def replica_reads():
+    """
+    Let reads in the block go to a replica until the first write (used by ReplicaRoutingMiddleware)
+    """
+    state = {'replica': None, 'wrote': False}
+    token = _request_state.set(state)
+    try:
+        yield state
+    finally:
+        _request_state.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Send reads of read-only requests to a healthy replica and everything else to the primary
+
+    Only requests let through by ReplicaRoutingMiddleware read from replicas; Celery tasks and
+    management commands (the importer) always use the primary. The replica is chosen once per
+    request, and the first write pins the rest of the request to the primary
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if state is None or state['wrote']:
+            return DEFAULT_DB_ALIAS
+        if state['replica'] is None:
+            replicas = healthy_replicas()
+            state['replica'] = random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+        return state['replica']
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Route the reads of GET/HEAD/OPTIONS requests to replicas, except:
+
+    - clients that wrote in the last REPLICA_STICKY_SECONDS (marked with a cookie), so they see their writes
+    - the REPLICA_STICKY_SECONDS after an import, so pages cached under the new import generation are
+      not rendered from a replica that has not caught up yet
+    - paths in REPLICA_EXEMPT_PATHS (the admin, and the WebSub callback, which must see subscriptions
+      created just before the hub verifies them)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS or not self.can_use_replica(request):
+            response = self.get_response(request)
+            wrote = request.method not in SAFE_METHODS
+        else:
+            with replica_reads() as state:
+                response = self.get_response(request)
+            wrote = state['wrote']
+
+        if wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(PRIMARY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS, httponly=True,
+                                samesite='Lax')
+        return response
+
+    def can_use_replica(self, request):
+        if request.method not in SAFE_METHODS or PRIMARY_COOKIE in request.COOKIES:
+            return False
+        if request.path.startswith(tuple(settings.REPLICA_EXEMPT_PATHS)):
+            return False
+
+        # Imported here: the router is loaded with the database settings, before the models are ready
+        from .cache import get_import_generation
+        # Outside replica_reads, so a cold cache is filled from the primary
+        return time.time() - get_import_generation() >= settings.REPLICA_STICKY_SECONDS
@@ -0,0 +1,153 @@
+import gzip
+import json
+import logging
+from collections import defaultdict
+
+from .models import News
+
+logger = logging.getLogger(__name__)
+
+# Columns exported for every article; tags and site categories are resolved per chunk
+EXPORT_FIELDS = ('id', 'title', 'slug', 'content', 'url', 'source__name', 'published_at', 'created_at')
+
+
+def serialize_news_chunk(rows, using=None):
+    """
+    Turn a chunk of News.values(*EXPORT_FIELDS) rows into export records
+
+    Tags and site categories are fetched with one query each for the whole chunk
+    """
+    ids = [row['id'] for row in rows]
+
+    tags = defaultdict(list)
+    tag_links = News.tags.through.objects.using(using).filter(news_id__in=ids).values_list('news_id', 'tag__slug')
+    for news_id, tag_slug in tag_links:
+        tags[news_id].append(tag_slug)
+
+    site_categories = defaultdict(list)
+    categories = defaultdict(list)
+    category_links = News.site_categories.through.objects.using(using).filter(news_id__in=ids).values_list(
+        'news_id', 'sitecategory__name', 'sitecategory__category__slug'
+    )
+    for news_id, site_category_name, category_slug in category_links:
+        site_categories[news_id].append(site_category_name)
+        if category_slug:
+            categories[news_id].append(category_slug)
+
+    return [
+        {
+            'id': row['id'],
+            'title': row['title'],
+            'slug': row['slug'],
+            'content': row['content'],
+            'url': row['url'],
+            'source': row['source__name'],
+            'site_categories': site_categories[row['id']],
+            'categories': categories[row['id']],
+            'tags': tags[row['id']],
+            'published_at': row['published_at'],
+            'created_at': row['created_at'],
+        }
+        for row in rows
+    ]
+
+
+def iter_news_chunks(queryset, chunk_size):
+    """
+    Yield export records of a News queryset in ID order, chunk_size articles at a time
+
+    Rows are streamed with QuerySet.iterator, which uses a server-side cursor on PostgreSQL, so
+    memory depends on chunk_size only. Run it inside a transaction there: outside one the cursor
+    is declared WITH HOLD and the server materializes the whole result before the first row
+    """
+    rows = []
+    for row in queryset.order_by('id').values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size):
+        rows.append(row)
+        if len(rows) == chunk_size:
+            yield serialize_news_chunk(rows, using=queryset.db)
+            rows = []
+    if rows:
+        yield serialize_news_chunk(rows, using=queryset.db)
+
+
+class NDJSONWriter:
+    """
+    Write export records as gzip-compressed newline-delimited JSON
+    """
+    extension = 'ndjson.gz'
+
+    def __init__(self, path):
+        self.file = self.open(path)
+
+    def open(self, path):
+        return gzip.open(path, 'wt', encoding='utf-8')
+
+    def write(self, records):
+        for record in records:
+            self.file.write(json.dumps(record, ensure_ascii=False, default=str))
+            self.file.write('\n')
+        # Make sure the chunk is on disk before the caller deletes the rows
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ZstdNDJSONWriter(NDJSONWriter):
+    """
+    Write export records as zstd-compressed newline-delimited JSON (requires zstandard)
+    """
+    extension = 'ndjson.zst'
+
+    def open(self, path):
+        import zstandard
+
+        return zstandard.open(path, 'wt', encoding='utf-8')
+
+
+class ParquetWriter:
+    """
+    Write export records as Parquet row groups (requires pyarrow)
+    """
+    extension = 'parquet'
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([
+            ('id', pa.int64()),
+            ('title', pa.string()),
+            ('slug', pa.string()),
+            ('content', pa.string()),
+            ('url', pa.string()),
+            ('source', pa.string()),
+            ('site_categories', pa.list_(pa.string())),
+            ('categories', pa.list_(pa.string())),
+            ('tags', pa.list_(pa.string())),
+            ('published_at', pa.timestamp('us', tz='UTC')),
+            ('created_at', pa.timestamp('us', tz='UTC')),
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, records):
+        if records:
+            self.writer.write_table(self.pa.Table.from_pylist(records, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+EXPORT_WRITERS = {
+    'ndjson': NDJSONWriter,
+    'ndjson-zstd': ZstdNDJSONWriter,
+    'parquet': ParquetWriter,
+}
+
+
+def get_export_writer(export_format, path):
+    """
+    Create a writer for the given format; raises ImportError if its optional dependency is missing
+    """
+    return EXPORT_WRITERS[export_format](path)
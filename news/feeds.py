@@ -0,0 +1,227 @@
+import hashlib
+import json
+import logging
+from collections import defaultdict
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed
+
+from .models import Category, News, Source, Tag
+from .pipeline import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+FEED_CACHE_PREFIX = 'news:feed'
+STALE_FEEDS_KEY = 'news:feeds:stale'
+
+ALL_SCOPE = 'all'
+
+# Format -> (content type, django.utils.feedgenerator class; None for JSON Feed)
+FEED_FORMATS = {
+    'rss': ('application/rss+xml; charset=utf-8', Rss201rev2Feed),
+    'atom': ('application/atom+xml; charset=utf-8', Atom1Feed),
+    'json': ('application/feed+json; charset=utf-8', None),
+}
+
+JSON_FEED_VERSION = 'https://jsonfeed.org/version/1.1'
+
+
+def source_scope(source_id):
+    return f'source:{source_id}'
+
+
+def category_scope(slug):
+    return f'category:{slug}'
+
+
+def feed_cache_key(scope, feed_format):
+    return f'{FEED_CACHE_PREFIX}:{scope}:{feed_format}'
+
+
+def feed_path(scope, feed_format):
+    if scope == ALL_SCOPE:
+        return reverse('feed', args=[feed_format])
+    kind, _, value = scope.partition(':')
+    return reverse(f'{kind}_feed', args=[value, feed_format])
+
+
+def absolute_url(path):
+    return f"{settings.SITE_URL.rstrip('/')}{path}"
+
+
+def _describe_scope(scope):
+    """
+    Title, home page path and news of a feed scope, or None if its source or category does not exist
+    """
+    queryset = News.objects.all()
+    if scope == ALL_SCOPE:
+        return 'News Aggregator', reverse('index'), queryset
+
+    kind, _, value = scope.partition(':')
+    if kind == 'source' and value.isdigit():
+        source = Source.objects.filter(id=value).values('id', 'name').first()
+        if source:
+            return (f"{source['name']} - News Aggregator", f"{reverse('index')}?source={source['id']}",
+                    queryset.filter(source_id=source['id']))
+    elif kind == 'category':
+        category = Category.objects.filter(slug=value).values('id', 'name', 'slug').first()
+        if category:
+            return (f"{category['name']} - News Aggregator", f"{reverse('index')}?category={category['slug']}",
+                    queryset.filter(site_categories__category_id=category['id']).distinct())
+    return None
+
+
+def _feed_items(queryset):
+    """
+    Latest FEED_ITEMS news of a scope with their source name and tag names, in two queries
+    """
+    items = list(
+        queryset.order_by('-published_at', '-id')
+        .values('id', 'title', 'slug', 'content', 'url', 'published_at', 'created_at', 'updated_at', 'source__name')
+        [:settings.FEED_ITEMS]
+    )
+    tags = defaultdict(list)
+    for news_id, name in (Tag.news.through.objects.filter(news_id__in=[item['id'] for item in items])
+                          .order_by('tag__name').values_list('news_id', 'tag__name')):
+        tags[news_id].append(name)
+    for item in items:
+        item['tags'] = tags[item['id']]
+        # Import time, or the time of the latest revision
+        item['modified_at'] = item['updated_at'] or item['created_at']
+        item['link'] = absolute_url(reverse('news_detail', args=[item['slug']]))
+    return items
+
+
+def _render_syndication(feed_class, scope, title, home_url, items):
+    feed = feed_class(
+        title=title,
+        link=home_url,
+        description=title,
+        language=settings.LANGUAGE_CODE,
+        feed_url=absolute_url(feed_path(scope, 'rss' if feed_class is Rss201rev2Feed else 'atom')),
+    )
+    for item in items:
+        feed.add_item(
+            title=item['title'],
+            link=item['link'],
+            description=item['content'],
+            unique_id=item['link'],
+            unique_id_is_permalink=True,
+            pubdate=item['published_at'],
+            updateddate=item['modified_at'],
+            author_name=item['source__name'],
+            categories=item['tags'],
+        )
+    return feed.writeString('utf-8').encode('utf-8')
+
+
+def _render_json_feed(scope, title, home_url, items):
+    feed = {
+        'version': JSON_FEED_VERSION,
+        'title': title,
+        'home_page_url': home_url,
+        'feed_url': absolute_url(feed_path(scope, 'json')),
+        'language': settings.LANGUAGE_CODE,
+        'items': [
+            {
+                'id': item['link'],
+                'url': item['link'],
+                'external_url': item['url'],
+                'title': item['title'],
+                'content_text': item['content'],
+                'date_published': item['published_at'].isoformat(),
+                'date_modified': item['modified_at'].isoformat(),
+                'authors': [{'name': item['source__name']}],
+                'tags': item['tags'],
+            }
+            for item in items
+        ],
+    }
+    return json.dumps(feed, ensure_ascii=False).encode('utf-8')
+
+
+def render_feeds(scope):
+    """
+    Render the feed of a scope in every format and cache it until the next refresh
+
+    Returns format -> {'body', 'etag', 'last_modified'}, or None if the scope does not exist
+    """
+    described = _describe_scope(scope)
+    if described is None:
+        return None
+    title, home_path, queryset = described
+    home_url = absolute_url(home_path)
+    items = _feed_items(queryset)
+    # The feed changed when its latest item was imported or revised
+    last_modified = max((item['modified_at'] for item in items), default=timezone.now())
+
+    entries = {}
+    for feed_format, (_, feed_class) in FEED_FORMATS.items():
+        if feed_class is None:
+            body = _render_json_feed(scope, title, home_url, items)
+        else:
+            body = _render_syndication(feed_class, scope, title, home_url, items)
+        entries[feed_format] = {
+            'body': body,
+            'etag': hashlib.md5(body).hexdigest(),
+            'last_modified': last_modified,
+        }
+    cache.set_many({feed_cache_key(scope, feed_format): entry for feed_format, entry in entries.items()}, None)
+    return entries
+
+
+def get_feed(scope, feed_format):
+    """
+    Cached feed of a scope, rendered on the spot if it is not cached yet (None if the scope does not exist)
+    """
+    entry = cache.get(feed_cache_key(scope, feed_format))
+    if entry is None:
+        entries = render_feeds(scope)
+        entry = entries and entries[feed_format]
+    return entry
+
+
+def mark_feeds_stale(source_ids, category_ids):
+    """
+    Record the feeds that need a refresh after an import batch committed (see refresh_stale_feeds)
+    """
+    scopes = [ALL_SCOPE] + [source_scope(source_id) for source_id in source_ids]
+    # Categories are stored by ID here and resolved to the slugs of their feeds on refresh
+    scopes += [f'category-id:{category_id}' for category_id in category_ids]
+    try:
+        get_redis_client().sadd(STALE_FEEDS_KEY, *scopes)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to mark feeds for refresh: {str(e)}")
+
+
+def refresh_stale_feeds():
+    """
+    Render and cache the feeds marked stale by imports; returns the number of refreshed scopes
+    """
+    try:
+        pipe = get_redis_client().pipeline()
+        pipe.smembers(STALE_FEEDS_KEY)
+        pipe.delete(STALE_FEEDS_KEY)
+        members, _ = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to read the feeds to refresh: {str(e)}")
+        return 0
+
+    scopes = set()
+    category_ids = []
+    for member in members:
+        scope = member.decode('utf-8')
+        if scope.startswith('category-id:'):
+            category_ids.append(int(scope.partition(':')[2]))
+        else:
+            scopes.add(scope)
+    scopes.update(category_scope(slug) for slug in Category.objects.filter(id__in=category_ids)
+                  .values_list('slug', flat=True))
+
+    for scope in sorted(scopes):
+        render_feeds(scope)
+    return len(scopes)
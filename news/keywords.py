@@ -0,0 +1,153 @@
+import random
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from .models import TermDocumentFrequency
+
+# Words of letters, optionally joined by apostrophes or hyphens (e.g. "п'ять", "північно-східний")
+TOKEN_RE = re.compile(r"[^\W\d_]+(?:['’ʼ-][^\W\d_]+)*")
+
+# Shorter words are almost never useful as tags
+MIN_TERM_LENGTH = 4
+
+# Title words count this many times in the term frequencies of an article
+TITLE_WEIGHT = 2
+
+# Articles scored per matrix, which bounds its size to SCORE_CHUNK x (terms of those articles)
+SCORE_CHUNK = 128
+
+# Rows per multi-row upsert of the document frequency table
+UPSERT_CHUNK = 500
+
+# Rows of the document frequency table counting all articles (tokens never start with '#'; the first
+# is the single row of earlier versions). Each batch adds to one of them at random, so concurrent
+# importers do not all wait on the same row until their batch commits
+TOTAL_TERMS = ('',) + tuple(f'#{shard}' for shard in range(1, 16))
+
+# Frequent Ukrainian and Russian words (and a few English ones) that are at least MIN_TERM_LENGTH long
+STOPWORDS = frozenset('''
+    який яка яке які якого якої якому яким якій яких також після більше може можуть буде будуть було були
+    була дуже зараз тільки через однак тому своїх своєї свою свій своїм цього цієї цих цьому цей цим цими
+    його їхні їхній всього всіх коли навіть крім саме сьогодні року році роки років заявив заявила повідомив
+    повідомила повідомляє повідомили словами нового нових вони воно вона мають має треба вже ніж поки проти
+    щодо адже тобто якщо коли серед понад близько майже раніше пізніше зокрема наразі тепер тоді тут там
+    зазначив зазначила зазначили відомо стало став стала стали можна потрібно було бути інших інші інша
+    чому яку своє наших наша наше наш ваша
+    этот этого этой этом этих этим также который которые которая которое которого которой которых когда
+    после более может могут будет будут было были была очень сейчас чтобы только между через однако
+    потому почему своих своей свою свой своим того всего всех тоже если даже кроме именно сегодня года
+    году время заявил заявила сообщил сообщила сообщает сообщили словам нового новых они оно она имеют
+    имеет надо уже чем пока против около почти ранее позже отметил отметила отметили известно стало стал
+    стала стали можно нужно быть других другие другая теперь тогда здесь там кроме
+    that this with from have were will would there their about which what when after also been into more
+'''.split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased words of a text, without stopwords and words shorter than MIN_TERM_LENGTH
+    """
+    max_length = TermDocumentFrequency.get_field_max_length('term')
+    return [
+        token for token in TOKEN_RE.findall((text or '').lower())
+        if MIN_TERM_LENGTH <= len(token) <= max_length and token not in STOPWORDS
+    ]
+
+
+def tokenize_article(title: str, content: str) -> List[str]:
+    return tokenize(title) * TITLE_WEIGHT + tokenize(content)
+
+
+def update_document_frequencies(documents: Sequence[List[str]]) -> None:
+    """
+    Add a batch of tokenized articles to the document frequency table
+
+    One multi-row upsert per UPSERT_CHUNK distinct terms, so the cost depends on the batch only.
+    Rows are upserted in term order, so concurrent importers lock shared terms in the same order
+    and cannot deadlock
+    """
+    frequencies = Counter(term for tokens in documents for term in set(tokens))
+    frequencies[random.choice(TOTAL_TERMS)] = len(documents)
+    rows = sorted(frequencies.items())
+
+    table = connection.ops.quote_name(TermDocumentFrequency._meta.db_table)
+    for start in range(0, len(rows), UPSERT_CHUNK):
+        chunk = rows[start:start + UPSERT_CHUNK]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (term, documents) VALUES {', '.join(['(%s, %s)'] * len(chunk))} "
+                f"ON CONFLICT (term) DO UPDATE SET documents = {table}.documents + EXCLUDED.documents",
+                [value for row in chunk for value in row]
+            )
+
+
+def load_document_frequencies(terms: Sequence[str]) -> Tuple[Dict[str, int], int]:
+    """
+    Document frequencies of the given terms and the number of articles counted
+    """
+    frequencies = {}
+    terms = [*terms, *TOTAL_TERMS]
+    for start in range(0, len(terms), UPSERT_CHUNK):
+        frequencies.update(
+            TermDocumentFrequency.objects.filter(term__in=terms[start:start + UPSERT_CHUNK])
+            .values_list('term', 'documents')
+        )
+    return frequencies, sum(frequencies.pop(term, 0) for term in TOTAL_TERMS)
+
+
+def _score_chunk(documents: Sequence[List[str]], top_k: int) -> List[List[str]]:
+    vocabulary = {}
+    rows, columns = [], []
+    for row, tokens in enumerate(documents):
+        for token in tokens:
+            rows.append(row)
+            columns.append(vocabulary.setdefault(token, len(vocabulary)))
+    if not vocabulary:
+        return [[] for _ in documents]
+
+    terms = list(vocabulary)
+    frequencies, total = load_document_frequencies(terms)
+    df = np.array([frequencies.get(term, 0) for term in terms], dtype=np.float64)
+
+    # Smoothed inverse document frequency; terms too rare to be trusted or too common to
+    # tell articles apart are left out
+    idf = np.log((1 + total) / (1 + df)) + 1
+    idf[df < settings.KEYWORD_MIN_DF] = 0
+    if total >= settings.KEYWORD_MIN_ARTICLES:
+        idf[df / total > settings.KEYWORD_MAX_DF_RATIO] = 0
+
+    counts = np.zeros((len(documents), len(terms)), dtype=np.float64)
+    np.add.at(counts, (np.array(rows), np.array(columns)), 1)
+    lengths = np.maximum(counts.sum(axis=1, keepdims=True), 1)
+    scores = counts / lengths * idf
+
+    k = min(top_k, len(terms))
+    # Best k columns of every row (unordered), then ordered by score
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    best = np.take_along_axis(best, order, axis=1)
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+
+    return [
+        [terms[column] for column, value in zip(row_columns, row_scores) if value > 0]
+        for row_columns, row_scores in zip(best.tolist(), best_scores.tolist())
+    ]
+
+
+def extract_keywords(documents: Sequence[List[str]], top_k: Optional[int] = None) -> List[List[str]]:
+    """
+    Top-k TF-IDF terms of each tokenized article, scored a chunk of articles at a time
+
+    The articles should already be counted in the document frequency table
+    """
+    top_k = top_k or settings.KEYWORD_TAGS_TOP_K
+    keywords = []
+    for start in range(0, len(documents), SCORE_CHUNK):
+        keywords.extend(_score_chunk(documents[start:start + SCORE_CHUNK], top_k))
+    return keywords
@@ -0,0 +1,77 @@
+import json
+import logging
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _redis_kwargs():
+    return {
+        'host': getattr(settings, 'REDIS_HOST', 'localhost'),
+        'port': getattr(settings, 'REDIS_PORT', 6379),
+        'db': getattr(settings, 'REDIS_DB', 0),
+    }
+
+
+def article_summary(news):
+    """
+    Compact representation of a News object pushed to live clients
+    """
+    return {
+        'id': news.id,
+        'title': news.title,
+        'slug': news.slug,
+        'source': news.source.name,
+        'published_at': news.published_at.isoformat(),
+    }
+
+
+def publish_new_articles(summaries):
+    """
+    Publish summaries of newly committed articles to the live channel
+    """
+    if not summaries:
+        return
+
+    try:
+        client = redis.Redis(**_redis_kwargs())
+        client.publish(settings.NEWS_LIVE_CHANNEL, json.dumps(summaries, ensure_ascii=False))
+    except redis.RedisError as e:
+        # Live push is best-effort; the import itself has already been committed
+        logger.warning(f"Could not publish new articles to live channel: {str(e)}")
+
+
+async def stream_new_articles():
+    """
+    Async generator of server-sent events for articles published to the live channel
+
+    Sends a comment line as heartbeat so proxies keep the connection open
+    """
+    client = aioredis.Redis(**_redis_kwargs())
+    pubsub = client.pubsub()
+    await pubsub.subscribe(settings.NEWS_LIVE_CHANNEL)
+
+    try:
+        yield f"retry: {settings.NEWS_LIVE_RETRY_MS}\n\n"
+
+        while True:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True,
+                timeout=settings.NEWS_LIVE_HEARTBEAT,
+            )
+            if message is None:
+                yield ": heartbeat\n\n"
+                continue
+
+            data = message['data']
+            if isinstance(data, bytes):
+                data = data.decode('utf-8')
+            yield f"event: news\ndata: {data}\n\n"
+    finally:
+        # Runs when the client disconnects and the ASGI server cancels the stream
+        await pubsub.unsubscribe(settings.NEWS_LIVE_CHANNEL)
+        await pubsub.aclose()
+        await client.aclose()
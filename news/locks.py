@@ -0,0 +1,127 @@
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from redis.exceptions import LockError, RedisError
+
+from .pipeline import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+LOCK_PREFIX = 'news:lock'
+
+
+class LeaseLost(Exception):
+    """
+    Raised when a lease has run out and is held by someone else now
+    """
+
+
+class Lease:
+    """
+    Redis lock held for a limited time (the lease) that its holder keeps renewing while it works
+
+    If the holder dies the lease simply runs out, so a crashed run never blocks the pipeline for
+    longer than `ttl` seconds. The token can be handed to another process (e.g. the next task of
+    a pipeline run) which can then renew and release the same lease.
+    """
+
+    def __init__(self, name, ttl=None, token=None):
+        self.name = f'{LOCK_PREFIX}:{name}'
+        self.ttl = ttl or settings.PIPELINE_LOCK_TTL
+        self.lock = get_redis_client().lock(self.name, timeout=self.ttl, blocking=False, thread_local=False)
+        if token:
+            self.lock.local.token = token.encode()
+
+    @property
+    def token(self):
+        token = self.lock.local.token
+        return token.decode() if token else None
+
+    def acquire(self):
+        """
+        Take the lease if nobody holds it; returns False otherwise
+        """
+        return self.lock.acquire(blocking=False)
+
+    def renew(self):
+        """
+        Restart the lease; returns False if it has run out or is held by someone else
+        """
+        try:
+            return self.lock.reacquire()
+        except LockError:
+            return False
+
+    def resume(self):
+        """
+        Renew the lease, or take it again with the same token if it ran out and nobody took it meanwhile
+
+        Returns False if someone else holds it now
+        """
+        return self.renew() or self.lock.acquire(blocking=False, token=self.token)
+
+    def release(self):
+        try:
+            self.lock.release()
+        except LockError:
+            # The lease ran out meanwhile, and possibly someone else holds it now
+            logger.warning(f"Lease {self.name} expired before it was released")
+
+    @contextmanager
+    def heartbeat(self):
+        """
+        Keep renewing the lease in the background while the block runs
+        """
+        stopped = threading.Event()
+
+        def beat():
+            while not stopped.wait(self.ttl / 3):
+                try:
+                    if not self.renew():
+                        logger.warning(f"Lost lease {self.name}")
+                        return
+                except RedisError as e:
+                    logger.warning(f"Could not renew lease {self.name}: {str(e)}")
+
+        thread = threading.Thread(target=beat, name=f'heartbeat {self.name}', daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stopped.set()
+            thread.join()
+
+
+def run_lease(token=None):
+    """
+    Lease on the whole news pipeline: only one run fetches, parses and imports at a time
+    """
+    return Lease('pipeline', token=token)
+
+
+def source_lease(source_id):
+    """
+    Lease on one source so its feed is never downloaded by two workers at once
+
+    Only held during the download (fetch_feed_task); parsing runs under the run lease
+    """
+    return Lease(f'source:{source_id}', ttl=settings.SOURCE_LOCK_TTL)
+
+
+@contextmanager
+def holding(lease):
+    """
+    Hold a lease for the duration of the block, renewing it as needed
+
+    Yields False without running anything exclusive if the lease is held elsewhere
+    """
+    if not lease.acquire():
+        yield False
+        return
+    try:
+        with lease.heartbeat():
+            yield True
+    finally:
+        lease.release()
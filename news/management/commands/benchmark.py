@@ -0,0 +1,117 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from news.benchmarks import BENCHMARKS, compare_reports, load_report, run_benchmarks
+
+GROUPS = [*BENCHMARKS, 'views']
+
+
+class Command(BaseCommand):
+    """
+    Management command to benchmark parsing, import and page rendering
+
+    Results are written as JSON so runs can be compared; --compare exits with an error
+    when a benchmark got slower than the threshold or started running more queries
+    """
+    help = 'Run performance benchmarks or compare two benchmark reports'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            nargs='+',
+            choices=GROUPS,
+            default=GROUPS,
+            help='Benchmark groups to run (default: all)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Number of timed runs per benchmark (default: 5)'
+        )
+        parser.add_argument(
+            '--rows',
+            type=str,
+            default='10000,100000,1000000',
+            help='Comma-separated news table sizes for the view benchmarks (used with --populate)'
+        )
+        parser.add_argument(
+            '--populate',
+            action='store_true',
+            help='Add synthetic news with populate_db to reach each --rows size '
+                 '(otherwise views are measured at the current table size)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for generated benchmark input (default: 42)'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Write the report as JSON to this file'
+        )
+        parser.add_argument(
+            '--compare',
+            nargs=2,
+            metavar=('BASELINE', 'CURRENT'),
+            help='Compare two JSON reports instead of running benchmarks'
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.1,
+            help='Allowed slowdown as a fraction of the baseline median (default: 0.1)'
+        )
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            baseline, current = options['compare']
+            try:
+                rows = compare_reports(load_report(baseline), load_report(current), options['threshold'])
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Could not compare reports: {str(e)}")
+            self.print_comparison(rows)
+            return
+
+        try:
+            row_counts = [int(rows) for rows in options['rows'].split(',') if rows]
+        except ValueError:
+            raise CommandError(f"Invalid --rows value: {options['rows']}")
+
+        report = run_benchmarks(
+            options['only'], options['repeat'], sorted(row_counts), options['populate'], options['seed'], self.stdout
+        )
+
+        for name, result in report['results'].items():
+            line = f"{name:<55} median {result['median'] * 1000:10.3f} ms"
+            if 'items_per_sec' in result:
+                line += f"  {result['items_per_sec']:12.1f} items/s"
+            if 'queries' in result:
+                line += f"  {result['queries']:3d} queries"
+            self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+    def print_comparison(self, rows):
+        regressions = 0
+        for name, old, new, change, status in rows:
+            old_ms = f"{old * 1000:10.3f}" if old is not None else f"{'-':>10}"
+            change_str = f"{change:+8.1%}" if change is not None else f"{'':>8}"
+            line = f"{name:<55} {old_ms} -> {new * 1000:10.3f} ms {change_str}  {status}"
+            if status == 'REGRESSION':
+                regressions += 1
+                self.stdout.write(self.style.ERROR(line))
+            elif status == 'improved':
+                self.stdout.write(self.style.SUCCESS(line))
+            else:
+                self.stdout.write(line)
+
+        if regressions:
+            raise CommandError(f"{regressions} benchmark(s) regressed")
+        self.stdout.write(self.style.SUCCESS("No regressions"))
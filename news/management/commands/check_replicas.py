@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from news.db_router import replication_lag
+
+
+class Command(BaseCommand):
+    """
+    Management command to show whether each read replica is reachable and how far it lags behind
+    """
+    help = 'Check the read replicas used for web traffic'
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            self.stdout.write(self.style.WARNING(
+                "No replicas configured (DB_REPLICA_HOSTS); all reads use the primary"
+            ))
+            return
+
+        failed = 0
+        for alias in settings.DATABASE_REPLICAS:
+            host = settings.DATABASES[alias].get('HOST') or settings.DATABASES[alias].get('NAME')
+            try:
+                lag = replication_lag(alias)
+            except DatabaseError as e:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f"{alias} ({host}): unavailable - {str(e).strip()}"))
+                continue
+
+            if lag > settings.REPLICA_MAX_LAG_SECONDS:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f"{alias} ({host}): {lag:.1f}s behind, not used"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{alias} ({host}): healthy, {lag:.1f}s behind"))
+
+        if failed:
+            raise CommandError(f"{failed} of {len(settings.DATABASE_REPLICAS)} replicas are not usable")
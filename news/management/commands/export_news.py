@@ -0,0 +1,165 @@
+import argparse
+import os
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from news.exporters import EXPORT_WRITERS, get_export_writer, iter_news_chunks
+from news.models import News
+
+
+def shard(value):
+    """
+    Parse a K/N shard argument (shards are numbered from 1)
+    """
+    number, _, count = value.partition('/')
+    try:
+        number, count = int(number), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid shard {value!r}, expected K/N")
+    if not 1 <= number <= count:
+        raise argparse.ArgumentTypeError(f"invalid shard {value!r}, K must be between 1 and N")
+    return number, count
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class Command(BaseCommand):
+    """
+    Management command to dump news with their source, tags and categories
+
+    Articles are streamed through a server-side cursor and written a chunk at a time, with the tags
+    and categories of each chunk resolved in two queries, so memory stays flat whatever the size
+    of the export. Exports can be limited to a date or ID range, or to one of N ID shards, so
+    several exporters can split the work between them.
+    """
+    help = 'Export news with sources, tags and categories to NDJSON or Parquet files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=sorted(EXPORT_WRITERS),
+            default='ndjson',
+            help='Output format: gzip NDJSON, zstd NDJSON (requires zstandard) or Parquet (requires pyarrow)'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Output file (default: a file named after the range in --output-dir)'
+        )
+        parser.add_argument(
+            '--output-dir',
+            type=str,
+            default=settings.NEWS_EXPORT_DIR,
+            help='Directory for output files'
+        )
+        parser.add_argument(
+            '--date-from',
+            type=date.fromisoformat,
+            help='Only news published on or after this day (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--date-to',
+            type=date.fromisoformat,
+            help='Only news published on or before this day (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--id-from',
+            type=int,
+            help='Only news with this ID or higher'
+        )
+        parser.add_argument(
+            '--id-to',
+            type=int,
+            help='Only news with an ID lower than this'
+        )
+        parser.add_argument(
+            '--shard',
+            type=shard,
+            help='Export the K-th of N equal ID ranges (K/N, e.g. 2/8) within the other limits; '
+                 'give all shards the same --id-to if news are being imported meanwhile'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Number of news fetched from the cursor and written at a time (default: 2000)'
+        )
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='Database alias to read from, e.g. a read replica (default: the primary)'
+        )
+
+    def handle(self, *args, **options):
+        database = options['database']
+        if database not in connections:
+            raise CommandError(f"Unknown database '{database}'")
+
+        queryset = News.objects.using(database)
+        parts = []
+        if options['date_from']:
+            queryset = queryset.filter(published_at__gte=day_start(options['date_from']))
+            parts.append(f"from-{options['date_from']:%Y%m%d}")
+        if options['date_to']:
+            queryset = queryset.filter(published_at__lt=day_start(options['date_to'] + timedelta(days=1)))
+            parts.append(f"to-{options['date_to']:%Y%m%d}")
+        if options['id_from'] is not None:
+            queryset = queryset.filter(id__gte=options['id_from'])
+            parts.append(f"id-{options['id_from']}")
+        if options['id_to'] is not None:
+            queryset = queryset.filter(id__lt=options['id_to'])
+            parts.append(f"id-to-{options['id_to']}")
+        if options['shard']:
+            queryset = self.shard_queryset(queryset, *options['shard'])
+            parts.append(f"shard-{options['shard'][0]}-of-{options['shard'][1]}")
+
+        writer_class = EXPORT_WRITERS[options['format']]
+        path = options['output'] or os.path.join(
+            options['output_dir'],
+            f"news-{'-'.join(parts) or 'all'}-{timezone.now():%Y%m%d%H%M%S}.{writer_class.extension}"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        # Written under a temporary name, so a failed export never looks like a complete file
+        partial_path = f"{path}.part"
+        try:
+            writer = get_export_writer(options['format'], partial_path)
+        except ImportError as e:
+            raise CommandError(f"Format '{options['format']}' is not available: {str(e)}")
+
+        self.stdout.write(self.style.NOTICE(f"Exporting news to {path}"))
+        exported = 0
+        try:
+            # A transaction keeps the server-side cursor streaming (see iter_news_chunks)
+            with transaction.atomic(using=database):
+                for records in iter_news_chunks(queryset, options['chunk_size']):
+                    writer.write(records)
+                    exported += len(records)
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f"Exported {exported} news")
+        except BaseException:
+            writer.close()
+            os.remove(partial_path)
+            raise
+        writer.close()
+        os.replace(partial_path, path)
+
+        self.stdout.write(self.style.SUCCESS(f"Exported {exported} news to {path}"))
+
+    def shard_queryset(self, queryset, number, count):
+        """
+        Limit a queryset to the number-th of count equal slices of its ID range
+        """
+        bounds = queryset.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            return queryset
+        size = (bounds['high'] - bounds['low']) // count + 1
+        low = bounds['low'] + (number - 1) * size
+        return queryset.filter(id__gte=low, id__lt=low + size)
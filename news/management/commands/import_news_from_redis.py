@@ -1,16 +1,34 @@
 import json
 import logging
-from typing import Dict, List, Optional
+from collections import Counter
+from datetime import timezone as dt_timezone
+from typing import Dict, List, Optional, Tuple, Union
 
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 import redis
 
 from django.conf import settings
-from news.models import News, Source, SiteCategory, Tag
+from news.articles import Article
+from news.autocomplete import record_tag_usage
+from news.cache import bump_import_generation, invalidate_articles
+from news.category_mapping import mapper
+from news.feeds import mark_feeds_stale, refresh_stale_feeds
+from news.keywords import extract_keywords, tokenize_article, update_document_frequencies
+from news.live import article_summary, publish_new_articles
+from news.metrics import RunMetrics
+from news.models import DailyCount, LogStats, News, Source, SiteCategory, Tag
+from news.profiling import profile_run
+from news.revisions import apply_revisions
+from news.rollups import count_article, news_date, record_daily_counts
+from news.trending import record_links
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_BATCH_SIZE = 100
+
 
 class NewsImporter:
     """
@@ -22,7 +40,15 @@ class NewsImporter:
         redis_host = getattr(settings, 'REDIS_HOST', 'redis')
         redis_port = getattr(settings, 'REDIS_PORT', 6379)
         self.redis_client = redis.Redis(host=redis_host, port=redis_port, db=0)
-        self.stats = {"imported": 0, "skipped": 0, "errors": 0}
+        self.stats = {"imported": 0, "updated": 0, "skipped": 0, "errors": 0}
+        self.metrics = RunMetrics()
+        # (kind, slug, published_at) of the tags and site categories linked in the current batch
+        self.trending_links = []
+        # (date, dimension, object_id) -> news counted in the current batch, see news.rollups
+        self.daily_counts = Counter()
+        # Sources and categories of the news imported in the current batch, whose feeds need a refresh
+        self.feed_source_ids = set()
+        self.feed_category_ids = set()
 
     def _parse_redis_data(self, raw_data: bytes) -> List[Dict]:
         """
@@ -69,12 +95,23 @@ class NewsImporter:
             logger.error(f"Error parsing JSON data: {str(e)}")
             return []
 
-    def get_news_from_redis(self, key: str = "rss_parsed_news") -> List[Dict]:
+    def get_news_from_redis(self, key: str = "rss_parsed_news") -> List[Union[Article, Dict]]:
         """
         Retrieve news data from Redis
+        Pipeline runs store Article records; older single-key payloads are returned as dicts
         """
         try:
             logger.info(f"Retrieving data from Redis with key: {key}")
+
+            # Pipeline runs append articles to a list, one JSON document per article
+            if self.redis_client.type(key) == b'list':
+                items = self.redis_client.lrange(key, 0, -1)
+                logger.info(f"Retrieved {len(items)} items from Redis list")
+                articles = [article for article in map(Article.from_json, items) if article is not None]
+                if len(articles) < len(items):
+                    logger.warning(f"Skipped {len(items) - len(articles)} malformed items")
+                return articles
+
             data = self.redis_client.get(key)
 
             if not data:
@@ -142,72 +179,289 @@ class NewsImporter:
             logger.error(f"Error creating tag '{tag_name}' (slug: {tag_slug}): {str(e)}")
             return None
 
-    def _process_single_news_item(self, item: Dict) -> bool:
+    def _get_or_create_tags(self, tag_names) -> Dict[str, Tag]:
+        """
+        Get or create many tags with a fixed number of queries
+        Returns a dict of tag name -> Tag (names without a usable slug are left out)
+        """
+        slugs = {name: slug for name in tag_names if (slug := Tag.get_safe_slug(name))}
+        if not slugs:
+            return {}
+
+        Tag.objects.bulk_create(
+            [Tag(name=Tag.truncate_for_field(name, 'name'), slug=slug) for name, slug in slugs.items()],
+            ignore_conflicts=True
+        )
+        tags = Tag.objects.filter(slug__in=set(slugs.values())).in_bulk(field_name='slug')
+        return {name: tags[slug] for name, slug in slugs.items() if slug in tags}
+
+    def _parse_published_at(self, value: Optional[str]):
+        """
+        Parse the feed publish time; falls back to now for missing, invalid or future timestamps
+        """
+        now = timezone.now()
+        if not value:
+            return now
+
+        try:
+            published_at = parse_datetime(value)
+        except (TypeError, ValueError):
+            published_at = None
+
+        if published_at is None:
+            return now
+        if timezone.is_naive(published_at):
+            published_at = timezone.make_aware(published_at, dt_timezone.utc)
+
+        return min(published_at, now)
+
+    def _process_single_news_item(self, item: Union[Article, Dict]) -> Optional[News]:
         """
         Process and save a single news item
-        Returns True if import was successful, False otherwise
+        Returns the created News object if import was successful, None otherwise
         """
+        article = item if isinstance(item, Article) else Article.from_dict(item)
+
         # Skip if no title
-        if not item.get('title'):
+        if article is None or not article.title:
             logger.warning("Skipping item with missing title")
-            return False
-
-        logger.info(f"Processing news item: {item.get('title', 'Unknown title')[:50]}...")
+            return None
 
-        # Generate slug for checking if news already exists
-        news_slug = News.get_safe_slug(item['title'])
+        logger.info(f"Processing news item: {article.title[:50]}...")
 
-        # Skip if news already exists (checking by slug)
-        if News.objects.filter(slug=news_slug).exists():
-            logger.info(f"News already exists with slug: {news_slug[:50]}...")
-            return False
+        # Skip if news with this title already exists under another URL (checking by slug);
+        # articles stored under the same URL were updated by _revise_stored_news
+        if article.slug and News.objects.filter(slug=article.slug).exists():
+            logger.info(f"News already exists with slug: {article.slug[:50]}...")
+            return None
 
         try:
             # Get source
-            source = Source.objects.get(name=item['source'])
+            source = Source.objects.get(name=article.source)
 
-            # Create the news object
+            # Create the news object (fields are already within the column limits)
             news = News.objects.create(
-                title=item['title'],
-                content=item['content'],
-                url=item['url'],
-                source=source
+                title=article.title,
+                slug=article.slug,
+                content=article.content,
+                url=article.url,
+                source=source,
+                published_at=self._parse_published_at(article.published_at),
+                content_hash=article.content_hash
             )
 
+            links = []
+            category_ids = []
+            tag_ids = []
+
             # Handle site category
-            if 'site_category' in item and item['site_category']:
-                site_category = self._get_or_create_site_category(item['site_category'])
+            if article.site_category:
+                site_category = self._get_or_create_site_category(article.site_category)
                 if site_category:
                     news.site_categories.add(site_category)
+                    links.append(('site_category', site_category.slug, news.published_at))
+                    if site_category.category_id:
+                        category_ids.append(site_category.category_id)
 
             # Handle tags
-            if 'tags' in item and item['tags'] and isinstance(item['tags'], list):
-                for tag_name in item['tags']:
+            if article.tags:
+                for tag_name in article.tags:
                     tag = self._get_or_create_tag(tag_name)
                     if tag:
                         news.tags.add(tag)
+                        links.append(('tag', tag.slug, news.published_at))
+                        tag_ids.append(tag.id)
 
+            self.trending_links.extend(links)
+            count_article(self.daily_counts, news.published_at, source.id, category_ids, tag_ids)
+            self.feed_source_ids.add(source.id)
+            self.feed_category_ids.update(category_ids)
             logger.info(f"Successfully imported news: {news.title[:50]}...")
-            return True
+            return news
 
         except Source.DoesNotExist:
-            logger.error(f"Source not found: {item.get('source')}")
-            return False
+            logger.error(f"Source not found: {article.source}")
+            return None
         except Exception as e:
             logger.error(f"Error importing news: {str(e)}", exc_info=True)
-            logger.debug(f"Problematic data: {item}")
-            return False
+            logger.debug(f"Problematic data: {article}")
+            return None
 
-    @transaction.atomic
-    def import_news(self, key: str = "rss_parsed_news") -> Dict:
+    def _import_batch(self, items: List[Union[Article, Dict]]) -> None:
         """
-        Import news from Redis to the database
-        Returns statistics of the import operation
+        Import a batch of news items in a single transaction; articles already stored are updated
+        if the feed changed them
+        Caches are invalidated, live clients notified, trending counters and daily counts updated
+        and the affected feeds marked stale once the batch is committed
         """
+        imported = []
+        # New site categories are mapped with the categories as they are now, not as they were at startup
+        mapper.refresh()
+
+        with transaction.atomic():
+            items, revised = self._revise_stored_news(items)
+            for item in items:
+                source_name = item.source if isinstance(item, Article) else (
+                    item.get('source') if isinstance(item, dict) else None
+                )
+                try:
+                    with self.metrics.stage('import', source_name), transaction.atomic():
+                        news = self._process_single_news_item(item)
+                    outcome = 'imported' if news else 'skipped'
+                    if news:
+                        imported.append(news)
+                except Exception as e:
+                    outcome = 'errors'
+                    logger.error(f"Unexpected error during news import: {str(e)}", exc_info=True)
+                self.stats[outcome] += 1
+                self.metrics.incr('news_pipeline_import_items_total', source_name, outcome=outcome)
+
+            if imported and settings.KEYWORD_TAGS_ENABLED:
+                self._tag_keywords(imported)
+
+            if imported or revised:
+                transaction.on_commit(bump_import_generation)
+
+            if imported:
+                summaries = [article_summary(news) for news in imported]
+                transaction.on_commit(lambda: publish_new_articles(summaries))
+
+            if revised:
+                revised_slugs = [slug for _, slug, _ in revised]
+                transaction.on_commit(lambda: invalidate_articles(revised_slugs))
+
+            # Trending counters only count links that were committed
+            links, self.trending_links = self.trending_links, []
+            if links:
+                transaction.on_commit(lambda: record_links(links))
+
+            source_ids, self.feed_source_ids = self.feed_source_ids, set()
+            category_ids, self.feed_category_ids = self.feed_category_ids, set()
+            if imported or revised:
+                transaction.on_commit(lambda: mark_feeds_stale(source_ids, category_ids))
+
+            self._record_counts_on_commit()
+
+    def _revise_stored_news(self, items: List[Union[Article, Dict]]) -> Tuple[List[Union[Article, Dict]], List]:
+        """
+        Find the articles of a batch that are already stored (by URL) with one query and update
+        those whose content hash changed with set-based updates (see news.revisions)
+        Returns the items not stored yet and (id, slug, source_id) of the news that changed
+        """
+        articles = [item if isinstance(item, Article) else Article.from_dict(item) for item in items]
+        urls = {article.url for article in articles if article is not None}
+        if not urls:
+            return items, []
+        stored = {url: (news_id, hashed) for url, news_id, hashed
+                  in News.objects.filter(url__in=urls).values_list('url', 'id', 'content_hash')}
+
+        new_items = []
+        matched = []
+        changes = {}
+        for item, article in zip(items, articles):
+            news_id, stored_hash = stored.get(article.url, (None, None)) if article is not None else (None, None)
+            if news_id is None:
+                new_items.append(item)
+                continue
+            matched.append((news_id, article))
+            if stored_hash != article.content_hash:
+                changes[news_id] = article
+
+        revised = []
+        if changes:
+            try:
+                with transaction.atomic():
+                    revised = apply_revisions(changes)
+            except DatabaseError as e:
+                logger.error(f"Failed to update {len(changes)} changed news: {str(e)}")
+                for _, article in matched:
+                    self.stats['errors'] += 1
+                    self.metrics.incr('news_pipeline_import_items_total', article.source, outcome='errors')
+                return new_items, []
+
+        revised_ids = {news_id for news_id, _, _ in revised}
+        for news_id, article in matched:
+            outcome = 'updated' if news_id in revised_ids else 'skipped'
+            # An article listed twice in the batch is only updated once
+            revised_ids.discard(news_id)
+            self.stats[outcome] += 1
+            self.metrics.incr('news_pipeline_import_items_total', article.source, outcome=outcome)
+
+        if revised:
+            self.feed_source_ids.update(source_id for _, _, source_id in revised)
+            self.feed_category_ids.update(
+                SiteCategory.objects.filter(news__id__in=[news_id for news_id, _, _ in revised], category__isnull=False)
+                .values_list('category_id', flat=True).distinct()
+            )
+            logger.info(f"Updated {len(revised)} news changed by their feeds")
+        return new_items, revised
 
-        self.stats = {"imported": 0, "skipped": 0, "errors": 0}
+    def _record_counts_on_commit(self) -> None:
+        """
+        Add the news counted so far to the daily counts and tag usage counts once the current
+        transaction commits (right away outside a transaction)
+        """
+        counts, self.daily_counts = self.daily_counts, Counter()
+        if not counts:
+            return
+        tag_counts = Counter()
+        for (_, dimension, object_id), count in counts.items():
+            if dimension == DailyCount.TAG:
+                tag_counts[object_id] += count
+        transaction.on_commit(lambda: record_daily_counts(counts))
+        transaction.on_commit(lambda: record_tag_usage(tag_counts))
+
+    def _tag_keywords(self, imported: List[News], count_documents: bool = True) -> None:
+        """
+        Count the batch in the keyword document frequencies and tag the articles that came
+        without tags with their top TF-IDF keywords
+        """
+        try:
+            with self.metrics.stage('keywords'), transaction.atomic():
+                documents = [tokenize_article(news.title, news.content) for news in imported]
+                if count_documents:
+                    update_document_frequencies(documents)
+
+                tagged_ids = set(
+                    News.tags.through.objects.filter(news_id__in=[news.id for news in imported])
+                    .values_list('news_id', flat=True)
+                )
+                untagged = [(news, tokens) for news, tokens in zip(imported, documents) if news.id not in tagged_ids]
+                if not untagged:
+                    return
+
+                keywords = extract_keywords([tokens for _, tokens in untagged])
+                tags = self._get_or_create_tags({term for terms in keywords for term in terms})
+                links = []
+                trending_links = []
+                daily_counts = Counter()
+                for (news, _), terms in zip(untagged, keywords):
+                    for term in terms:
+                        if term in tags:
+                            links.append(News.tags.through(news_id=news.id, tag_id=tags[term].id))
+                            trending_links.append(('tag', tags[term].slug, news.published_at))
+                            daily_counts[(news_date(news.published_at), DailyCount.TAG, tags[term].id)] += 1
+                News.tags.through.objects.bulk_create(links, ignore_conflicts=True)
+                self.trending_links.extend(trending_links)
+                self.daily_counts.update(daily_counts)
+        except Exception as e:
+            # Keyword tags are a bonus: never lose the batch over them
+            logger.error(f"Keyword tagging failed: {str(e)}", exc_info=True)
 
-        news_data = self.get_news_from_redis(key)
+    def import_news(self, key: str = "rss_parsed_news", batch_size: int = DEFAULT_BATCH_SIZE) -> Dict:
+        """
+        Import news from Redis to the database, committing every `batch_size` items
+        Returns statistics of the import operation
+        """
+        return self.import_items(self.get_news_from_redis(key), batch_size)
+
+    def import_items(self, news_data: List[Union[Article, Dict]], batch_size: int = DEFAULT_BATCH_SIZE) -> Dict:
+        """
+        Import already parsed news items, committing every `batch_size` items
+        The outgoing feeds changed by the import are marked stale; callers refresh them (see news.feeds)
+        Returns statistics of the import operation
+        """
+        self.stats = {"imported": 0, "updated": 0, "skipped": 0, "errors": 0}
 
         if not news_data:
             logger.warning("No news data found to import")
@@ -215,17 +469,8 @@ class NewsImporter:
 
         logger.info(f"Found {len(news_data)} news items to process")
 
-        for item in news_data:
-            try:
-                with transaction.atomic():
-                    result = self._process_single_news_item(item)
-                    if result:
-                        self.stats["imported"] += 1
-                    else:
-                        self.stats["skipped"] += 1
-            except Exception as e:
-                self.stats["errors"] += 1
-                logger.error(f"Unexpected error during news import: {str(e)}", exc_info=True)
+        for start in range(0, len(news_data), batch_size):
+            self._import_batch(news_data[start:start + batch_size])
 
         return self.stats
 
@@ -256,6 +501,32 @@ class Command(BaseCommand):
             help='Delete all existing news before import (CAUTION: destructive operation)'
         )
 
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Number of news items committed per transaction'
+        )
+
+        parser.add_argument(
+            '--stats-id',
+            type=int,
+            help='LogStats record to store the import metrics in'
+        )
+
+        parser.add_argument(
+            '--profile',
+            action='store_true',
+            default=settings.PIPELINE_PROFILE,
+            help='Profile the run (functions and SQL queries) and store the report with the LogStats record'
+        )
+
+        parser.add_argument(
+            '--refresh-feeds',
+            action='store_true',
+            help='Render the outgoing feeds changed by the import right away (import tasks do it in the background)'
+        )
+
     def handle(self, *args, **options):
         redis_key = options['key']
         clear_after_import = options['clear']
@@ -270,14 +541,23 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING(f"Deleted {count} existing news"))
 
         importer = NewsImporter()
-        stats = importer.import_news(redis_key)
+        with profile_run(options['profile'], 'import', options['stats_id'], self.stdout):
+            stats = importer.import_news(redis_key, batch_size=options['batch_size'])
+
+        importer.metrics.flush('import')
+        if options['stats_id']:
+            LogStats.record_metrics(options['stats_id'], importer.metrics.as_dict())
 
         success_message = (
-            f"News import completed. Imported: {stats['imported']}, "
+            f"News import completed. Imported: {stats['imported']}, Updated: {stats['updated']}, "
             f"Skipped: {stats['skipped']}, Errors: {stats['errors']}"
         )
         self.stdout.write(self.style.SUCCESS(success_message))
 
+        if options['refresh_feeds'] and (stats['imported'] or stats['updated']):
+            refreshed = refresh_stale_feeds()
+            self.stdout.write(self.style.SUCCESS(f"Refreshed {refreshed} feeds"))
+
         # Clear Redis after successful import if requested
         if clear_after_import and stats['imported'] > 0:
             importer.redis_client.delete(redis_key)
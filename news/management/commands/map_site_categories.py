@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+
+from news.category_mapping import mapper
+from news.models import Category, SiteCategory
+
+
+class Command(BaseCommand):
+    """
+    Management command to map the backlog of site categories to categories
+
+    New site categories are mapped when they are created; this handles the ones created before,
+    and can refresh automatic mappings after the rules or manual mappings changed.
+    Mappings made in the admin are never changed.
+    """
+    help = 'Assign categories to unmapped site categories'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--remap-auto',
+            action='store_true',
+            help='Also re-classify site categories that were mapped automatically'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show the mappings without saving them'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of site categories updated per query (default: 500)'
+        )
+
+    def handle(self, *args, **options):
+        queryset = SiteCategory.objects.filter(category__isnull=True)
+        if options['remap_auto']:
+            queryset = queryset | SiteCategory.objects.filter(auto_mapped=True)
+
+        mapper.reset()
+        category_names = dict(Category.objects.values_list('id', 'name'))
+        changed = []
+        for site_category in queryset.order_by('name'):
+            category_id = mapper.classify(site_category.name)
+            if category_id == site_category.category_id:
+                continue
+            site_category.category_id = category_id
+            site_category.auto_mapped = category_id is not None
+            changed.append(site_category)
+            if options['dry_run'] or options['verbosity'] > 1:
+                target = category_names.get(category_id, '(none)')
+                self.stdout.write(f"{site_category.name} -> {target}")
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"Dry run: {len(changed)} site categories would change"))
+            return
+
+        SiteCategory.objects.bulk_update(changed, ['category', 'auto_mapped'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Mapped {len(changed)} site categories"))
@@ -1,18 +1,63 @@
+import itertools
 import os
 import random
-import uuid
 from datetime import timedelta
-from django.core.management.base import BaseCommand
-from django.utils import timezone
-from django.utils.text import slugify
+
 from django.conf import settings
-from news.models import Source, Category, News, Tag
 from django.core.management import call_command
-from faker import Faker
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from news.autocomplete import recount_tag_usage
+from news.cache import bump_import_generation
+from news.management.commands.prune_news import delete_in_batches
+from news.models import Source, Category, DailyCount, SiteCategory, News, Tag
+from news.rollups import news_date, recount_day
+from news.utils import slugify
+
+# Number of news, tags and site categories generated per unit of --scale
+SCALE_NEWS = 10_000
+SCALE_TAGS = 1_000
+SITE_CATEGORIES = 60
+
+# Common Ukrainian news vocabulary, roughly ordered by frequency (sampled with Zipfian weights)
+VOCABULARY = (
+    "україна київ уряд президент війна заява у на та що як для з до за від про під час після "
+    "рада місто область новини сьогодні вчора році тисяч мільйонів гривень людей країни світу "
+    "міністр депутати закон рішення суд поліція армія фронт обстріл атака ракети дрони оборона "
+    "економіка бюджет ціни банк курс долар інфляція податки енергетика газ світло тарифи "
+    "вибори партія парламент коаліція уряду прем'єр посол переговори санкції допомога партнери "
+    "європа сша польща німеччина франція британія нато євросоюз саміт зустріч делегація "
+    "школа університет лікарня медицина здоров'я вакцина студенти вчителі освіта наука "
+    "спорт футбол матч збірна чемпіонат перемога турнір олімпіада тренер гравець "
+    "культура фільм театр музей концерт виставка книга фестиваль художник музика "
+    "погода дощ сніг морози спека прогноз синоптики шторм "
+    "технології інтернет смартфон штучний інтелект стартап компанія ринок інвестиції "
+    "харків одеса львів дніпро запоріжжя херсон миколаїв житомир чернігів суми полтава "
+    "повідомили заявив зазначив розповів оголосили підписав затвердили ухвалили відбулася "
+    "новий великий важливий перший останній головний державний міжнародний національний "
+    "ситуація питання проект програма реформа розвиток безпека підтримка відновлення "
+    "ремонт дороги мости транспорт залізниця аеропорт потяги автобуси житло будівництво"
+).split()
+
+# Share of news published in each hour of the day (UTC), peaking during the working day
+HOUR_WEIGHTS = (1, 1, 1, 1, 2, 3, 5, 7, 9, 10, 10, 10, 10, 10, 10, 9, 9, 8, 7, 6, 5, 4, 3, 2)
+
+
+def zipf_cum_weights(size, exponent=1.1):
+    """
+    Cumulative Zipfian weights for `size` ranked items, for use with random.choices
+    """
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, size + 1)))
+
 
 class Command(BaseCommand):
     """
-    Management command to populate the database with test data.
+    Management command to populate the database with a synthetic, reproducible dataset.
+    Generates Cyrillic titles and bodies, Zipfian tag and source popularity and a realistic
+    spread of publish times, writing everything with bulk inserts in chunks.
     """
     help = 'Populates the database with test data'
 
@@ -23,6 +68,31 @@ class Command(BaseCommand):
             default=50,
             help='Number of news articles to create (default: 50)'
         )
+        parser.add_argument(
+            '--scale',
+            type=float,
+            default=None,
+            help=f'Dataset size multiplier: {SCALE_NEWS} news and {SCALE_TAGS} tags per unit '
+                 f'(overrides --news_count, e.g. --scale=100 for 1M news)'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='Spread publish times over this many past days (default: 365)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for reproducible datasets (default: 42)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Number of news inserted per bulk insert (default: 5000)'
+        )
         parser.add_argument(
             '--clear',
             action='store_true',
@@ -30,85 +100,168 @@ class Command(BaseCommand):
         )
 
     def handle(self, *args, **options):
-        news_count = options['news_count']
-        clear_data = options['clear']
-        
-        # Initialize faker
-        fake = Faker()
-        
+        scale = options['scale']
+        news_count = int(SCALE_NEWS * scale) if scale else options['news_count']
+        tags_count = max(int(SCALE_TAGS * scale ** 0.5), 20) if scale else 50
+        chunk_size = options['chunk_size']
+
+        self.rng = random.Random(options['seed'])
+        self.word_weights = zipf_cum_weights(len(VOCABULARY))
+
         # Clear existing data if requested
-        if clear_data:
+        if options['clear']:
             self.stdout.write(self.style.WARNING('Clearing existing data...'))
-            News.objects.all().delete()
+            # News go in short batches, without the per-row delete signals; the other tables are small
+            delete_in_batches(News.objects.all(), chunk_size)
+            DailyCount.objects.all().delete()
             Tag.objects.all().delete()
+            SiteCategory.objects.all().delete()
             Category.objects.all().delete()
             Source.objects.all().delete()
-        
+
         # Load fixtures
         fixtures_path = os.path.join(settings.BASE_DIR, 'news', 'fixtures')
-        
+
         self.stdout.write(self.style.SUCCESS('Loading categories...'))
         call_command('loaddata', os.path.join(fixtures_path, 'categories.json'))
-        
+
         self.stdout.write(self.style.SUCCESS('Loading sources...'))
         call_command('loaddata', os.path.join(fixtures_path, 'sources.json'))
-        
-        self.stdout.write(self.style.SUCCESS('Loading tags...'))
-        call_command('loaddata', os.path.join(fixtures_path, 'tags.json'))
-        
-        # Get all loaded data
+
         sources = list(Source.objects.all())
         categories = list(Category.objects.all())
-        tags = list(Tag.objects.all())
-        
-        if not sources or not categories or not tags:
+
+        if not sources or not categories:
             self.stdout.write(self.style.ERROR('Error loading fixtures. Please check your JSON files.'))
             return
-        
+
+        self.stdout.write(self.style.SUCCESS(f'Creating {tags_count} tags and {SITE_CATEGORIES} site categories...'))
+        tag_ids = self.create_tags(tags_count)
+        site_category_ids = self.create_site_categories(categories)
+
+        # Popularity ranks are shuffled so the most popular tags/sources are not always the first rows
+        self.rng.shuffle(tag_ids)
+        self.rng.shuffle(sources)
+        tag_weights = zipf_cum_weights(len(tag_ids))
+        source_weights = zipf_cum_weights(len(sources), exponent=0.8)
+        site_category_weights = zipf_cum_weights(len(site_category_ids))
+
         self.stdout.write(self.style.SUCCESS(f'Creating {news_count} random news articles...'))
-        
-        # Create news articles
-        for i in range(news_count):
-            # Generate a random date within the last year
-            random_date = timezone.now() - timedelta(days=random.randint(0, 365))
-            
-            # Create a random title
-            title = fake.sentence(nb_words=random.randint(5, 12))
-            
-            # Generate a unique slug
-            base_slug = slugify(title)
-            slug = base_slug
-            
-            # Make sure the slug is unique
-            if News.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{str(uuid.uuid4())[:8]}"
-            
-            # Create random content
-            paragraphs = random.randint(3, 10)
-            content = '\n\n'.join(fake.paragraphs(nb=paragraphs))
-            
-            # Create a random URL
-            source = random.choice(sources)
-            url = f"{source.url}/article/{base_slug}-{random.randint(1000, 9999)}"
-            
-            # Create the news article
-            news = News.objects.create(
-                title=title,
-                slug=slug,
-                content=content,
-                url=url,
-                source=source,
-                created_at=random_date
-            )
-            
-            # Add random categories (1-3)
-            random_categories = random.sample(categories, random.randint(1, min(3, len(categories))))
-            news.categories.set(random_categories)
-            
-            # Add random tags (2-5)
-            random_tags = random.sample(tags, random.randint(2, min(5, len(tags))))
-            news.tags.set(random_tags)
-            
-            self.stdout.write(f'Created news #{i+1}: {title}')
-        
+
+        now = timezone.now()
+        max_seconds = options['days'] * 24 * 3600
+        # Continue numbering after existing news so slugs and URLs stay unique across runs
+        offset = News.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        created = 0
+
+        while created < news_count:
+            size = min(chunk_size, news_count - created)
+            news_objects = []
+
+            for index in range(offset + created, offset + created + size):
+                title = self.sentence(5, 12)
+                published_at = self.publish_time(now, max_seconds)
+                news_objects.append(News(
+                    title=title,
+                    # Sequence suffix keeps slugs unique without per-row existence checks
+                    slug=f"{slugify(title)[:480]}-{index}",
+                    content=self.body()[:5000],
+                    url=f"https://example.com/news/{index}",
+                    source=self.rng.choices(sources, cum_weights=source_weights)[0],
+                    published_at=published_at,
+                ))
+
+            with transaction.atomic():
+                news_objects = News.objects.bulk_create(news_objects)
+
+                tag_links = []
+                category_links = []
+                for news in news_objects:
+                    # 0-5 tags per article, popularity following a Zipfian distribution
+                    for tag_id in set(self.rng.choices(tag_ids, cum_weights=tag_weights, k=self.rng.randint(0, 5))):
+                        tag_links.append(Tag.news.through(tag_id=tag_id, news_id=news.id))
+                    site_category_id = self.rng.choices(site_category_ids, cum_weights=site_category_weights)[0]
+                    category_links.append(
+                        News.site_categories.through(news_id=news.id, sitecategory_id=site_category_id)
+                    )
+
+                Tag.news.through.objects.bulk_create(tag_links, batch_size=chunk_size)
+                News.site_categories.through.objects.bulk_create(category_links, batch_size=chunk_size)
+
+            created += size
+            self.stdout.write(f'Created {created}/{news_count} news')
+
+        # Tag links were bulk inserted without the importer's usage counts and daily counts
+        recount_tag_usage()
+        self.stdout.write(self.style.SUCCESS('Counting news per day...'))
+        day = news_date(now - timedelta(seconds=max_seconds))
+        while day <= news_date(now):
+            recount_day(day)
+            day += timedelta(days=1)
+        # Statistics pages and API responses are cached per import generation
+        bump_import_generation()
+
         self.stdout.write(self.style.SUCCESS(f'Successfully populated database with {news_count} news articles'))
+
+    def words(self, count):
+        return self.rng.choices(VOCABULARY, cum_weights=self.word_weights, k=count)
+
+    def sentence(self, min_words, max_words):
+        text = ' '.join(self.words(self.rng.randint(min_words, max_words)))
+        return text[0].upper() + text[1:]
+
+    def body(self):
+        paragraphs = []
+        for _ in range(self.rng.randint(3, 10)):
+            paragraphs.append(' '.join(f"{self.sentence(6, 18)}." for _ in range(self.rng.randint(2, 6))))
+        return '\n\n'.join(paragraphs)
+
+    def publish_time(self, now, max_seconds):
+        """
+        Random publish time within the period, following the daily publishing rhythm
+        """
+        day = now - timedelta(seconds=self.rng.randint(0, max_seconds))
+        hour = self.rng.choices(range(24), weights=HOUR_WEIGHTS)[0]
+        published_at = day.replace(hour=hour, minute=self.rng.randint(0, 59), second=self.rng.randint(0, 59))
+        return min(published_at, now)
+
+    def create_tags(self, count):
+        """
+        Create `count` tags named from one or two vocabulary words; returns their ids
+        """
+        existing = set(Tag.objects.values_list('slug', flat=True))
+        # Every vocabulary word first, then random word pairs; existing tags are reused
+        names = itertools.chain(VOCABULARY, (' '.join(self.words(2)) for _ in range(count * 10)))
+        tags = []
+        for name in names:
+            if len(tags) >= count:
+                break
+            slug = slugify(name)
+            if slug in existing:
+                continue
+            existing.add(slug)
+            tags.append(Tag(name=name, slug=slug))
+
+        Tag.objects.bulk_create(tags, batch_size=5000)
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_site_categories(self, categories):
+        """
+        Create site categories as sources name them; about half are mapped to a category
+
+        The random mappings are flagged as automatic so they never count as admin-confirmed
+        examples for news.category_mapping, which may remap them
+        """
+        existing = set(SiteCategory.objects.values_list('slug', flat=True))
+        site_categories = []
+        for index in range(SITE_CATEGORIES):
+            name = f"{' '.join(self.words(1))} {index}"
+            slug = slugify(name)
+            if slug in existing:
+                continue
+            category = self.rng.choice(categories) if self.rng.random() < 0.5 else None
+            site_categories.append(SiteCategory(name=name, slug=slug, category=category,
+                                                auto_mapped=category is not None))
+
+        SiteCategory.objects.bulk_create(site_categories)
+        return list(SiteCategory.objects.values_list('id', flat=True))
@@ -0,0 +1,150 @@
+import os
+import time
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction, OperationalError
+from django.utils import timezone
+
+from news.autocomplete import recount_tag_usage
+from news.cache import invalidate_articles
+from news.exporters import EXPORT_FIELDS, EXPORT_WRITERS, get_export_writer, serialize_news_chunk
+from news.models import News
+
+
+def delete_in_batches(queryset, batch_size, sleep=0, export_format=None, archive_dir=None, stdout=None):
+    """
+    Archive and delete news in bounded batches, each in its own short transaction
+
+    The tag and site category links are deleted first, then the news with one DELETE: deleting
+    through the ORM would run the News post_delete signal for every row. The cached pages of the
+    batch are dropped once it is committed. Batches are archived to export_format files in archive_dir
+    if given; returns the number of deleted news
+    """
+    table = connection.ops.quote_name(News._meta.db_table)
+    # Without an archive only the slugs are needed, to drop the cached pages
+    fields = EXPORT_FIELDS if export_format else ('id', 'slug')
+    removed = 0
+    while True:
+        path = None
+        try:
+            with transaction.atomic():
+                if connection.vendor == 'postgresql':
+                    # Give up on this batch rather than queue behind long-running locks
+                    with connection.cursor() as cursor:
+                        cursor.execute("SET LOCAL lock_timeout = '5s'")
+                rows = list(queryset.order_by('id').values(*fields)[:batch_size])
+                if not rows:
+                    return removed
+                ids = [row['id'] for row in rows]
+
+                if export_format:
+                    extension = EXPORT_WRITERS[export_format].extension
+                    path = os.path.join(archive_dir, f"news-{ids[0]}-{ids[-1]}.{extension}")
+                    writer = get_export_writer(export_format, f'{path}.tmp')
+                    try:
+                        writer.write(serialize_news_chunk(rows))
+                    finally:
+                        writer.close()
+
+                News.tags.through.objects.filter(news_id__in=ids).delete()
+                News.site_categories.through.objects.filter(news_id__in=ids).delete()
+                with connection.cursor() as cursor:
+                    cursor.execute(f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+
+                transaction.on_commit(partial(invalidate_articles, [row['slug'] for row in rows]))
+            if path:
+                os.replace(f'{path}.tmp', path)
+        except OperationalError as e:
+            raise CommandError(f"Batch delete failed after removing {removed} news: {str(e)}")
+        finally:
+            # A batch that was not committed keeps its rows: drop its archive so a rerun does not archive them twice
+            if path and os.path.exists(f'{path}.tmp'):
+                os.remove(f'{path}.tmp')
+
+        removed += len(ids)
+        if stdout:
+            stdout.write(f"Removed {removed} news so far")
+        time.sleep(sleep)
+
+
+class Command(BaseCommand):
+    """
+    Management command to archive and remove old news
+
+    Old rows are exported and deleted in small batches so locks stay short. Each batch is archived
+    to its own file, named after its ID range, which only gets its final name once the delete is
+    committed: a failed batch leaves no archive behind, so a rerun never archives a row twice
+    """
+    help = 'Archive news older than the retention period and remove them from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            default=settings.NEWS_RETENTION_DAYS,
+            help='Remove news published more than this many days ago'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of news archived and deleted per transaction'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='Seconds to pause between batches to leave room for other writers'
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(EXPORT_WRITERS),
+            default='ndjson',
+            help='Archive format (ndjson-zstd requires zstandard, parquet requires pyarrow)'
+        )
+        parser.add_argument(
+            '--archive-dir',
+            type=str,
+            default=settings.NEWS_ARCHIVE_DIR,
+            help='Directory for archive files'
+        )
+        parser.add_argument(
+            '--no-archive',
+            action='store_true',
+            help='Delete without exporting (CAUTION: destructive operation)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many news would be removed'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than'])
+        old_news = News.objects.filter(published_at__lt=cutoff)
+
+        self.stdout.write(self.style.NOTICE(f"Pruning news published before {cutoff:%Y-%m-%d %H:%M}"))
+
+        if options['dry_run']:
+            self.stdout.write(f"{old_news.count()} news would be removed")
+            return
+
+        export_format = None
+        if not options['no_archive']:
+            export_format = options['format']
+            os.makedirs(options['archive_dir'], exist_ok=True)
+            self.stdout.write(f"Archiving to {options['archive_dir']}")
+
+        try:
+            removed = delete_in_batches(old_news, options['batch_size'], options['sleep'], export_format,
+                                        options['archive_dir'], self.stdout)
+        except ImportError as e:
+            raise CommandError(f"Format '{options['format']}' is not available: {str(e)}")
+
+        if removed:
+            # The tag filter ranks tags by how many news they still have
+            recount_tag_usage()
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} news"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from news.autocomplete import recount_tag_usage
+
+
+class Command(BaseCommand):
+    """
+    Management command to recount how many news each tag has, from the tag links
+
+    The importer keeps the counts up to date; this repairs failed updates and sets the counts
+    of tags created before they were tracked or linked by other means (populate_db).
+    """
+    help = 'Recount the news of every tag used to rank tags in the tag filter'
+
+    def handle(self, *args, **options):
+        updated = recount_tag_usage()
+        self.stdout.write(self.style.SUCCESS(f"Recounted the news of {updated} tags"))
@@ -5,7 +5,9 @@ import redis
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 
-from parsers.rss.rss import run_rss_parser
+from news.models import LogStats
+from news.profiling import profile_run
+from parsers.rss.rss import RSSParser
 
 
 class Command(BaseCommand):
@@ -35,13 +37,24 @@ class Command(BaseCommand):
             default='rss_parsed_news',
             help='Redis key to store the parsed articles (only used with Redis storage)'
         )
+        parser.add_argument(
+            '--stats-id',
+            type=int,
+            help='LogStats record to store the parsing metrics in'
+        )
+        parser.add_argument(
+            '--profile',
+            action='store_true',
+            default=settings.PIPELINE_PROFILE,
+            help='Profile the run (functions and SQL queries) and store the report with the LogStats record'
+        )
 
     def save_to_json(self, articles, output_file):
         """
         Save articles to a JSON file
         
         Args:
-            articles (list): List of article dictionaries to save
+            articles (list): List of Article records to save
             output_file (str): Path to the output JSON file
         """
         # If the output path is not absolute, make it relative to the project base
@@ -49,7 +62,7 @@ class Command(BaseCommand):
             output_file = os.path.join(settings.BASE_DIR, output_file)
             
         with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(articles, f, ensure_ascii=False, indent=4)
+            json.dump([article.to_dict() for article in articles], f, ensure_ascii=False, indent=4)
         self.stdout.write(
             self.style.SUCCESS(f"Results saved to JSON file: {output_file}")
         )
@@ -59,7 +72,7 @@ class Command(BaseCommand):
         Save articles to Redis
         
         Args:
-            articles (list): List of article dictionaries to save
+            articles (list): List of Article records to save
             redis_key (str): Redis key to store the articles
         """
         try:
@@ -77,7 +90,7 @@ class Command(BaseCommand):
             )
 
             # Save articles to Redis
-            r.set(redis_key, json.dumps(articles, ensure_ascii=False))
+            r.set(redis_key, json.dumps([article.to_dict() for article in articles], ensure_ascii=False))
             self.stdout.write(
                 self.style.SUCCESS(f"Results saved to Redis with key: {redis_key}")
             )
@@ -94,8 +107,10 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.SUCCESS(f"Starting RSS parsing..."))
 
+        rss_parser = RSSParser()
         try:
-            sources, articles = run_rss_parser()
+            with profile_run(options['profile'], 'parse', options['stats_id'], self.stdout):
+                sources, articles = rss_parser.parse_all_active_sources()
 
             if sources == 0:
                 self.stdout.write(self.style.WARNING("No sources were processed."))
@@ -117,3 +132,7 @@ class Command(BaseCommand):
 
         except Exception as e:
             raise CommandError(f"Error during RSS parsing: {str(e)}")
+        finally:
+            rss_parser.metrics.flush('parse')
+            if options['stats_id']:
+                LogStats.record_metrics(options['stats_id'], rss_parser.metrics.as_dict())
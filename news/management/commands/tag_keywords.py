@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand
+
+from news.keywords import TOTAL_TERMS, tokenize_article, update_document_frequencies
+from news.management.commands.import_news_from_redis import NewsImporter
+from news.models import News, TermDocumentFrequency
+
+
+class Command(BaseCommand):
+    """
+    Management command to build the keyword document frequencies from the archive and to
+    tag archived articles that have no tags
+
+    The importer keeps both up to date for new articles; this is for existing data
+    """
+    help = 'Rebuild keyword document frequencies and add keyword tags to untagged news'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild-df',
+            action='store_true',
+            help='Recount the document frequencies over all news before tagging'
+        )
+        parser.add_argument(
+            '--no-tagging',
+            action='store_true',
+            help='Only rebuild the document frequencies'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of news read per query (default: 500)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        if options['rebuild_df']:
+            TermDocumentFrequency.objects.all().delete()
+            counted = 0
+            for chunk in self.chunks(News.objects.all(), batch_size):
+                update_document_frequencies([tokenize_article(news.title, news.content) for news in chunk])
+                counted += len(chunk)
+                self.stdout.write(f"Counted {counted} news")
+            terms = TermDocumentFrequency.objects.exclude(term__in=TOTAL_TERMS).count()
+            self.stdout.write(self.style.SUCCESS(f"Document frequencies rebuilt: {terms} terms"))
+
+        if options['no_tagging']:
+            return
+
+        importer = NewsImporter()
+        processed = 0
+        for chunk in self.chunks(News.objects.filter(tags__isnull=True), batch_size):
+            # The archive is already counted in the document frequencies
+            importer._tag_keywords(chunk, count_documents=False)
+            importer._record_counts_on_commit()
+            processed += len(chunk)
+            self.stdout.write(f"Processed {processed} untagged news")
+        self.stdout.write(self.style.SUCCESS(f"Keyword tagging completed for {processed} news"))
+
+    def chunks(self, queryset, batch_size):
+        """
+        Yield lists of news in ID order, paging by ID so each query stays cheap
+        """
+        last_id = 0
+        queryset = queryset.only('id', 'title', 'content', 'published_at').order_by('id')
+        while True:
+            chunk = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1].id
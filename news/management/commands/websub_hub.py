@@ -0,0 +1,166 @@
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import requests
+from django.core.management.base import BaseCommand
+
+from news.websub import sign
+
+REQUEST_TIMEOUT = 10
+
+
+class LocalHub:
+    """
+    In-memory WebSub hub: verifies subscribers and delivers signed content to them
+    """
+
+    def __init__(self, stdout, max_lease_seconds):
+        self.stdout = stdout
+        self.max_lease_seconds = max_lease_seconds
+        # (callback, topic) -> {'secret': ..., 'expires': unix time}
+        self.subscriptions = {}
+        self.lock = threading.Lock()
+
+    def verify(self, mode, callback, topic, secret, lease_seconds):
+        challenge = secrets.token_urlsafe(16)
+        params = {'hub.mode': mode, 'hub.topic': topic, 'hub.challenge': challenge}
+        if mode == 'subscribe':
+            params['hub.lease_seconds'] = lease_seconds
+        try:
+            response = requests.get(callback, params=params, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            self.stdout.write(f"Verification of {callback} failed: {str(e)}")
+            return
+
+        if response.status_code // 100 != 2 or response.text != challenge:
+            self.stdout.write(f"{callback} refused {mode} of {topic} ({response.status_code})")
+            return
+
+        with self.lock:
+            if mode == 'subscribe':
+                self.subscriptions[(callback, topic)] = {'secret': secret, 'expires': time.time() + lease_seconds}
+            else:
+                self.subscriptions.pop((callback, topic), None)
+        self.stdout.write(f"Verified {mode} of {callback} to {topic}")
+
+    def publish(self, topic):
+        with self.lock:
+            subscribers = [
+                (callback, subscription['secret'])
+                for (callback, subscribed_topic), subscription in self.subscriptions.items()
+                if subscribed_topic == topic and subscription['expires'] > time.time()
+            ]
+        if not subscribers:
+            self.stdout.write(f"No subscribers for {topic}")
+            return
+
+        try:
+            content = requests.get(topic, timeout=REQUEST_TIMEOUT)
+            content.raise_for_status()
+        except requests.RequestException as e:
+            self.stdout.write(f"Could not fetch {topic}: {str(e)}")
+            return
+
+        headers = {'Content-Type': content.headers.get('Content-Type', 'application/xml')}
+        for callback, secret in subscribers:
+            if secret:
+                headers['X-Hub-Signature'] = sign(secret, content.content)
+            try:
+                response = requests.post(callback, data=content.content, headers=headers, timeout=REQUEST_TIMEOUT)
+                self.stdout.write(f"Delivered {len(content.content)} bytes of {topic} to {callback} "
+                                  f"({response.status_code})")
+            except requests.RequestException as e:
+                self.stdout.write(f"Delivery to {callback} failed: {str(e)}")
+
+
+def make_handler(hub):
+    class HubRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with hub.lock:
+                lines = [
+                    f"{topic} -> {callback} (expires in {int(subscription['expires'] - time.time())}s)"
+                    for (callback, topic), subscription in hub.subscriptions.items()
+                ]
+            self._respond(200, '\n'.join(lines) + '\n')
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            form = {name: values[0] for name, values in parse_qs(self.rfile.read(length).decode()).items()}
+            mode = form.get('hub.mode')
+
+            if mode in ('subscribe', 'unsubscribe'):
+                callback, topic = form.get('hub.callback'), form.get('hub.topic')
+                if not callback or not topic:
+                    return self._respond(400, 'hub.callback and hub.topic are required\n')
+                lease_seconds = min(int(form.get('hub.lease_seconds') or hub.max_lease_seconds),
+                                    hub.max_lease_seconds)
+                # Verification of intent happens after the request has been accepted
+                threading.Thread(
+                    target=hub.verify, args=(mode, callback, topic, form.get('hub.secret', ''), lease_seconds)
+                ).start()
+                return self._respond(202, '')
+
+            if mode == 'publish':
+                topic = form.get('hub.url') or form.get('hub.topic')
+                if not topic:
+                    return self._respond(400, 'hub.url is required\n')
+                threading.Thread(target=hub.publish, args=(topic,)).start()
+                return self._respond(204, '')
+
+            self._respond(400, f'Unsupported hub.mode: {mode}\n')
+
+        def _respond(self, status, body):
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.end_headers()
+            if body:
+                self.wfile.write(body.encode())
+
+        def log_message(self, format, *args):
+            hub.stdout.write(f"{self.address_string()} {format % args}")
+
+    return HubRequestHandler
+
+
+class Command(BaseCommand):
+    """
+    Management command running a minimal local WebSub hub, to test push delivery without a public hub
+
+    Advertise it in a test feed (<atom:link rel="hub" href="http://localhost:8085/"/>) and publish
+    updates with: curl -d hub.mode=publish -d hub.url=<feed URL> http://localhost:8085/
+    """
+    help = 'Run a local WebSub hub for testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--host',
+            type=str,
+            default='127.0.0.1',
+            help='Interface to listen on (default: 127.0.0.1)'
+        )
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=8085,
+            help='Port to listen on (default: 8085)'
+        )
+        parser.add_argument(
+            '--max-lease-seconds',
+            type=int,
+            default=24 * 60 * 60,
+            help='Longest lease granted to subscribers (default: one day)'
+        )
+
+    def handle(self, *args, **options):
+        hub = LocalHub(self.stdout, options['max_lease_seconds'])
+        server = ThreadingHTTPServer((options['host'], options['port']), make_handler(hub))
+        self.stdout.write(self.style.SUCCESS(f"WebSub hub listening on http://{options['host']}:{options['port']}/"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
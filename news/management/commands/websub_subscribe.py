@@ -0,0 +1,98 @@
+import feedparser
+from django.core.management.base import BaseCommand, CommandError
+from requests.exceptions import RequestException
+
+from news import websub
+from news.models import Source, WebSubSubscription
+from parsers.rss.rss import RSSParser
+
+
+class Command(BaseCommand):
+    """
+    Management command to subscribe sources to their WebSub hub, or list the subscriptions
+
+    The hub is discovered from the source's feed unless given with --hub
+    """
+    help = 'Subscribe sources to WebSub hubs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'sources',
+            nargs='*',
+            help='Names of the sources to subscribe (default: list the subscriptions)'
+        )
+        parser.add_argument(
+            '--hub',
+            type=str,
+            help='Hub URL to use instead of the one advertised by the feed'
+        )
+        parser.add_argument(
+            '--topic',
+            type=str,
+            help='Topic URL to use instead of the one advertised by the feed (default: the RSS URL)'
+        )
+        parser.add_argument(
+            '--unsubscribe',
+            action='store_true',
+            help='Unsubscribe instead of subscribing'
+        )
+
+    def handle(self, *args, **options):
+        if not options['sources']:
+            self.list_subscriptions()
+            return
+
+        if not websub.is_enabled():
+            raise CommandError("Set WEBSUB_CALLBACK_BASE_URL to a URL the hub can reach")
+
+        for name in options['sources']:
+            source = Source.objects.filter(name=name).first()
+            if source is None:
+                raise CommandError(f"Unknown source: {name}")
+            try:
+                if options['unsubscribe']:
+                    self.unsubscribe(source)
+                else:
+                    self.subscribe(source, options['hub'], options['topic'])
+            except RequestException as e:
+                raise CommandError(f"Request to the hub of {name} failed: {str(e)}")
+
+    def subscribe(self, source, hub_url, topic_url):
+        if not hub_url:
+            fetched = RSSParser().fetch_source(source)
+            if fetched is None:
+                raise CommandError(f"Could not fetch the feed of {source.name}")
+            body, content_type = fetched
+            advertised = websub.discover_hub(feedparser.parse(body, response_headers={'content-type': content_type}))
+            if advertised is None:
+                raise CommandError(f"The feed of {source.name} does not advertise a hub, use --hub")
+            hub_url, topic_url = advertised[0], topic_url or advertised[1]
+
+        subscription = websub.register_hub(source, hub_url, topic_url)
+        if subscription is None:
+            # Already subscribed: renew the lease
+            subscription = source.websub
+        websub.send_request(subscription)
+        self.stdout.write(self.style.SUCCESS(
+            f"Subscription of {source.name} to {subscription.topic_url} requested, waiting for the hub to verify it"
+        ))
+
+    def unsubscribe(self, source):
+        subscription = WebSubSubscription.objects.filter(source=source).first()
+        if subscription is None:
+            raise CommandError(f"{source.name} has no WebSub subscription")
+        if source.active:
+            raise CommandError(f"Deactivate {source.name} first, the callback refuses to unsubscribe active sources")
+        websub.send_request(subscription, 'unsubscribe')
+        self.stdout.write(self.style.SUCCESS(f"Unsubscription of {source.name} requested"))
+
+    def list_subscriptions(self):
+        subscriptions = WebSubSubscription.objects.select_related('source').order_by('source__name')
+        if not subscriptions:
+            self.stdout.write("No WebSub subscriptions")
+        for subscription in subscriptions:
+            status = f"active until {subscription.lease_expires_at:%Y-%m-%d %H:%M}" if subscription.is_active \
+                else "not verified"
+            self.stdout.write(
+                f"{subscription.source.name}: {subscription.topic_url} via {subscription.hub_url}, {status}"
+            )
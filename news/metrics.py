@@ -0,0 +1,211 @@
+import bisect
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import redis
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the stage latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Metric name -> (type, help) for the Prometheus exposition
+METRICS = {
+    'news_pipeline_stage_duration_seconds': ('histogram', 'Time spent in a pipeline stage'),
+    'news_pipeline_db_queries_total': ('counter', 'Database queries executed by a pipeline stage'),
+    'news_pipeline_entries_total': ('counter', 'Feed entries by outcome (seen, deduped, parsed)'),
+    'news_pipeline_fetched_bytes_total': ('counter', 'Bytes of feed bodies fetched'),
+    'news_pipeline_import_items_total': (
+        'counter', 'Parsed articles by import outcome (imported, updated, skipped, errors)'
+    ),
+    'news_pipeline_runs_total': ('counter', 'Completed pipeline steps (parse, import)'),
+    'news_pipeline_last_run_timestamp_seconds': ('gauge', 'Unix time of the last completed pipeline step'),
+}
+
+
+def _redis_client():
+    return redis.Redis(
+        host=getattr(settings, 'REDIS_HOST', 'localhost'),
+        port=getattr(settings, 'REDIS_PORT', 6379),
+        db=getattr(settings, 'REDIS_DB', 0),
+    )
+
+
+def _labels(labels):
+    """
+    Render a sorted tuple of (name, value) label pairs in Prometheus syntax
+    """
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class RunMetrics:
+    """
+    Per-run pipeline metrics collected in memory
+
+    Stage latencies, query counts and per-source counters are kept per run for the LogStats
+    record and flushed once at the end of the run to the shared Prometheus store in Redis
+    """
+
+    def __init__(self):
+        self.stages = defaultdict(lambda: {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'queries': 0})
+        self.sources = defaultdict(lambda: defaultdict(float))
+        # (stage, source) -> per-bucket observation counts (last slot is +Inf), sum and count
+        self.histograms = defaultdict(lambda: [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0])
+        self.counters = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name, source=None):
+        """
+        Time a block of work as a pipeline stage and count the database queries it runs
+        """
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count_queries):
+                yield
+        finally:
+            self.observe(name, time.perf_counter() - start, source=source, queries=queries)
+
+    def observe(self, name, seconds, source=None, queries=0):
+        """
+        Record one execution of a stage
+        """
+        stage = self.stages[name]
+        stage['calls'] += 1
+        stage['seconds'] += seconds
+        stage['max_seconds'] = max(stage['max_seconds'], seconds)
+        stage['queries'] += queries
+
+        histogram = self.histograms[(name, source or '')]
+        histogram[0][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+        if queries:
+            self.counters[('news_pipeline_db_queries_total', (('source', source or ''), ('stage', name)))] += queries
+        if source:
+            self.sources[source][f'{name}_seconds'] += seconds
+            self.sources[source][f'{name}_queries'] += queries
+
+    def incr(self, metric, source, value=1, **labels):
+        """
+        Increment a per-source counter
+
+        The LogStats record keeps it under the label values (e.g. `deduped`), or under the
+        metric name without prefix and suffix when there are no extra labels
+        """
+        key = '_'.join(str(label) for label in labels.values())
+        key = key or metric.replace('news_pipeline_', '').replace('_total', '')
+        self.sources[source or ''][key] += value
+        self.counters[(metric, tuple(sorted({'source': source or '', **labels}.items())))] += value
+
+    def as_dict(self):
+        """
+        JSON-serializable summary for the LogStats record
+        """
+        return {
+            'stages': {name: dict(stage) for name, stage in self.stages.items()},
+            'sources': {source: dict(values) for source, values in self.sources.items()},
+        }
+
+    def flush(self, step):
+        """
+        Add this run's metrics to the shared Prometheus store
+
+        Every process (web, Celery workers, management commands) writes to the same Redis hash,
+        so the /metrics endpoint of any web process exposes the whole pipeline
+        """
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            return
+
+        key = settings.METRICS_REDIS_KEY
+        try:
+            pipe = _redis_client().pipeline(transaction=False)
+
+            for (stage, source), (buckets, total, count) in self.histograms.items():
+                labels = (('source', source), ('stage', stage))
+                # Buckets are cumulative, so adding this run's cumulative counts keeps the totals cumulative
+                cumulative = 0
+                for bound, observations in zip([*LATENCY_BUCKETS, '+Inf'], buckets):
+                    cumulative += observations
+                    field = f'news_pipeline_stage_duration_seconds_bucket{_labels(labels + (("le", bound),))}'
+                    pipe.hincrby(key, field, cumulative)
+                pipe.hincrbyfloat(key, f'news_pipeline_stage_duration_seconds_sum{_labels(labels)}', total)
+                pipe.hincrby(key, f'news_pipeline_stage_duration_seconds_count{_labels(labels)}', count)
+
+            for (metric, labels), value in self.counters.items():
+                pipe.hincrbyfloat(key, f'{metric}{_labels(labels)}', value)
+
+            step_labels = _labels((('step', step),))
+            pipe.hincrby(key, f'news_pipeline_runs_total{step_labels}', 1)
+            pipe.hset(key, f'news_pipeline_last_run_timestamp_seconds{step_labels}', time.time())
+            pipe.execute()
+        except redis.RedisError as e:
+            # Metrics are best-effort and must never fail a pipeline run
+            logger.warning(f"Could not store pipeline metrics: {str(e)}")
+
+
+def merge_summaries(into, summary):
+    """
+    Add a RunMetrics summary to another one in place (used when a run is split across tasks)
+    """
+    for section, entries in summary.items():
+        merged_section = into.setdefault(section, {})
+        for name, values in entries.items():
+            merged = merged_section.setdefault(name, {})
+            for key, value in values.items():
+                if key.startswith('max_'):
+                    merged[key] = max(merged.get(key, 0), value)
+                else:
+                    merged[key] = merged.get(key, 0) + value
+    return into
+
+
+def render_prometheus():
+    """
+    Render the shared metrics store in the Prometheus text exposition format
+    """
+    samples = _redis_client().hgetall(settings.METRICS_REDIS_KEY)
+
+    families = defaultdict(list)
+    for field, value in samples.items():
+        field, value = field.decode('utf-8'), value.decode('utf-8')
+        name = field.split('{', 1)[0]
+        for metric in METRICS:
+            if name == metric or name in (f'{metric}_bucket', f'{metric}_sum', f'{metric}_count'):
+                families[metric].append((field, value))
+                break
+
+    lines = []
+    for metric, (metric_type, description) in METRICS.items():
+        if metric not in families:
+            continue
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} {metric_type}')
+        lines.extend(f'{field} {value}' for field, value in sorted(families[metric], key=_sample_sort_key))
+    return '\n'.join(lines) + '\n'
+
+
+def _sample_sort_key(sample):
+    # Keep histogram buckets in ascending `le` order within each label set
+    field = sample[0]
+    if 'le="' in field:
+        bound = field.rsplit('le="', 1)[1].rstrip('"}')
+        return field.rsplit('le="', 1)[0], float('inf') if bound == '+Inf' else float(bound)
+    return field, 0.0
@@ -1,9 +1,39 @@
+import secrets
 import uuid
 
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import models, transaction
+from django.utils import timezone
+from .metrics import merge_summaries
 from .utils import slugify
 
 
+# Text search configuration of the news search index: no stemming, which PostgreSQL has no Ukrainian rules for
+SEARCH_CONFIG = 'simple'
+
+
+def news_search_vector():
+    """
+    Expression of the news full-text index; queries must use the same expression to be served by it
+    """
+    return SearchVector('title', 'content', config=SEARCH_CONFIG)
+
+
+def news_search_index():
+    """
+    Full-text index of news titles and bodies (admin search)
+
+    PostgreSQL only, so it is not declared in News.Meta.indexes, which would break migrate on other
+    databases: signals.create_search_index adds it after migrations instead
+    """
+    return GinIndex(news_search_vector(), name='news_search_idx')
+
+
+# (model, field name) -> max_length, filled on first use
+_FIELD_MAX_LENGTHS = {}
+
+
 class BaseModel(models.Model):
     """
     Abstract base model with common methods for all models
@@ -15,9 +45,12 @@ class BaseModel(models.Model):
     @classmethod
     def get_field_max_length(cls, field_name):
         """
-        Get max_length value for a specified field
+        Get max_length value for a specified field (looked up once per model and field)
         """
-        return cls._meta.get_field(field_name).max_length
+        key = (cls, field_name)
+        if key not in _FIELD_MAX_LENGTHS:
+            _FIELD_MAX_LENGTHS[key] = cls._meta.get_field(field_name).max_length
+        return _FIELD_MAX_LENGTHS[key]
 
     @classmethod
     def truncate_for_field(cls, value, field_name):
@@ -63,6 +96,41 @@ class Source(BaseModel):
         return self.name
 
 
+def generate_websub_secret():
+    return secrets.token_hex(32)
+
+
+class WebSubSubscription(BaseModel):
+    """
+    Model representing a WebSub (PubSubHubbub) subscription to the feed of a source
+
+    Created when a fetched feed advertises a hub; the hub then pushes new feed content to
+    our callback and the source is polled only rarely as a fallback
+    """
+    source = models.OneToOneField(Source, on_delete=models.CASCADE, related_name='websub')
+    hub_url = models.URLField(max_length=500)
+    topic_url = models.URLField(max_length=500)
+    # Shared with the hub to sign pushed content (X-Hub-Signature)
+    secret = models.CharField(max_length=64, default=generate_websub_secret)
+    # Set when the hub verifies the (re)subscription; the subscription is active until then
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    requested_at = models.DateTimeField(null=True, blank=True)
+    last_pushed_at = models.DateTimeField(null=True, blank=True)
+    last_polled_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "WebSub Subscription"
+        verbose_name_plural = "WebSub Subscriptions"
+
+    def __str__(self):
+        return f"{self.source.name} via {self.hub_url}"
+
+    @property
+    def is_active(self):
+        return self.lease_expires_at is not None and self.lease_expires_at > timezone.now()
+
+
 class Category(BaseModel):
     """
     Model representing a news category
@@ -91,6 +159,8 @@ class SiteCategory(BaseModel):
     slug = models.SlugField(max_length=150, unique=True, blank=True)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True,
                                  related_name="site_categories")
+    # Set when the category was assigned by news.category_mapping rather than in the admin
+    auto_mapped = models.BooleanField(default=False)
 
     class Meta:
         verbose_name = "Site Category"
@@ -116,13 +186,27 @@ class News(BaseModel):
     url = models.URLField(max_length=500)
     source = models.ForeignKey(Source, on_delete=models.CASCADE, related_name='news')
     site_categories = models.ManyToManyField(SiteCategory, related_name='news', blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(default=timezone.now)  # Publish time from the feed
+    created_at = models.DateTimeField(auto_now_add=True)  # Import time
+    # Hash of the title and raw content from the feed (see news.articles.content_hash), compared on re-ingest
+    content_hash = models.CharField(max_length=32, blank=True, default='')
+    revision = models.PositiveIntegerField(default=1)  # Incremented each time the feed changes the article
+    updated_at = models.DateTimeField(null=True, blank=True)  # Time of the latest revision
 
     def __str__(self):
         return self.title
 
     class Meta:
         verbose_name_plural = "News"
+        indexes = [
+            # Date-range filters and ordering by publication time (id breaks ties)
+            models.Index(fields=['published_at', 'id'], name='news_published_id_idx'),
+            # Per-source listings ordered by publication time
+            models.Index(fields=['source', 'published_at'], name='news_source_published_idx'),
+            # Stored articles looked up by URL on re-ingest
+            models.Index(fields=['url'], name='news_url_idx'),
+            # The full-text index is PostgreSQL only and added after migrations (see news_search_index)
+        ]
 
     def save(self, *args, **kwargs):
         # Ensure fields are within limits
@@ -156,10 +240,20 @@ class Tag(BaseModel):
     name = models.CharField(max_length=100)
     slug = models.SlugField(max_length=150, unique=True)
     news = models.ManyToManyField(News, related_name='tags', blank=True)
+    # Number of news with the tag, kept by the importer to rank tags (see news.autocomplete)
+    usage_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.name
 
+    class Meta:
+        indexes = [
+            # Prefix search of names (LIKE 'prefix%' whatever the database collation)
+            models.Index(fields=['name'], opclasses=['text_pattern_ops'], name='news_tag_name_prefix_idx'),
+            # Most used tags first
+            models.Index(fields=['-usage_count'], name='news_tag_usage_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if self.name:
             self.name = self.truncate_for_field(self.name, 'name')
@@ -170,15 +264,79 @@ class Tag(BaseModel):
         super().save(*args, **kwargs)
 
 
+class TermDocumentFrequency(BaseModel):
+    """
+    Number of articles a keyword term appears in, used to score keyword tags by TF-IDF
+
+    Updated incrementally with every import batch (see news.keywords). The rows of
+    news.keywords.TOTAL_TERMS add up to the number of articles counted
+    """
+    term = models.CharField(max_length=100, unique=True)
+    documents = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Term Document Frequency"
+        verbose_name_plural = "Term Document Frequencies"
+
+    def __str__(self):
+        # Rows counting all articles have an empty term or start with '#'
+        label = '(all articles)' if self.term[:1] in ('', '#') else self.term
+        return f"{label}: {self.documents}"
+
+
+class DailyCount(BaseModel):
+    """
+    Number of news published per day, in total and per source, category and tag
+
+    Updated incrementally by the importer (see news.rollups), so statistics never have to group
+    the news table. The total of a day is stored with object_id 0
+    """
+    TOTAL = 'total'
+    SOURCE = 'source'
+    CATEGORY = 'category'
+    TAG = 'tag'
+    DIMENSIONS = [
+        (TOTAL, 'Total'),
+        (SOURCE, 'Source'),
+        (CATEGORY, 'Category'),
+        (TAG, 'Tag'),
+    ]
+
+    date = models.DateField()
+    dimension = models.CharField(max_length=20, choices=DIMENSIONS)
+    object_id = models.PositiveIntegerField(default=0)  # ID of the source, category or tag
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Daily Count"
+        verbose_name_plural = "Daily Counts"
+        constraints = [
+            # Target of the importer's upserts; also serves the series of a single source, category or tag
+            models.UniqueConstraint(fields=['dimension', 'object_id', 'date'], name='news_dailycount_unique'),
+        ]
+        indexes = [
+            # Rankings of a dimension over a date range
+            models.Index(fields=['dimension', 'date'], name='news_dailycount_dimension_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.dimension} {self.object_id}: {self.count}"
+
+
 class LogStats(BaseModel):
     """
     Model for tracking news import statistics
     """
     imported = models.IntegerField(default=0)
+    updated = models.IntegerField(default=0)
     skipped = models.IntegerField(default=0)
     errors = models.IntegerField(default=0)
     started_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
+    # Per-stage and per-source metrics of the run, see news.metrics.RunMetrics
+    metrics = models.JSONField(default=dict, blank=True)
+    # Profiles of runs started with --profile, keyed by pipeline step, see news.profiling.RunProfiler
+    profile = models.JSONField(default=dict, blank=True)
 
     class Meta:
         verbose_name = "Statistics"
@@ -186,3 +344,27 @@ class LogStats(BaseModel):
 
     def __str__(self):
         return f"Import {self.started_at.strftime('%Y-%m-%d %H:%M:%S')} - {self.imported} imported"
+
+    @classmethod
+    def record_metrics(cls, stats_id, run_metrics):
+        """
+        Add the summary of a pipeline step (see RunMetrics.as_dict) to a run's metrics
+        """
+        with transaction.atomic():
+            stats = cls.objects.select_for_update().filter(id=stats_id).first()
+            if stats is None:
+                return
+            merge_summaries(stats.metrics, run_metrics)
+            stats.save(update_fields=['metrics'])
+
+    @classmethod
+    def record_profile(cls, stats_id, step, report):
+        """
+        Store the profile report of a pipeline step (parse, import) with a run
+        """
+        with transaction.atomic():
+            stats = cls.objects.select_for_update().filter(id=stats_id).first()
+            if stats is None:
+                return
+            stats.profile[step] = report
+            stats.save(update_fields=['profile'])
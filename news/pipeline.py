@@ -0,0 +1,100 @@
+import redis
+from django.conf import settings
+
+# Raw feed bodies downloaded by the fetch tasks, waiting to be parsed (one hash per run)
+RAW_FEEDS_KEY = 'rss_raw_feeds'
+# Parsed articles waiting to be imported (one list per run, read by import_news_from_redis)
+PARSED_NEWS_KEY = 'rss_parsed_news'
+# Set when a run was requested while another one was in progress
+FOLLOW_UP_RUN_KEY = 'news:pipeline:follow_up'
+# Hand-off data of a run that never completed is dropped after this many seconds
+PAYLOAD_TTL = 6 * 60 * 60
+
+
+def get_redis_client():
+    return redis.Redis(
+        host=getattr(settings, 'REDIS_HOST', 'localhost'),
+        port=getattr(settings, 'REDIS_PORT', 6379),
+        db=getattr(settings, 'REDIS_DB', 0),
+    )
+
+
+def raw_feeds_key(run_id):
+    return f'{RAW_FEEDS_KEY}:{run_id}'
+
+
+def parsed_news_key(run_id):
+    return f'{PARSED_NEWS_KEY}:{run_id}'
+
+
+def store_raw_feed(run_id, source_id, body, content_type):
+    """
+    Keep a downloaded feed body for the parse step of a run
+    """
+    key = raw_feeds_key(run_id)
+    pipe = get_redis_client().pipeline()
+    pipe.hset(key, mapping={f'{source_id}:body': body, f'{source_id}:type': content_type})
+    pipe.expire(key, PAYLOAD_TTL)
+    pipe.execute()
+
+
+def pop_raw_feed(run_id, source_id):
+    """
+    Take the stored feed body of a source out of Redis
+
+    Returns (body, content type), or None if the feed was not fetched
+    """
+    key = raw_feeds_key(run_id)
+    fields = [f'{source_id}:body', f'{source_id}:type']
+    pipe = get_redis_client().pipeline()
+    pipe.hmget(key, fields)
+    pipe.hdel(key, *fields)
+    (body, content_type), _ = pipe.execute()
+
+    if body is None:
+        return None
+    return body, (content_type or b'').decode('utf-8')
+
+
+def push_parsed_articles(run_id, articles):
+    """
+    Append parsed Article records to the hand-off queue of a run, read by its import step
+
+    Parse tasks of different sources append to the same list concurrently
+    """
+    if not articles:
+        return
+    key = parsed_news_key(run_id)
+    pipe = get_redis_client().pipeline()
+    pipe.rpush(key, *(article.to_json() for article in articles))
+    pipe.expire(key, PAYLOAD_TTL)
+    pipe.execute()
+
+
+def delete_run_payload(run_id):
+    """
+    Drop the hand-off data of a run once it has been imported
+    """
+    get_redis_client().delete(raw_feeds_key(run_id), parsed_news_key(run_id))
+
+
+def request_follow_up_run():
+    """
+    Ask the run in progress to start another one when it finishes
+
+    Any number of requests made during one run result in a single follow-up run
+    """
+    get_redis_client().set(FOLLOW_UP_RUN_KEY, 1, ex=PAYLOAD_TTL)
+
+
+def take_follow_up_run():
+    """
+    Return True (once) if a follow-up run was requested
+
+    GET and DEL in one MULTI rather than GETDEL, which needs Redis 6.2
+    """
+    pipe = get_redis_client().pipeline()
+    pipe.get(FOLLOW_UP_RUN_KEY)
+    pipe.delete(FOLLOW_UP_RUN_KEY)
+    requested, _ = pipe.execute()
+    return bool(requested)
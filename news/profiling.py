@@ -0,0 +1,130 @@
+import cProfile
+import pstats
+import re
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+from .models import LogStats
+
+DEFAULT_TOP_N = 30
+
+# Savepoint names are unique per transaction; strip them so savepoint statements are grouped
+SAVEPOINT_NAME_RE = re.compile(r'"s\d+_x\d+"')
+
+
+class RunProfiler:
+    """
+    Profile a pipeline run with cProfile and time every SQL query it executes
+
+    Queries are grouped by their SQL text (parameters are not part of it), so a query
+    repeated for every article shows up once with its call count and total time
+    """
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.queries = defaultdict(lambda: {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+        self.wall_seconds = 0.0
+
+    def _time_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            query = self.queries[SAVEPOINT_NAME_RE.sub('"<savepoint>"', sql)]
+            query['calls'] += 1
+            query['seconds'] += elapsed
+            query['max_seconds'] = max(query['max_seconds'], elapsed)
+
+    @contextmanager
+    def profile(self):
+        """
+        Profile the code run inside the block
+        """
+        start = time.perf_counter()
+        with connection.execute_wrapper(self._time_query):
+            self.profiler.enable()
+            try:
+                yield self
+            finally:
+                self.profiler.disable()
+                self.wall_seconds += time.perf_counter() - start
+
+    def report(self, top_n=DEFAULT_TOP_N):
+        """
+        JSON-serializable summary: the functions with most own time and the slowest queries by total time
+        """
+        stats = pstats.Stats(self.profiler).stats
+        functions = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:top_n]
+        queries = sorted(self.queries.items(), key=lambda item: item[1]['seconds'], reverse=True)[:top_n]
+
+        return {
+            'wall_seconds': self.wall_seconds,
+            'query_count': sum(query['calls'] for query in self.queries.values()),
+            'query_seconds': sum(query['seconds'] for query in self.queries.values()),
+            'functions': [
+                {
+                    'function': f"{filename}:{line}({name})",
+                    'calls': calls,
+                    'tottime': tottime,
+                    'cumtime': cumtime,
+                }
+                for (filename, line, name), (_, calls, tottime, cumtime, _) in functions
+            ],
+            'queries': [dict(values, sql=sql) for sql, values in queries],
+        }
+
+
+def format_profile_report(report, title=''):
+    """
+    Plain-text rendering of a RunProfiler report
+    """
+    lines = []
+    if title:
+        lines.append(f"== {title} ==")
+    lines.append(
+        f"Wall time {report['wall_seconds']:.3f}s, "
+        f"{report['query_count']} queries taking {report['query_seconds']:.3f}s"
+    )
+
+    lines.append("")
+    lines.append("Hot functions (by own time):")
+    lines.append(f"{'tottime':>10} {'cumtime':>10} {'calls':>9}  function")
+    for function in report['functions']:
+        lines.append(
+            f"{function['tottime']:10.4f} {function['cumtime']:10.4f} {function['calls']:9d}  {function['function']}"
+        )
+
+    lines.append("")
+    lines.append("Slowest queries (by total time):")
+    lines.append(f"{'total':>10} {'max':>10} {'calls':>9}  sql")
+    for query in report['queries']:
+        sql = ' '.join(query['sql'].split())
+        lines.append(f"{query['seconds']:10.4f} {query['max_seconds']:10.4f} {query['calls']:9d}  {sql}")
+
+    return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def profile_run(enabled, step, stats_id=None, stdout=None):
+    """
+    Profile the block if enabled, print the report and store it with the LogStats record of the run
+    """
+    if not enabled:
+        yield None
+        return
+
+    profiler = RunProfiler()
+    try:
+        with profiler.profile():
+            yield profiler
+    finally:
+        report = profiler.report(settings.PROFILE_TOP_N)
+        if stdout is not None:
+            stdout.write(format_profile_report(report, title=f"{step} profile"))
+        if stats_id:
+            LogStats.record_profile(stats_id, step, report)
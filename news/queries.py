@@ -0,0 +1,140 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+DEFAULT_SORT = '-published_at'
+ALLOWED_SORTS = ['published_at', '-published_at']
+# Sort values used before news were ordered by publication time
+LEGACY_SORTS = {'created_at': 'published_at', '-created_at': '-published_at'}
+
+
+def _clean_list(values):
+    """
+    Remove empty strings from a list of query parameter values
+    """
+    return [value for value in values if value]
+
+
+def _parse_ids(values, strict):
+    """
+    Turn query parameter values into integer IDs
+
+    Invalid values are dropped, or raise ValueError if `strict` is set
+    """
+    ids = []
+    for value in _clean_list(values):
+        try:
+            ids.append(int(value))
+        except ValueError:
+            if strict:
+                raise ValueError(f"'{value}' is not a valid ID")
+    return ids
+
+
+def parse_news_filters(params, strict=False):
+    """
+    Parse news list filters from a QueryDict (request.GET or request.query_params)
+
+    Returns a dictionary with normalized filter values shared by the HTML views and the API.
+    Invalid source IDs are ignored, or raise ValueError if `strict` is set (the API answers 400)
+    """
+    sort_by = params.get('sort', DEFAULT_SORT)
+    sort_by = LEGACY_SORTS.get(sort_by, sort_by)
+    if sort_by not in ALLOWED_SORTS:
+        sort_by = DEFAULT_SORT
+
+    return {
+        'query': params.get('q'),
+        'sources': _parse_ids(params.getlist('source'), strict),
+        'categories': _clean_list(params.getlist('category')),
+        'tags': _clean_list(params.getlist('tag')),
+        'date_range': params.get('date_range'),
+        'sort': sort_by,
+    }
+
+
+def parse_stats_period(params):
+    """
+    Parse the date range of the statistics page and API from a QueryDict
+
+    Accepts `date_range` in the index filter format ("2024-05-01 to 2024-05-31" or a single day)
+    or `days` (the last N days, default STATS_DEFAULT_DAYS). Returns (date_from, date_to);
+    raises ValueError for invalid values or ranges longer than STATS_MAX_DAYS
+    """
+    date_range = params.get('date_range')
+    if date_range:
+        start, _, end = date_range.partition(' to ')
+        date_from = datetime.strptime(start.strip(), '%Y-%m-%d').date()
+        date_to = datetime.strptime((end or start).strip(), '%Y-%m-%d').date()
+    else:
+        days = int(params.get('days') or settings.STATS_DEFAULT_DAYS)
+        if days < 1:
+            raise ValueError("days must be positive")
+        date_to = timezone.localdate()
+        date_from = date_to - timedelta(days=days - 1)
+
+    if date_from > date_to:
+        raise ValueError("The range must not end before it starts")
+    if (date_to - date_from).days >= settings.STATS_MAX_DAYS:
+        raise ValueError(f"The range must not be longer than {settings.STATS_MAX_DAYS} days")
+    return date_from, date_to
+
+
+def _day_start(day):
+    """
+    Start of the given day in the current time zone as an aware datetime
+    """
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def filter_news(queryset, filters):
+    """
+    Apply parsed filters (see parse_news_filters) to a News queryset
+    """
+    # Handle search query
+    query = filters['query']
+    if query:
+        queryset = queryset.filter(
+            Q(title__icontains=query) |
+            Q(content__icontains=query)
+        )
+
+    # Handle multiple source filters (OR logic within sources)
+    if filters['sources']:
+        queryset = queryset.filter(source__id__in=filters['sources'])
+
+    # Handle multiple category filters (OR logic within categories)
+    if filters['categories']:
+        queryset = queryset.filter(site_categories__category__slug__in=filters['categories'])
+
+    # Handle multiple tag filters (OR logic within tags)
+    if filters['tags']:
+        queryset = queryset.filter(tags__slug__in=filters['tags'])
+
+    # Handle date range filtering
+    # Dates are turned into half-open timestamp ranges [start, end) so the published_at index can be used
+    date_range = filters['date_range']
+    if date_range:
+        try:
+            # Handle single date or date range
+            if ' to ' in date_range:
+                # Date range
+                start_date_str, end_date_str = date_range.split(' to ')
+                start_date = datetime.strptime(start_date_str.strip(), '%Y-%m-%d').date()
+                end_date = datetime.strptime(end_date_str.strip(), '%Y-%m-%d').date()
+            else:
+                # Single date
+                start_date = end_date = datetime.strptime(date_range.strip(), '%Y-%m-%d').date()
+
+            # Filter by date range (inclusive of the end date)
+            queryset = queryset.filter(
+                published_at__gte=_day_start(start_date),
+                published_at__lt=_day_start(end_date + timedelta(days=1))
+            )
+        except (ValueError, AttributeError):
+            # Invalid date format, ignore filter
+            pass
+
+    return queryset.distinct().order_by(filters['sort'])
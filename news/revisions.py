@@ -0,0 +1,49 @@
+from django.db.models import TextField, Value
+from django.db.models.functions import MD5, Concat
+from django.utils import timezone
+
+from .articles import content_hash
+from .models import News
+
+# News per update of re-ingested articles
+UPDATE_CHUNK = 500
+
+REVISED_FIELDS = ['title', 'content', 'content_hash', 'revision', 'updated_at']
+
+
+def apply_revisions(changes):
+    """
+    Store the new title and content of re-ingested articles, given a dict of news ID -> Article
+
+    Per chunk, the stored rows are locked in ID order (so concurrent importers cannot deadlock) and
+    read with a hash of their title and content instead of the text itself, then those whose content
+    hash differs are written with one bulk_update. The revision is only incremented (and updated_at
+    set) when the title or content actually changed; otherwise only the hash is refreshed, e.g. for
+    markup the cleaner removes anyway.
+
+    Returns (id, slug, source_id) of the news whose title or content changed
+    """
+    news_ids = sorted(changes)
+    updated_at = timezone.now()
+
+    revised = []
+    for start in range(0, len(news_ids), UPDATE_CHUNK):
+        stored = (
+            News.objects.select_for_update().filter(id__in=news_ids[start:start + UPDATE_CHUNK]).order_by('id')
+            .annotate(text_hash=MD5(Concat('title', Value('\n'), 'content', output_field=TextField())))
+            .values_list('id', 'slug', 'source_id', 'revision', 'updated_at', 'content_hash', 'text_hash')
+        )
+        updates = []
+        for news_id, slug, source_id, revision, row_updated_at, stored_hash, text_hash in stored:
+            article = changes[news_id]
+            if stored_hash == article.content_hash:
+                continue
+            news = News(id=news_id, title=article.title, content=article.content, content_hash=article.content_hash,
+                        revision=revision, updated_at=row_updated_at)
+            if text_hash != content_hash(article.title, article.content):
+                news.revision += 1
+                news.updated_at = updated_at
+                revised.append((news_id, slug, source_id))
+            updates.append(news)
+        News.objects.bulk_update(updates, REVISED_FIELDS)
+    return revised
@@ -0,0 +1,174 @@
+import logging
+from datetime import datetime, time, timedelta
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import Category, DailyCount, News, Source, Tag
+
+logger = logging.getLogger(__name__)
+
+# Rows per multi-row upsert of the daily counts
+UPSERT_CHUNK = 500
+
+# Dimension -> model whose objects are counted
+DIMENSION_MODELS = {
+    DailyCount.SOURCE: Source,
+    DailyCount.CATEGORY: Category,
+    DailyCount.TAG: Tag,
+}
+
+
+def news_date(published_at):
+    """
+    Day an article is counted on (in the TIME_ZONE setting)
+    """
+    return timezone.localdate(published_at)
+
+
+def count_article(counts, published_at, source_id, category_ids=(), tag_ids=()):
+    """
+    Add one article to a Counter of (date, dimension, object_id) -> count
+    """
+    day = news_date(published_at)
+    counts[(day, DailyCount.TOTAL, 0)] += 1
+    counts[(day, DailyCount.SOURCE, source_id)] += 1
+    for category_id in set(category_ids):
+        counts[(day, DailyCount.CATEGORY, category_id)] += 1
+    for tag_id in set(tag_ids):
+        counts[(day, DailyCount.TAG, tag_id)] += 1
+
+
+def record_daily_counts(counts):
+    """
+    Add a Counter of (date, dimension, object_id) -> count to the daily counts
+
+    Called once per committed import batch. Rows are upserted in key order, so concurrent
+    importers lock them in the same order and cannot deadlock. A failure is only logged:
+    `repair_daily_counts` recounts the affected days
+    """
+    rows = sorted((day, dimension, object_id, count) for (day, dimension, object_id), count in counts.items() if count)
+    if not rows:
+        return
+
+    table = connection.ops.quote_name(DailyCount._meta.db_table)
+    try:
+        with transaction.atomic():
+            for start in range(0, len(rows), UPSERT_CHUNK):
+                chunk = rows[start:start + UPSERT_CHUNK]
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"INSERT INTO {table} (date, dimension, object_id, count) "
+                        f"VALUES {', '.join(['(%s, %s, %s, %s)'] * len(chunk))} "
+                        f"ON CONFLICT (dimension, object_id, date) "
+                        f"DO UPDATE SET count = {table}.count + EXCLUDED.count",
+                        [value for row in chunk for value in row]
+                    )
+    except DatabaseError as e:
+        logger.warning(f"Could not update daily counts of {len({row[0] for row in rows})} days: {str(e)}")
+
+
+def recount_day(day):
+    """
+    Replace the daily counts of one day with counts grouped from the news table
+
+    Returns the number of news published that day
+    """
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    news = News.objects.filter(published_at__gte=start, published_at__lt=end)
+    in_day = {'news__published_at__gte': start, 'news__published_at__lt': end}
+
+    grouped = {
+        DailyCount.SOURCE: news.values_list('source_id').annotate(count=Count('id')),
+        DailyCount.TAG: Tag.news.through.objects.filter(**in_day).values_list('tag_id').annotate(count=Count('id')),
+        # An article is counted once per category, however many of its site categories map to it
+        DailyCount.CATEGORY: News.site_categories.through.objects.filter(
+            sitecategory__category__isnull=False, **in_day
+        ).values_list('sitecategory__category_id').annotate(count=Count('news_id', distinct=True)),
+    }
+
+    total = news.count()
+    rows = [DailyCount(date=day, dimension=DailyCount.TOTAL, object_id=0, count=total)] if total else []
+    for dimension, queryset in grouped.items():
+        rows.extend(
+            DailyCount(date=day, dimension=dimension, object_id=object_id, count=count)
+            for object_id, count in queryset
+        )
+
+    with transaction.atomic():
+        DailyCount.objects.filter(date=day).delete()
+        DailyCount.objects.bulk_create(rows, batch_size=UPSERT_CHUNK)
+    return total
+
+
+def describe(dimension, object_ids):
+    """
+    Name and slug (the ID for sources, which have no slug) of each counted object
+    """
+    model = DIMENSION_MODELS[dimension]
+    fields = ['id', 'name'] if model is Source else ['id', 'name', 'slug']
+    described = {}
+    for row in model.objects.filter(id__in=object_ids).values_list(*fields):
+        described[row[0]] = {'name': row[1], 'slug': row[2] if len(row) > 2 else str(row[0])}
+    return described
+
+
+def resolve_slugs(dimension, slugs):
+    """
+    IDs of the sources (given by ID), categories or tags (given by slug) to count
+    """
+    model = DIMENSION_MODELS[dimension]
+    if model is Source:
+        return [int(slug) for slug in slugs if slug.isdigit()]
+    return list(model.objects.filter(slug__in=slugs).values_list('id', flat=True))
+
+
+def _fill_days(counts, date_from, date_to):
+    days = (date_to - date_from).days + 1
+    return [
+        {'date': day, 'count': counts.get(day, 0)}
+        for day in (date_from + timedelta(days=offset) for offset in range(days))
+    ]
+
+
+def daily_totals(date_from, date_to):
+    """
+    Number of news per day over a date range (inclusive), days without news included
+    """
+    counts = DailyCount.objects.filter(
+        dimension=DailyCount.TOTAL, date__gte=date_from, date__lte=date_to
+    ).values_list('date', 'count')
+    return _fill_days(dict(counts), date_from, date_to)
+
+
+def top_objects(dimension, date_from, date_to, limit=10, object_ids=None, daily=False):
+    """
+    Sources, categories or tags with the most news over a date range (inclusive)
+
+    Returns dicts of slug, name and count, and with `daily` the count of every day as well
+    """
+    queryset = DailyCount.objects.filter(dimension=dimension, date__gte=date_from, date__lte=date_to)
+    if object_ids is not None:
+        queryset = queryset.filter(object_id__in=object_ids)
+
+    totals = dict(
+        queryset.values('object_id').annotate(total=Sum('count'))
+        .order_by('-total', 'object_id').values_list('object_id', 'total')[:limit]
+    )
+    described = describe(dimension, list(totals))
+    results = {
+        object_id: dict(described[object_id], count=count)
+        for object_id, count in totals.items() if object_id in described
+    }
+
+    if daily and results:
+        counts = {object_id: {} for object_id in results}
+        daily_counts = queryset.filter(object_id__in=list(results)).values_list('object_id', 'date', 'count')
+        for object_id, day, count in daily_counts:
+            counts[object_id][day] = count
+        for object_id, result in results.items():
+            result['daily'] = _fill_days(counts[object_id], date_from, date_to)
+
+    return list(results.values())
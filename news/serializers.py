@@ -0,0 +1,77 @@
+from rest_framework import serializers
+
+from .models import News, Source, SiteCategory, Tag
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin that limits output to the fields listed in the `fields` query parameter
+    (e.g. ?fields=id,title,url)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        requested = get_requested_fields(self.context.get('request'))
+        if requested:
+            for field_name in set(self.fields) - requested:
+                self.fields.pop(field_name)
+
+
+def get_requested_fields(request):
+    """
+    Return the set of field names requested via `fields=`, or None if not restricted
+    """
+    if request is None:
+        return None
+
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+
+    requested = {field.strip() for field in fields.split(',') if field.strip()}
+    return requested or None
+
+
+class SourceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Source
+        fields = ('id', 'name', 'url', 'rss_url', 'active')
+
+
+class TagSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = ('id', 'name', 'slug')
+
+
+class SiteCategorySerializer(serializers.ModelSerializer):
+    category = serializers.SlugRelatedField(slug_field='slug', read_only=True)
+
+    class Meta:
+        model = SiteCategory
+        fields = ('name', 'slug', 'category')
+
+
+class NewsSourceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Source
+        fields = ('id', 'name')
+
+
+class NewsTagSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = ('name', 'slug')
+
+
+class NewsSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    source = NewsSourceSerializer(read_only=True)
+    site_categories = SiteCategorySerializer(many=True, read_only=True)
+    tags = NewsTagSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = News
+        fields = (
+            'id', 'title', 'slug', 'content', 'url', 'source', 'site_categories', 'tags', 'published_at', 'created_at'
+        )
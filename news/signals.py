@@ -0,0 +1,80 @@
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import invalidate_article
+from .category_mapping import bump_mapping_version, mapper
+from .models import Category, News, SiteCategory, news_search_index
+
+
+@receiver(post_save, sender=News)
+def invalidate_news_page_on_save(sender, instance, created, **kwargs):
+    """
+    Drop the cached article page when an existing article is edited
+    """
+    if not created:
+        invalidate_article(instance.slug)
+
+
+@receiver(post_delete, sender=News)
+def invalidate_news_page_on_delete(sender, instance, **kwargs):
+    invalidate_article(instance.slug)
+
+
+@receiver(pre_save, sender=SiteCategory)
+def map_new_site_category(sender, instance, raw=False, **kwargs):
+    """
+    Assign a category to new site categories (memoized in-process)
+
+    The category is confirmed to still exist, as it may have been deleted since this process
+    built its index; assigning it would fail the foreign key check of the whole transaction
+    """
+    if raw or not instance._state.adding or instance.category_id is not None:
+        return
+    category_id = mapper.classify(instance.name)
+    if category_id is not None and not Category.objects.filter(id=category_id).exists():
+        mapper.reset()
+        category_id = mapper.classify(instance.name)
+    instance.category_id = category_id
+    instance.auto_mapped = instance.category_id is not None
+
+
+@receiver(post_save, sender=SiteCategory)
+def learn_manual_mapping(sender, instance, **kwargs):
+    """
+    Site categories mapped by hand become examples for the mapper
+    """
+    if instance.category_id is not None and not instance.auto_mapped:
+        mapper.reset()
+        transaction.on_commit(bump_mapping_version)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def reset_category_mapper(sender, **kwargs):
+    """
+    Rebuild the index here right away, and in the other processes once the change is committed
+    """
+    mapper.reset()
+    transaction.on_commit(bump_mapping_version)
+
+
+@receiver(post_migrate)
+def create_search_index(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Add the full-text index of news after migrations, on PostgreSQL only (see news_search_index)
+    """
+    connection = connections[using]
+    if (sender.label != News._meta.app_label or connection.vendor != 'postgresql'
+            or not router.allow_migrate_model(using, News)):
+        return
+
+    index = news_search_index()
+    table = News._meta.db_table
+    with connection.cursor() as cursor:
+        if table not in connection.introspection.table_names(cursor):
+            return
+        if index.name in connection.introspection.get_constraints(cursor, table):
+            return
+    with connection.schema_editor() as schema_editor:
+        schema_editor.add_index(News, index)
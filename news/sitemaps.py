@@ -0,0 +1,79 @@
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Max, Min
+from django.urls import reverse
+
+from .models import News
+
+SITEMAP_NAMESPACE = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+# News fetched per query while a sitemap page streams
+SITEMAP_CHUNK_SIZE = 2000
+
+
+def sitemap_pages(queryset):
+    """
+    Numbers of the sitemap pages holding news: page N covers IDs [N * SITEMAP_PAGE_SIZE, (N + 1) * SITEMAP_PAGE_SIZE)
+
+    Pages are fixed ID ranges, so they are found from the lowest and highest IDs (two index lookups)
+    and an article stays on the same page as news are added and pruned
+    """
+    bounds = queryset.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return range(0)
+    return range(bounds['low'] // settings.SITEMAP_PAGE_SIZE, bounds['high'] // settings.SITEMAP_PAGE_SIZE + 1)
+
+
+def iter_page_news(queryset, page, chunk_size=SITEMAP_CHUNK_SIZE):
+    """
+    Yield (slug, time of the latest change) of the news of a sitemap page, a keyset-paginated chunk at a time
+    """
+    last_id = page * settings.SITEMAP_PAGE_SIZE - 1
+    end = (page + 1) * settings.SITEMAP_PAGE_SIZE
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id, id__lt=end).order_by('id')
+            .values_list('id', 'slug', 'created_at', 'updated_at')[:chunk_size]
+        )
+        if not rows:
+            return
+        for _, slug, created_at, updated_at in rows:
+            yield slug, updated_at or created_at
+        last_id = rows[-1][0]
+
+
+def render_sitemap_index(base_url, pages):
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', f'<sitemapindex xmlns="{SITEMAP_NAMESPACE}">']
+    for page in pages:
+        lines.append(f"<sitemap><loc>{escape(base_url + reverse('sitemap_page', args=[page]))}</loc></sitemap>")
+    lines.append('</sitemapindex>')
+    return '\n'.join(lines) + '\n'
+
+
+def stream_sitemap_page(base_url, queryset, page):
+    """
+    Generate a sitemap page without loading more than one chunk of news at a time
+    """
+    # Article URLs only differ by slug; reverse once instead of once per article
+    prefix, _, suffix = reverse('news_detail', args=['slug']).rpartition('slug')
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NAMESPACE}">\n'
+    lines = []
+    for slug, modified_at in iter_page_news(queryset, page):
+        lines.append(f"<url><loc>{escape(base_url + prefix + slug + suffix)}</loc>"
+                     f"<lastmod>{modified_at.date().isoformat()}</lastmod></url>\n")
+        if len(lines) >= SITEMAP_CHUNK_SIZE:
+            yield ''.join(lines)
+            lines = []
+    lines.append('</urlset>\n')
+    yield ''.join(lines)
+
+
+def news_queryset():
+    """
+    News for the sitemap on the database chosen for the request
+
+    The alias is resolved while the view runs, as the streamed response is generated after the
+    replica routing of the request ends
+    """
+    return News.objects.using(News.objects.db)
@@ -1,30 +1,209 @@
+import logging
+from contextlib import contextmanager
+from datetime import timedelta
+
 from celery import shared_task
 from django.core.management import call_command
 from django.utils import timezone
-from celery import chain
+from celery import chain, chord
 from django.conf import settings
 
-from .models import LogStats
+from parsers.rss.rss import RSSParser
+from redis.exceptions import RedisError
+from requests.exceptions import RequestException
+from . import websub
+from .feeds import refresh_stale_feeds
+from .locks import LeaseLost, holding, run_lease, source_lease
+from .management.commands.import_news_from_redis import NewsImporter
+from .metrics import merge_summaries
+from .models import LogStats, Source, WebSubSubscription
+from .pipeline import (
+    delete_run_payload, parsed_news_key, pop_raw_feed, push_parsed_articles, request_follow_up_run,
+    store_raw_feed, take_follow_up_run,
+)
+from .profiling import profile_run
+from .trending import compute_trending
+
+logger = logging.getLogger(__name__)
+
+
+def _profile_enabled(profile):
+    return settings.PIPELINE_PROFILE if profile is None else profile
+
+
+def _resume_run_lease(lease_token):
+    """
+    Renew the lease of the pipeline run as one of its steps starts
+
+    A lease that ran out while the step waited in its queue is taken again. Raises LeaseLost if
+    another run holds it meanwhile: the step must not overlap with that run
+    """
+    lease = run_lease(lease_token)
+    if not lease.resume():
+        raise LeaseLost("The pipeline run lease expired and another run holds it now")
+    return lease
+
+
+@contextmanager
+def _renewing_run_lease(lease_token):
+    """
+    Keep the lease of the pipeline run alive while one of its steps works
+    """
+    if not lease_token:
+        yield None
+        return
+
+    lease = _resume_run_lease(lease_token)
+    with lease.heartbeat():
+        yield lease
 
 
 @shared_task
-def parse_rss_task():
+def parse_rss_task(profile=None):
     """
     Task for running RSS parser management command
+    Profiles the run if `profile` is set (defaults to the PIPELINE_PROFILE setting)
     """
     # Create initial import stats record
     import_stats = LogStats.objects.create()
 
-    call_command('rss_parse')
+    call_command(
+        'rss_parse',
+        redis_key=parsed_news_key(import_stats.id),
+        stats_id=import_stats.id,
+        profile=_profile_enabled(profile)
+    )
 
     # Return the ID of the stats record to be used by the next task
     return import_stats.id
 
 
-@shared_task
-def import_news_task(stats_id):
+@shared_task(bind=True, acks_late=True)
+def fetch_feed_task(self, source, run_id, lease_token=None):
+    """
+    Task for downloading the feed of one source for the parse step of a run
+    Runs on the fetch queue (gevent pool) and does not touch the database
+
+    A failed download is retried for this source alone; once the retries are used up the
+    source is left out of the run instead of failing it. The run lease is renewed as each
+    download starts, so it does not run out while downloads wait in the queue
+    """
+    rss_parser = RSSParser()
+    fetched = None
+    locked = False
+
+    try:
+        if lease_token:
+            _resume_run_lease(lease_token)
+        with holding(source_lease(source['id'])) as acquired:
+            if not acquired:
+                locked = True
+                logger.info(f"Source {source['name']} is being fetched by another worker, skipping")
+            else:
+                fetched = rss_parser.fetch_source(
+                    Source(id=source['id'], name=source['name'], rss_url=source['rss_url'])
+                )
+                if fetched is not None:
+                    store_raw_feed(run_id, source['id'], *fetched)
+    except LeaseLost as e:
+        logger.warning(f"Skipping source {source['name']}: {str(e)}")
+        return {'source_id': source['id'], 'fetched': False, 'metrics': rss_parser.metrics.as_dict()}
+    except RedisError as e:
+        # Retried like a failed download; a failed task would fail the whole run's chord
+        logger.error(f"Could not hand over the feed of {source['name']}: {str(e)}")
+        fetched = None
+
+    rss_parser.metrics.flush('fetch')
+
+    if fetched is None and not locked and self.request.retries < settings.FETCH_MAX_RETRIES:
+        raise self.retry(countdown=settings.FETCH_RETRY_DELAY * 2 ** self.request.retries)
+
+    return {'source_id': source['id'], 'fetched': fetched is not None, 'metrics': rss_parser.metrics.as_dict()}
+
+
+@shared_task(acks_late=True)
+def parse_feed_task(fetch_result, run_id, profile=None, lease_token=None):
+    """
+    Task for parsing and cleaning the feed of one source downloaded by fetch_feed_task
+    Appends the articles to the run's hand-off queue in Redis and stores the source's metrics
+    """
+    try:
+        with _renewing_run_lease(lease_token):
+            rss_parser = RSSParser()
+            source = Source.objects.filter(id=fetch_result['source_id']).first()
+            feed = pop_raw_feed(run_id, fetch_result['source_id']) if fetch_result['fetched'] else None
+
+            if source is not None and feed is not None:
+                body, content_type = feed
+                with profile_run(_profile_enabled(profile), f'parse {source.name}', run_id):
+                    push_parsed_articles(run_id, rss_parser.parse_feed(source, body, content_type))
+                _subscribe_advertised_hubs(rss_parser)
+                WebSubSubscription.objects.filter(source=source).update(last_polled_at=timezone.now())
+
+            rss_parser.metrics.flush('parse')
+            LogStats.record_metrics(
+                run_id, merge_summaries(rss_parser.metrics.as_dict(), fetch_result['metrics'])
+            )
+    except LeaseLost as e:
+        logger.warning(f"Skipping the parse of source {fetch_result['source_id']}: {str(e)}")
+    except Exception as e:
+        # The import step runs only once every parse task has returned: a failure here must leave
+        # this source out of the run rather than lose the articles of all the others
+        logger.error(f"Parse step of source {fetch_result['source_id']} failed: {str(e)}", exc_info=True)
+    return fetch_result['source_id']
+
+
+@shared_task(acks_late=True)
+def import_news_task(stats_id, profile=None, lease_token=None):
     """
     Task for importing news from Redis to database
+    Profiles the run if `profile` is set (defaults to the PIPELINE_PROFILE setting)
+
+    As the last step of a pipeline run it starts the refresh of the outgoing feeds, releases the
+    run lease and starts the follow-up run if another run was requested meanwhile. If another run
+    took over the lease, the articles are dropped rather than imported alongside it: that run
+    fetches them again
+    """
+    lease = None
+    try:
+        with _renewing_run_lease(lease_token) as lease:
+            result = _import_run(stats_id, profile)
+            delete_run_payload(stats_id)
+    except LeaseLost as e:
+        logger.warning(f"Dropping the articles of pipeline run {stats_id}: {str(e)}")
+        delete_run_payload(stats_id)
+        return None
+    finally:
+        # Also when the import failed: the next run must not wait for the lease to run out, nor
+        # lose the follow-up run requested meanwhile
+        if lease is not None:
+            lease.release()
+            if take_follow_up_run():
+                logger.info("Starting the pipeline run requested while the previous one was in progress")
+                process_news_chain.delay(profile=profile)
+
+    if result['imported'] or result['updated']:
+        refresh_feeds_task.delay()
+
+    return result
+
+
+def _subscribe_advertised_hubs(rss_parser):
+    """
+    Start WebSub subscriptions for parsed feeds that advertise a hub
+    """
+    if not websub.is_enabled():
+        return
+    for source_id, (hub_url, topic_url) in rss_parser.hubs.items():
+        source = Source.objects.get(id=source_id)
+        subscription = websub.register_hub(source, hub_url, topic_url)
+        if subscription is not None:
+            websub_subscribe_task.delay(subscription.id)
+
+
+def _import_run(stats_id, profile):
+    """
+    Import the parsed articles of a run and store the counters on its stats record
     """
     # Get the import stats record
     try:
@@ -34,40 +213,28 @@ def import_news_task(stats_id):
         import_stats = LogStats.objects.create()
 
     # Run the import command (which stores stats in settings)
-    call_command('import_news_from_redis')
-    
-    # Get stats from Django settings or from NewsImporter directly
-    if hasattr(settings, '_IMPORT_NEWS_STATS'):
-        stats = getattr(settings, '_IMPORT_NEWS_STATS')
-    else:
-        # Fallback: directly access the NewsImporter to get stats
-        from news.management.commands.import_news_from_redis import NewsImporter
-        importer = NewsImporter()
-        # We'd need to re-run import_news to get stats, but we know stats were 
-        # collected during the call_command above, so get them via the import method
-        news_data = importer.get_news_from_redis()
-        for item in news_data:
-            try:
-                result = importer._process_single_news_item(item)
-                if result:
-                    importer.stats["imported"] += 1
-                else:
-                    importer.stats["skipped"] += 1
-            except Exception:
-                importer.stats["errors"] += 1
-        stats = importer.stats
+    call_command(
+        'import_news_from_redis',
+        key=parsed_news_key(stats_id),
+        stats_id=import_stats.id,
+        profile=_profile_enabled(profile)
+    )
+    stats = settings._IMPORT_NEWS_STATS
 
     # Update the stats record with the results
     import_stats.imported = stats['imported']
+    import_stats.updated = stats.get('updated', 0)
     import_stats.skipped = stats['skipped']
     import_stats.errors = stats['errors']
     import_stats.completed_at = timezone.now()
-    import_stats.save()
+    # Only save the counters: metrics and profiles were stored on the record by the commands meanwhile
+    import_stats.save(update_fields=['imported', 'updated', 'skipped', 'errors', 'completed_at'])
 
     # Return the stats for logging purposes
     return {
         'stats_id': stats_id,
         'imported': stats['imported'],
+        'updated': stats.get('updated', 0),
         'skipped': stats['skipped'],
         'errors': stats['errors'],
         'duration': (import_stats.completed_at - import_stats.started_at).total_seconds()
@@ -75,12 +242,137 @@ def import_news_task(stats_id):
 
 
 @shared_task
-def process_news_chain():
+def process_news_chain(profile=None):
+    """
+    Run the news pipeline: fetch and parse every active source in parallel, then import
+
+    Each source is fetched and parsed by its own chain of tasks, so a slow or failing feed
+    does not hold up the others and the work spreads over all workers. Each step is routed
+    to its own queue (see CELERY_TASK_ROUTES) so network, CPU and database bound work are
+    processed by separately sized worker pools
+
+    Only one run is active at a time: a run requested while another is in progress is
+    coalesced into a single follow-up run started when the current one finishes
+    """
+    lease = run_lease()
+    if not lease.acquire():
+        request_follow_up_run()
+        logger.info("A pipeline run is already in progress, queued a follow-up run")
+        return None
+
+    # Sources whose hub pushes their updates are only polled every WEBSUB_POLL_INTERVAL, as a fallback
+    poll_after = timezone.now() - timedelta(seconds=settings.WEBSUB_POLL_INTERVAL)
+    sources = list(
+        Source.objects.filter(active=True).exclude(rss_url__isnull=True).exclude(rss_url='')
+        .exclude(websub__lease_expires_at__gt=timezone.now(), websub__last_polled_at__gt=poll_after)
+        .values('id', 'name', 'rss_url')
+    )
+    if not sources:
+        lease.release()
+        return None
+
+    # The stats record ID identifies the run and its payload keys in Redis
+    import_stats = LogStats.objects.create()
+
+    # The import step starts once every source has been parsed, and completes the stats record.
+    # The run lease is handed from step to step and released by the import step.
+    return chord(
+        (
+            chain(
+                fetch_feed_task.s(source, import_stats.id, lease_token=lease.token),
+                parse_feed_task.s(import_stats.id, profile=profile, lease_token=lease.token)
+            )
+            for source in sources
+        ),
+        import_news_task.si(import_stats.id, profile=profile, lease_token=lease.token)
+    )()
+
+
+@shared_task(bind=True)
+def websub_subscribe_task(self, subscription_id, mode='subscribe'):
+    """
+    Task for sending a WebSub (un)subscription request to the hub of a source
+    The hub confirms it later with a verification request to websub_callback
+    """
+    subscription = WebSubSubscription.objects.select_related('source').filter(id=subscription_id).first()
+    if subscription is None:
+        return None
+
+    try:
+        websub.send_request(subscription, mode)
+    except RequestException as e:
+        logger.error(f"WebSub {mode} request to {subscription.hub_url} failed: {str(e)}")
+        if self.request.retries < settings.FETCH_MAX_RETRIES:
+            raise self.retry(countdown=settings.FETCH_RETRY_DELAY * 2 ** self.request.retries)
+        return False
+    return True
+
+
+@shared_task
+def renew_websub_subscriptions():
+    """
+    Periodic task re-subscribing before leases run out and retrying unverified subscriptions
+    """
+    if not websub.is_enabled():
+        return 0
+
+    subscription_ids = list(websub.subscriptions_to_renew().values_list('id', flat=True))
+    for subscription_id in subscription_ids:
+        websub_subscribe_task.delay(subscription_id)
+    return len(subscription_ids)
+
+
+@shared_task(acks_late=True)
+def websub_push_task(subscription_id, push_id):
+    """
+    Task for parsing feed content pushed by a WebSub hub (stored in Redis by websub_callback)
+    The new articles are handed to import_pushed_news_task on the import queue
+    """
+    run_id = f'websub-{push_id}'
+    subscription = WebSubSubscription.objects.select_related('source').filter(id=subscription_id).first()
+    feed = pop_raw_feed(run_id, subscription_id)
+    if subscription is None or feed is None:
+        return 0
+
+    rss_parser = RSSParser()
+    body, content_type = feed
+    articles = rss_parser.parse_feed(subscription.source, body, content_type)
+    rss_parser.metrics.flush('websub')
+
+    if articles:
+        push_parsed_articles(run_id, articles)
+        import_pushed_news_task.delay(run_id)
+    return len(articles)
+
+
+@shared_task(acks_late=True)
+def import_pushed_news_task(run_id):
+    """
+    Task for importing the articles of a WebSub push parsed by websub_push_task
+    """
+    importer = NewsImporter()
+    stats = importer.import_news(parsed_news_key(run_id))
+    importer.metrics.flush('import')
+    delete_run_payload(run_id)
+    if stats['imported'] or stats['updated']:
+        refresh_feeds_task.delay()
+    return stats
+
+
+@shared_task
+def score_trending_task():
+    """
+    Periodic task scoring trending tags and site categories and caching the top of each window
+    """
+    results = compute_trending()
+    return {window: {kind: len(items) for kind, items in result['results'].items()}
+            for window, result in results.items()}
+
+
+@shared_task
+def refresh_feeds_task():
     """
-    Chain task that runs both RSS parsing and news import in sequence
+    Task rendering and caching the outgoing feeds marked stale by imports (see news.feeds)
+    Started after each import; feeds changed by several imports meanwhile are rendered once
     """
-    # Use chain to ensure tasks run in sequence and the result of the first task is passed to the second task
-    return chain(
-        parse_rss_task.s(),
-        import_news_task.s()
-    )()
\ No newline at end of file
+    return refresh_stale_feeds()
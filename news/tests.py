@@ -1,3 +1,1458 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import MagicMock, PropertyMock, patch
 
-# Create your tests here.
+import redis
+import requests
+from celery.exceptions import Retry
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection
+from django.db.models import QuerySet
+from django.http import HttpResponse, QueryDict
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from news_aggregator import celery_app
+
+from . import db_router, websub
+from .admin import EstimatedCountPaginator, TagAdmin
+from .articles import Article
+from .autocomplete import record_tag_usage, recount_tag_usage, suggest_tags, top_tags
+from .cache import IMPORT_GENERATION_KEY, bump_import_generation
+from .exporters import serialize_news_chunk
+from .category_mapping import MAPPING_VERSION_KEY, bump_mapping_version, mapper
+from .feeds import ALL_SCOPE, render_feeds
+from .keywords import (extract_keywords, load_document_frequencies, tokenize, tokenize_article,
+                       update_document_frequencies)
+from .locks import LOCK_PREFIX, Lease, LeaseLost, holding
+from .management.commands.import_news_from_redis import NewsImporter
+from .metrics import RunMetrics, merge_summaries, render_prometheus
+from .models import Category, DailyCount, LogStats, News, SiteCategory, Source, Tag, WebSubSubscription
+from .pipeline import get_redis_client, request_follow_up_run, take_follow_up_run
+from .profiling import profile_run
+from .queries import filter_news, parse_news_filters
+from .rollups import count_article, daily_totals, record_daily_counts, recount_day, top_objects
+from .tasks import (_resume_run_lease, fetch_feed_task, import_news_task, parse_feed_task, renew_websub_subscriptions,
+                    websub_subscribe_task)
+from .trending import _window_counts, compute_trending, get_trending, record_links
+
+# Tests keep validators and pages in memory rather than in the shared Redis cache
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_source(name='Source', **kwargs):
+    return Source.objects.create(name=name, url=f'https://{name.lower()}.example.com',
+                                 rss_url=f'https://{name.lower()}.example.com/rss', **kwargs)
+
+
+def make_news(source, title, published_at=None, **kwargs):
+    return News.objects.create(
+        title=title,
+        content=kwargs.pop('content', f'{title} content'),
+        url=kwargs.pop('url', f'{source.url}/{title.lower().replace(" ", "-")}'),
+        source=source,
+        published_at=published_at or timezone.now(),
+        **kwargs
+    )
+
+
+def aware(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class NewsFiltersTests(TestCase):
+    """
+    Filters shared by the HTML views and the API (news.queries)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.first = make_source('First')
+        cls.second = make_source('Second')
+        cls.early = make_news(cls.first, 'Early news', aware(2024, 5, 1, 0, 0))
+        cls.late = make_news(cls.first, 'Late news', aware(2024, 5, 31, 23, 59))
+        cls.other = make_news(cls.second, 'Other news', aware(2024, 6, 1, 0, 0))
+
+    def filtered(self, query_string):
+        return list(filter_news(News.objects.all(), parse_news_filters(QueryDict(query_string))))
+
+    def test_invalid_source_ids_are_ignored(self):
+        filters = parse_news_filters(QueryDict(f'source={self.second.id}&source=abc&source='))
+        self.assertEqual(filters['sources'], [self.second.id])
+
+    def test_invalid_source_ids_raise_when_strict(self):
+        with self.assertRaises(ValueError):
+            parse_news_filters(QueryDict('source=abc'), strict=True)
+
+    def test_unknown_sort_falls_back_to_default(self):
+        self.assertEqual(parse_news_filters(QueryDict('sort=title'))['sort'], '-published_at')
+        self.assertEqual(parse_news_filters(QueryDict('sort=created_at'))['sort'], 'published_at')
+
+    def test_source_filter(self):
+        self.assertEqual(self.filtered(f'source={self.second.id}'), [self.other])
+
+    def test_date_range_includes_whole_end_day(self):
+        self.assertEqual(self.filtered('date_range=2024-05-01 to 2024-05-31'), [self.late, self.early])
+        self.assertEqual(self.filtered('date_range=2024-06-01'), [self.other])
+
+    def test_invalid_date_range_is_ignored(self):
+        self.assertEqual(len(self.filtered('date_range=yesterday')), 3)
+
+    def test_index_ignores_invalid_source(self):
+        response = self.client.get('/', {'source': 'abc'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_api_filters(self):
+        response = self.client.get('/api/v1/news/', {'source': self.first.id, 'sort': 'published_at'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['slug'] for item in response.json()['results']],
+                         [self.early.slug, self.late.slug])
+
+    def test_api_rejects_invalid_source(self):
+        response = self.client.get('/api/v1/news/', {'source': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('source', response.json())
+
+    def test_api_stats_rejects_invalid_period(self):
+        self.assertEqual(self.client.get('/api/v1/stats/', {'days': '0'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/stats/', {'date_range': '2024-05-31 to 2024-05-01'}).status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES, PAGE_CACHE_MAX_AGE=60)
+class ConditionalResponseTests(TestCase):
+    """
+    ETag, Last-Modified and Cache-Control of the HTML pages and the API
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.news = make_news(make_source(), 'Cached news')
+
+    def assertRevalidates(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=60', response['Cache-Control'])
+        self.assertIn('Last-Modified', response)
+
+        not_modified = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertIn('public', not_modified['Cache-Control'])
+
+    def test_index(self):
+        self.assertRevalidates('/')
+
+    def test_news_detail(self):
+        self.assertRevalidates(f'/news/{self.news.slug}/')
+
+    def test_api(self):
+        self.assertRevalidates('/api/v1/news/')
+        self.assertRevalidates(f'/api/v1/news/{self.news.slug}/')
+        self.assertRevalidates('/api/v1/sources/')
+        self.assertRevalidates('/api/v1/tags/')
+
+    def test_authenticated_responses_are_private(self):
+        self.client.force_login(User.objects.create_user('reader'))
+        response = self.client.get('/api/v1/news/')
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotIn('public', response['Cache-Control'])
+
+    def test_revision_changes_article_etag(self):
+        path = f'/news/{self.news.slug}/'
+        etag = self.client.get(path)['ETag']
+        News.objects.filter(id=self.news.id).update(revision=2, updated_at=timezone.now())
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class NewsListFragmentTests(TestCase):
+    """
+    News list fragment used by AJAX filtering and pagination
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        source = make_source()
+        cls.news = [make_news(source, f'Fragment news {number}', aware(2024, 5, number)) for number in range(1, 13)]
+
+    def test_html_fragment_has_no_sidebars(self):
+        response = self.client.get('/fragments/news/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Fragment news 12')
+        self.assertNotContains(response, '<html')
+
+    def test_json_pages(self):
+        first = self.client.get('/fragments/news/', {'format': 'json', 'sort': 'published_at'}).json()
+        self.assertEqual(len(first['results']), 10)
+        self.assertEqual(first['results'][0]['title'], 'Fragment news 1')
+        self.assertEqual((first['num_pages'], first['has_next'], first['has_previous']), (2, True, False))
+
+        second = self.client.get('/fragments/news/', {'format': 'json', 'sort': 'published_at', 'page': 2}).json()
+        self.assertEqual([item['title'] for item in second['results']], ['Fragment news 11', 'Fragment news 12'])
+        self.assertEqual(second['results'][0]['url'], f'/news/{self.news[10].slug}/')
+
+
+def redis_available():
+    try:
+        return get_redis_client().ping()
+    except redis.RedisError:
+        return False
+
+
+@skipUnless(redis_available(), "Needs the Redis server of the settings")
+class LeaseTests(TestCase):
+    """
+    Renewable Redis leases on pipeline runs and sources (news.locks)
+    """
+
+    def setUp(self):
+        self.name = f'test:{uuid.uuid4().hex}'
+        self.addCleanup(get_redis_client().delete, f'{LOCK_PREFIX}:{self.name}')
+
+    def test_acquire_and_release(self):
+        lease = Lease(self.name, ttl=30)
+        self.assertTrue(lease.acquire())
+        self.assertFalse(Lease(self.name, ttl=30).acquire())
+
+        lease.release()
+        self.assertTrue(Lease(self.name, ttl=30).acquire())
+
+    def test_token_is_handed_over(self):
+        lease = Lease(self.name, ttl=30)
+        lease.acquire()
+        handed = Lease(self.name, ttl=30, token=lease.token)
+        self.assertTrue(handed.renew())
+        handed.release()
+        self.assertTrue(Lease(self.name, ttl=30).acquire())
+
+    def test_renew(self):
+        lease = Lease(self.name, ttl=30)
+        lease.acquire()
+        get_redis_client().pexpire(lease.name, 1000)
+        self.assertTrue(lease.renew())
+        self.assertGreater(get_redis_client().pttl(lease.name), 1000)
+        self.assertFalse(Lease(self.name, ttl=30, token='someone else').renew())
+
+    def test_expired_lease(self):
+        lease = Lease(self.name, ttl=30)
+        lease.acquire()
+        get_redis_client().delete(lease.name)
+        self.assertFalse(lease.renew())
+        # Nobody took it meanwhile: taken again with the same token
+        self.assertTrue(lease.resume())
+        self.assertTrue(Lease(self.name, ttl=30, token=lease.token).renew())
+
+    def test_expired_lease_taken_by_another_holder(self):
+        lease = Lease(self.name, ttl=30)
+        lease.acquire()
+        get_redis_client().delete(lease.name)
+        other = Lease(self.name, ttl=30)
+        self.assertTrue(other.acquire())
+
+        self.assertFalse(lease.resume())
+        # Releasing the lost lease leaves the other holder's lease alone
+        lease.release()
+        self.assertFalse(Lease(self.name, ttl=30).acquire())
+
+    def test_holding(self):
+        with holding(Lease(self.name, ttl=30)) as acquired:
+            self.assertTrue(acquired)
+            with holding(Lease(self.name, ttl=30)) as acquired_twice:
+                self.assertFalse(acquired_twice)
+        with holding(Lease(self.name, ttl=30)) as acquired:
+            self.assertTrue(acquired)
+
+    def test_step_of_a_run_that_lost_its_lease(self):
+        lease = Lease(self.name, ttl=30)
+        lease.acquire()
+        get_redis_client().delete(lease.name)
+        Lease(self.name, ttl=30).acquire()
+        with patch('news.tasks.run_lease', lambda token: Lease(self.name, ttl=30, token=token)):
+            with self.assertRaises(LeaseLost):
+                _resume_run_lease(lease.token)
+
+    def test_follow_up_run_is_taken_once(self):
+        with patch('news.pipeline.FOLLOW_UP_RUN_KEY', self.name):
+            self.assertFalse(take_follow_up_run())
+            request_follow_up_run()
+            request_follow_up_run()
+            self.assertTrue(take_follow_up_run())
+            self.assertFalse(take_follow_up_run())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PipelineStepFailureTests(TestCase):
+    """
+    A failing source must not fail the chord of its pipeline run (news.tasks)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.source = make_source()
+        cls.stats = LogStats.objects.create()
+
+    def test_parse_step_returns_its_source_on_failure(self):
+        fetch_result = {'source_id': self.source.id, 'fetched': True, 'metrics': {}}
+        with patch('news.tasks.pop_raw_feed', side_effect=redis.ConnectionError("Redis is down")), \
+                self.assertLogs('news.tasks', 'ERROR'):
+            self.assertEqual(parse_feed_task(fetch_result, self.stats.id), self.source.id)
+
+    def test_fetch_step_retries_when_redis_fails(self):
+        source = {'id': self.source.id, 'name': self.source.name, 'rss_url': self.source.rss_url}
+        with patch('news.tasks.holding', side_effect=redis.ConnectionError("Redis is down")), \
+                self.assertLogs('news.tasks', 'ERROR'):
+            with self.assertRaises(Retry):
+                fetch_feed_task(source, self.stats.id)
+
+    def test_failed_import_releases_the_run_lease(self):
+        lease = MagicMock()
+        with patch('news.tasks._resume_run_lease', return_value=lease), \
+                patch('news.tasks._import_run', side_effect=OperationalError("Database is down")), \
+                patch('news.tasks.take_follow_up_run', return_value=True), \
+                patch('news.tasks.process_news_chain') as process_news_chain:
+            with self.assertRaises(OperationalError):
+                import_news_task(self.stats.id, lease_token='token')
+        lease.release.assert_called_once_with()
+        process_news_chain.delay.assert_called_once_with(profile=None)
+
+
+@skipUnless(redis_available(), "Needs the Redis server of the settings")
+@override_settings(CACHES=TEST_CACHES)
+class TrendingTests(TestCase):
+    """
+    Hourly counters and scores of trending tags (news.trending)
+    """
+
+    def setUp(self):
+        prefix = f'test:trending:{uuid.uuid4().hex}'
+        patcher = patch('news.trending.TRENDING_PREFIX', prefix)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: [get_redis_client().delete(key) for key in get_redis_client().scan_iter(f'{prefix}:*')])
+
+    def test_rising_tag_ranks_above_steady_tag(self):
+        Tag.objects.create(name='war', slug='war')
+        Tag.objects.create(name='sport', slug='sport')
+        now = timezone.now()
+        record_links(
+            [('tag', 'war', now)] * 6
+            + [('tag', 'sport', now)] * 4
+            + [('tag', 'sport', now - timedelta(hours=3))] * 100
+        )
+
+        counts, baseline = _window_counts(get_redis_client(), 'tag', 1, time.time())
+        self.assertEqual(counts, {'war': 6, 'sport': 4})
+        self.assertEqual(baseline, {'war': 0, 'sport': 100})
+
+        ranked = compute_trending()['1h']['results']['tag']
+        self.assertEqual([item['slug'] for item in ranked], ['war', 'sport'])
+        self.assertEqual(get_trending('1h')['results']['tag'], ranked)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CategoryMapperTests(TestCase):
+    """
+    Automatic SiteCategory -> Category mapping (news.category_mapping)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = {
+            slug: Category.objects.create(name=name, slug=slug)
+            for slug, name in [('politics', 'Politics'), ('sports', 'Sports'), ('business', 'Business'),
+                               ('technology', 'Technology')]
+        }
+
+    def setUp(self):
+        # The mapper is a per-process singleton: never reuse an index built for other tests' categories
+        mapper.reset()
+        self.addCleanup(mapper.reset)
+
+    def test_synonyms_and_words(self):
+        self.assertEqual(mapper.classify('Політика'), self.categories['politics'].id)
+        self.assertEqual(mapper.classify('ФУТБОЛ'), self.categories['sports'].id)
+        self.assertEqual(mapper.classify('Економіка та бізнес'), self.categories['business'].id)
+
+    def test_similar_spelling(self):
+        self.assertEqual(mapper.classify('Технологія'), self.categories['technology'].id)
+
+    def test_unrelated_name_is_not_mapped(self):
+        self.assertIsNone(mapper.classify('Кросворди'))
+        self.assertIsNone(mapper.classify(''))
+
+    def test_warm_mapper_runs_no_queries(self):
+        mapper.classify('Політика')
+        with self.assertNumQueries(0):
+            self.assertEqual(mapper.classify('Спорт'), self.categories['sports'].id)
+
+    def test_new_site_categories_are_mapped(self):
+        site_category = SiteCategory.objects.create(name='Політика', slug='polityka')
+        self.assertEqual(site_category.category, self.categories['politics'])
+        self.assertTrue(site_category.auto_mapped)
+
+        unknown = SiteCategory.objects.create(name='Кросворди', slug='krosvordy')
+        self.assertIsNone(unknown.category)
+        self.assertFalse(unknown.auto_mapped)
+
+    def test_manual_mappings_become_examples(self):
+        self.assertIsNone(mapper.classify('Кримінал'))
+        SiteCategory.objects.create(name='Кримінал', slug='kryminal', category=self.categories['politics'])
+        self.assertEqual(mapper.classify('Кримінал'), self.categories['politics'].id)
+
+    def test_committed_changes_bump_the_shared_version(self):
+        version = cache.get(MAPPING_VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            SiteCategory.objects.create(name='Кримінал', slug='kryminal', category=self.categories['politics'])
+        self.assertNotEqual(cache.get(MAPPING_VERSION_KEY), version)
+
+    def test_refresh_rebuilds_after_changes_in_other_processes(self):
+        mapper.refresh()
+        self.assertIsNone(mapper.classify('Кримінал'))
+        # Mapped by another process: no signal runs here, only the shared version changes
+        SiteCategory.objects.bulk_create([
+            SiteCategory(name='Кримінал', slug='kryminal', category=self.categories['politics']),
+        ])
+        bump_mapping_version()
+        self.assertIsNone(mapper.classify('Кримінал'))
+
+        mapper.refresh()
+        self.assertEqual(mapper.classify('Кримінал'), self.categories['politics'].id)
+        with self.assertNumQueries(0):
+            mapper.refresh()
+
+    def test_deleted_category_is_never_assigned(self):
+        mapper.classify('Політика')
+        stale_index = mapper.index
+        self.categories['politics'].delete()
+        # As in a process that built its index before the category was deleted elsewhere
+        mapper._index = stale_index
+        mapper.classify.cache_clear()
+
+        site_category = SiteCategory.objects.create(name='Політика', slug='polityka')
+        self.assertIsNone(site_category.category_id)
+        self.assertFalse(site_category.auto_mapped)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class DailyCountTests(TestCase):
+    """
+    Daily counts per source, category and tag kept by the importer (news.rollups)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        mapper.reset()
+        cls.first = make_source('First')
+        cls.second = make_source('Second')
+        cls.category = Category.objects.create(name='Politics', slug='politics')
+        cls.site_category = SiteCategory.objects.create(name='Вибори', slug='vybory', category=cls.category)
+        cls.tag = Tag.objects.create(name='war', slug='war')
+
+    def setUp(self):
+        self.addCleanup(mapper.reset)
+
+    def counts(self):
+        return {(row.date, row.dimension, row.object_id): row.count for row in DailyCount.objects.all()}
+
+    def test_batches_add_up(self):
+        may_1, may_2 = aware(2024, 5, 1, 10, 0), aware(2024, 5, 2, 10, 0)
+        for published_at, source in [(may_1, self.first), (may_1, self.second)]:
+            counts = Counter()
+            count_article(counts, published_at, source.id, [self.category.id, self.category.id], [self.tag.id])
+            record_daily_counts(counts)
+        counts = Counter()
+        count_article(counts, may_2, self.first.id)
+        record_daily_counts(counts)
+
+        self.assertEqual(self.counts(), {
+            (date(2024, 5, 1), DailyCount.TOTAL, 0): 2,
+            (date(2024, 5, 1), DailyCount.SOURCE, self.first.id): 1,
+            (date(2024, 5, 1), DailyCount.SOURCE, self.second.id): 1,
+            # Counted once per article, however many of its site categories map to the category
+            (date(2024, 5, 1), DailyCount.CATEGORY, self.category.id): 2,
+            (date(2024, 5, 1), DailyCount.TAG, self.tag.id): 2,
+            (date(2024, 5, 2), DailyCount.TOTAL, 0): 1,
+            (date(2024, 5, 2), DailyCount.SOURCE, self.first.id): 1,
+        })
+
+    def test_recount_day_matches_news(self):
+        news = make_news(self.first, 'Counted news', aware(2024, 5, 1, 10, 0))
+        news.site_categories.add(self.site_category)
+        self.tag.news.add(news)
+        make_news(self.second, 'Next day news', aware(2024, 5, 2, 10, 0))
+        DailyCount.objects.create(date=date(2024, 5, 1), dimension=DailyCount.TOTAL, count=99)
+
+        self.assertEqual(recount_day(date(2024, 5, 1)), 1)
+        self.assertEqual(self.counts(), {
+            (date(2024, 5, 1), DailyCount.TOTAL, 0): 1,
+            (date(2024, 5, 1), DailyCount.SOURCE, self.first.id): 1,
+            (date(2024, 5, 1), DailyCount.CATEGORY, self.category.id): 1,
+            (date(2024, 5, 1), DailyCount.TAG, self.tag.id): 1,
+        })
+
+    def test_reads(self):
+        for day, count in [(1, 3), (3, 1)]:
+            DailyCount.objects.create(date=date(2024, 5, day), dimension=DailyCount.TOTAL, count=count)
+            DailyCount.objects.create(date=date(2024, 5, day), dimension=DailyCount.SOURCE,
+                                      object_id=self.first.id, count=count)
+        DailyCount.objects.create(date=date(2024, 5, 2), dimension=DailyCount.SOURCE, object_id=self.second.id,
+                                  count=2)
+
+        self.assertEqual([day['count'] for day in daily_totals(date(2024, 5, 1), date(2024, 5, 4))], [3, 0, 1, 0])
+        top = top_objects(DailyCount.SOURCE, date(2024, 5, 1), date(2024, 5, 3), daily=True)
+        self.assertEqual([(item['name'], item['count']) for item in top], [('First', 4), ('Second', 2)])
+        self.assertEqual([day['count'] for day in top[1]['daily']], [0, 2, 0])
+
+    def test_stats_api(self):
+        DailyCount.objects.create(date=timezone.localdate(), dimension=DailyCount.TAG, object_id=self.tag.id, count=5)
+        response = self.client.get('/api/v1/stats/', {'dimension': 'tag', 'days': 7, 'slug': 'war'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(item['slug'], item['count']) for item in response.json()['results']], [('war', 5)])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PopulateDbTests(TestCase):
+    """
+    Synthetic datasets (populate_db), which load the category and source fixtures
+    """
+
+    def test_generated_dataset_is_counted(self):
+        call_command('populate_db', news_count=30, days=5, stdout=StringIO())
+        self.assertEqual(News.objects.count(), 30)
+        self.assertEqual(Tag.objects.filter(usage_count__gt=0).count(),
+                         Tag.objects.filter(news__isnull=False).distinct().count())
+        totals = DailyCount.objects.filter(dimension=DailyCount.TOTAL)
+        self.assertEqual(sum(totals.values_list('count', flat=True)), 30)
+        self.assertTrue(DailyCount.objects.filter(dimension=DailyCount.SOURCE).exists())
+        # Random mappings are not admin-confirmed training examples for the category mapper
+        self.assertFalse(SiteCategory.objects.filter(category__isnull=False, auto_mapped=False).exists())
+
+    def test_clear_replaces_the_dataset(self):
+        call_command('populate_db', news_count=30, days=5, stdout=StringIO())
+        with patch('news.management.commands.prune_news.invalidate_articles') as invalidate_articles, \
+                self.captureOnCommitCallbacks(execute=True):
+            call_command('populate_db', news_count=20, days=5, chunk_size=8, clear=True, stdout=StringIO())
+        self.assertEqual(News.objects.count(), 20)
+        totals = DailyCount.objects.filter(dimension=DailyCount.TOTAL)
+        self.assertEqual(sum(totals.values_list('count', flat=True)), 20)
+        # The 30 old news were deleted 8 at a time
+        self.assertEqual(invalidate_articles.call_count, 4)
+
+
+@override_settings(CACHES=TEST_CACHES, DATABASE_REPLICAS=['replica_1'], REPLICA_STICKY_SECONDS=5,
+                   REPLICA_MAX_LAG_SECONDS=10)
+class ReplicaRoutingTests(TestCase):
+    """
+    Read replica routing of web requests (news.db_router)
+    """
+
+    def setUp(self):
+        db_router._health.clear()
+        self.addCleanup(db_router._health.clear)
+        # Replica checks are only run through replication_lag, so no replica database is needed
+        patcher = patch('news.db_router.replication_lag', return_value=0.0)
+        self.replication_lag = patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.set(IMPORT_GENERATION_KEY, int(time.time()) - 60, None)
+        self.router = db_router.ReplicaRouter()
+
+    def serve(self, request, write=False):
+        """
+        Run a request through the middleware; returns the response and the databases read before and after writing
+        """
+        reads = []
+
+        def view(request):
+            reads.append(self.router.db_for_read(News))
+            if write:
+                self.router.db_for_write(News)
+                reads.append(self.router.db_for_read(News))
+            return HttpResponse()
+
+        return db_router.ReplicaRoutingMiddleware(view)(request), reads
+
+    def test_outside_requests_use_the_primary(self):
+        self.assertEqual(self.router.db_for_read(News), 'default')
+
+    def test_reads_of_safe_requests_use_a_replica(self):
+        response, reads = self.serve(RequestFactory().get('/'))
+        self.assertEqual(reads, ['replica_1'])
+        self.assertNotIn(db_router.PRIMARY_COOKIE, response.cookies)
+
+    def test_reads_after_a_write_use_the_primary(self):
+        response, reads = self.serve(RequestFactory().get('/'), write=True)
+        self.assertEqual(reads, ['replica_1', 'default'])
+        self.assertIn(db_router.PRIMARY_COOKIE, response.cookies)
+
+    def test_client_that_wrote_reads_its_writes(self):
+        response, reads = self.serve(RequestFactory().post('/'))
+        self.assertEqual(reads, ['default'])
+        self.assertEqual(response.cookies[db_router.PRIMARY_COOKIE]['max-age'], 5)
+
+        request = RequestFactory().get('/')
+        request.COOKIES[db_router.PRIMARY_COOKIE] = '1'
+        self.assertEqual(self.serve(request)[1], ['default'])
+
+    def test_primary_right_after_an_import(self):
+        bump_import_generation()
+        self.assertEqual(self.serve(RequestFactory().get('/'))[1], ['default'])
+
+    def test_exempt_paths_use_the_primary(self):
+        self.assertEqual(self.serve(RequestFactory().get('/admin/news/news/'))[1], ['default'])
+
+    def test_websub_verification_reads_the_primary(self):
+        # Created on the primary by the subscribe task just before the hub verifies it; replica_1 is not
+        # a test database, so reading the subscription from it would fail the request
+        subscription = WebSubSubscription.objects.create(source=make_source(), hub_url='https://hub.example.com/',
+                                                         topic_url='https://source.example.com/rss')
+        response = self.client.get(reverse('websub_callback', args=[subscription.id]), {
+            'hub.mode': 'subscribe', 'hub.topic': subscription.topic_url, 'hub.challenge': 'challenge',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'challenge')
+
+    def test_lagging_replica_falls_back_to_the_primary(self):
+        self.replication_lag.return_value = 30.0
+        with self.assertLogs('news.db_router', 'WARNING'):
+            self.assertEqual(self.serve(RequestFactory().get('/'))[1], ['default'])
+
+    def test_unavailable_replica_falls_back_to_the_primary(self):
+        self.replication_lag.side_effect = OperationalError("could not connect")
+        with patch('news.db_router.connections') as connections, self.assertLogs('news.db_router', 'WARNING'):
+            self.assertEqual(self.serve(RequestFactory().get('/'))[1], ['default'])
+        connections['replica_1'].close.assert_called_once_with()
+
+    @override_settings(REPLICA_HEALTH_CHECK_INTERVAL=60)
+    def test_health_is_checked_once_per_interval(self):
+        self.serve(RequestFactory().get('/'))
+        self.serve(RequestFactory().get('/'))
+        self.assertEqual(self.replication_lag.call_count, 1)
+
+
+@override_settings(CACHES=TEST_CACHES, SITE_URL='https://news.example.com', FEED_ITEMS=2, SITEMAP_PAGE_SIZE=2)
+class FeedAndSitemapTests(TestCase):
+    """
+    Precomputed outgoing feeds and the paged sitemap (news.feeds, news.sitemaps)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        mapper.reset()
+        cls.source = make_source('First')
+        cls.other_source = make_source('Second')
+        cls.category = Category.objects.create(name='Politics', slug='politics')
+        site_category = SiteCategory.objects.create(name='Вибори', slug='vybory', category=cls.category)
+        cls.news = [make_news(cls.source, f'Feed news {number}', aware(2024, 5, number)) for number in range(1, 4)]
+        cls.news[0].site_categories.add(site_category)
+        make_news(cls.other_source, 'Other feed news', aware(2024, 4, 1))
+
+    def setUp(self):
+        self.addCleanup(mapper.reset)
+
+    def test_feed_formats(self):
+        rss = self.client.get('/feeds/rss/')
+        self.assertEqual(rss['Content-Type'], 'application/rss+xml; charset=utf-8')
+        self.assertContains(rss, f'https://news.example.com/news/{self.news[2].slug}/')
+        # Only the latest FEED_ITEMS news
+        self.assertNotContains(rss, self.news[0].slug)
+
+        self.assertEqual(self.client.get('/feeds/atom/')['Content-Type'], 'application/atom+xml; charset=utf-8')
+        feed = json.loads(self.client.get('/feeds/json/').content)
+        self.assertEqual([item['title'] for item in feed['items']], ['Feed news 3', 'Feed news 2'])
+
+    def test_scoped_feeds(self):
+        feed = json.loads(self.client.get(f'/feeds/source/{self.other_source.id}/json/').content)
+        self.assertEqual([item['title'] for item in feed['items']], ['Other feed news'])
+        feed = json.loads(self.client.get('/feeds/category/politics/json/').content)
+        self.assertEqual([item['title'] for item in feed['items']], ['Feed news 1'])
+
+        self.assertEqual(self.client.get('/feeds/source/0/rss/').status_code, 404)
+        self.assertEqual(self.client.get('/feeds/category/missing/rss/').status_code, 404)
+        self.assertEqual(self.client.get('/feeds/xml/').status_code, 404)
+
+    def test_feeds_are_served_from_the_cache(self):
+        response = self.client.get('/feeds/rss/')
+        with self.assertNumQueries(0):
+            not_modified = self.client.get('/feeds/rss/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        # Served as rendered until stale feeds are refreshed
+        make_news(self.source, 'Feed news 4', aware(2024, 5, 4))
+        self.assertEqual(self.client.get('/feeds/rss/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        render_feeds(ALL_SCOPE)
+        self.assertContains(self.client.get('/feeds/rss/'), 'Feed news 4')
+
+    def test_sitemap(self):
+        ids = sorted(News.objects.values_list('id', flat=True))
+        pages = list(range(ids[0] // 2, ids[-1] // 2 + 1))
+        index = self.client.get('/sitemap.xml').content.decode()
+        self.assertEqual(index.count('<sitemap>'), len(pages))
+        self.assertIn(f'http://testserver/sitemap-news-{pages[0]}.xml', index)
+
+        listed = []
+        for page in pages:
+            response = self.client.get(f'/sitemap-news-{page}.xml')
+            self.assertTrue(response.streaming)
+            listed += re.findall(r'/news/([^/<]+)/</loc>', b''.join(response.streaming_content).decode())
+        self.assertCountEqual(listed, News.objects.values_list('slug', flat=True))
+
+    def test_import_does_not_start_the_feed_refresh(self):
+        # Importing is usable without a broker: the import tasks start the refresh
+        article = Article.build('Imported feed news', 'Body', 'https://first.example.com/imported', 'First')
+        with patch('news.tasks.refresh_feeds_task.delay') as delay, \
+                patch('news.management.commands.import_news_from_redis.mark_feeds_stale') as mark_feeds_stale, \
+                self.captureOnCommitCallbacks(execute=True):
+            stats = NewsImporter().import_items([article])
+        self.assertEqual(stats['imported'], 1)
+        delay.assert_not_called()
+        mark_feeds_stale.assert_called_once_with({self.source.id}, set())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TagAutocompleteTests(TestCase):
+    """
+    Tag usage counts and the tag autocomplete ranked by them (news.autocomplete)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = {name: Tag.objects.create(name=name, slug=name) for name in ['war', 'warsaw', 'water', 'sport']}
+
+    def test_usage_counts_add_up(self):
+        record_tag_usage(Counter({self.tags['war'].id: 2, self.tags['water'].id: 5, self.tags['sport'].id: 0}))
+        record_tag_usage(Counter({self.tags['war'].id: 1, self.tags['warsaw'].id: 1}))
+        self.assertEqual(dict(Tag.objects.values_list('name', 'usage_count')),
+                         {'war': 3, 'warsaw': 1, 'water': 5, 'sport': 0})
+
+    def test_recount(self):
+        source = make_source()
+        for number in range(3):
+            self.tags['sport'].news.add(make_news(source, f'Sport news {number}'))
+        Tag.objects.filter(name='war').update(usage_count=7)
+
+        recount_tag_usage()
+        self.assertEqual(dict(Tag.objects.values_list('name', 'usage_count')),
+                         {'war': 0, 'warsaw': 0, 'water': 0, 'sport': 3})
+
+    def test_ranking(self):
+        record_tag_usage(Counter({self.tags['warsaw'].id: 4, self.tags['war'].id: 4, self.tags['water'].id: 9,
+                                  self.tags['sport'].id: 20}))
+        # Most used first, ties by name
+        self.assertEqual([tag.name for tag in suggest_tags(' WAR', 10)], ['war', 'warsaw'])
+        self.assertEqual([tag.name for tag in suggest_tags('wa', 2)], ['water', 'war'])
+        self.assertEqual(list(suggest_tags('  ', 10)), [])
+        self.assertEqual([tag.name for tag in top_tags(2)], ['sport', 'water'])
+
+    def test_endpoint(self):
+        record_tag_usage(Counter({self.tags['water'].id: 2}))
+        response = self.client.get('/tags/autocomplete/', {'q': 'wa', 'limit': 2})
+        self.assertEqual(response.json()['results'], [
+            {'id': self.tags['water'].id, 'name': 'water', 'slug': 'water', 'count': 2},
+            {'id': self.tags['war'].id, 'name': 'war', 'slug': 'war', 'count': 0},
+        ])
+        self.assertEqual(len(self.client.get('/tags/autocomplete/', {'q': 'wa', 'limit': 'all'}).json()['results']), 3)
+
+    def test_import_counts_linked_tags(self):
+        source = make_source('First')
+        articles = [
+            Article.build(f'Tagged news {number}', 'Body', f'https://first.example.com/{number}', 'First', tags=tags)
+            for number, tags in enumerate([['war', 'sport'], ['war'], ['new tag']])
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            NewsImporter().import_items(articles)
+        self.assertEqual(source.news.count(), 3)
+        self.assertEqual([(tag.name, tag.usage_count) for tag in top_tags(3)],
+                         [('war', 2), ('new tag', 1), ('sport', 1)])
+
+
+@override_settings(CACHES=TEST_CACHES, KEYWORD_TAGS_ENABLED=False)
+class ImportRevisionTests(TestCase):
+    """
+    Deduplication of re-ingested articles and in-place updates of the changed ones (importer, news.revisions)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.source = make_source('First')
+
+    def article(self, number, content='Body', title=None, **kwargs):
+        return Article.build(title or f'Revised news {number}', content, f'https://first.example.com/{number}',
+                             'First', **kwargs)
+
+    def run_import(self, articles):
+        with self.captureOnCommitCallbacks(execute=True):
+            return NewsImporter().import_items(articles)
+
+    def stored(self):
+        return {news.url.rsplit('/', 1)[1]: news for news in News.objects.all()}
+
+    def test_new_articles_are_stored_with_their_hash(self):
+        stats = self.run_import([self.article(1), self.article(2)])
+        self.assertEqual(stats, {'imported': 2, 'updated': 0, 'skipped': 0, 'errors': 0})
+        news = self.stored()['1']
+        self.assertEqual((news.content_hash, news.revision, news.updated_at),
+                         (self.article(1).content_hash, 1, None))
+
+    def test_unchanged_articles_are_skipped(self):
+        self.run_import([self.article(1), self.article(2)])
+        stats = self.run_import([self.article(1), self.article(2)])
+        self.assertEqual(stats, {'imported': 0, 'updated': 0, 'skipped': 2, 'errors': 0})
+        self.assertEqual(News.objects.count(), 2)
+
+    def test_same_title_under_another_url_is_skipped(self):
+        self.run_import([self.article(1)])
+        stats = self.run_import([self.article(3, title='Revised news 1')])
+        self.assertEqual(stats['skipped'], 1)
+        self.assertEqual(News.objects.count(), 1)
+
+    def test_changed_articles_are_updated_in_place(self):
+        self.run_import([self.article(1), self.article(2), self.article(3)])
+        before = self.stored()
+
+        with patch('news.management.commands.import_news_from_redis.invalidate_articles') as invalidate_articles:
+            stats = self.run_import([
+                self.article(1, content='Corrected body'),
+                self.article(2, title='Revised news 2, expanded'),
+                self.article(3),
+                self.article(4),
+            ])
+        self.assertEqual(stats, {'imported': 1, 'updated': 2, 'skipped': 1, 'errors': 0})
+
+        after = self.stored()
+        self.assertEqual((after['1'].content, after['1'].revision), ('Corrected body', 2))
+        self.assertEqual((after['2'].title, after['2'].revision), ('Revised news 2, expanded', 2))
+        for number in ('1', '2'):
+            self.assertIsNotNone(after[number].updated_at)
+            # The slug, and so the article's URL on the site, stays the same
+            self.assertEqual(after[number].slug, before[number].slug)
+        self.assertEqual(after['1'].content_hash, self.article(1, content='Corrected body').content_hash)
+        self.assertEqual((after['3'].revision, after['3'].updated_at), (1, None))
+        invalidate_articles.assert_called_once()
+        self.assertCountEqual(invalidate_articles.call_args.args[0], [before['1'].slug, before['2'].slug])
+
+    def test_hash_only_change_is_not_a_revision(self):
+        # Different raw feed content that cleans to the same text, e.g. changed markup
+        self.run_import([self.article(1, content='Текст новини')])
+        stats = self.run_import([self.article(1, content='Текст новини', hashed_content='0' * 32)])
+        self.assertEqual(stats, {'imported': 0, 'updated': 0, 'skipped': 1, 'errors': 0})
+        news = News.objects.get()
+        self.assertEqual((news.content_hash, news.revision, news.updated_at), ('0' * 32, 1, None))
+
+    def test_revised_article_is_revised_once(self):
+        self.run_import([self.article(1)])
+        changed = self.article(1, content='Corrected body')
+        stats = self.run_import([changed, changed])
+        self.assertEqual(stats['updated'], 1)
+        self.assertEqual(News.objects.get().revision, 2)
+
+
+@override_settings(CACHES=TEST_CACHES, KEYWORD_TAGS_TOP_K=2, KEYWORD_MIN_DF=2, KEYWORD_MAX_DF_RATIO=0.5,
+                   KEYWORD_MIN_ARTICLES=4)
+class KeywordTagTests(TestCase):
+    """
+    Tokenizer, document frequencies and TF-IDF keyword tags (news.keywords, importer)
+    """
+
+    # Terms per article: 'новини' is in every article and 'унікальне' in a single one, so neither is a keyword
+    CORPUS = [
+        ['вибори', 'вибори', 'парламент', 'новини', 'унікальне'],
+        ['вибори', 'футбол', 'новини'],
+        ['футбол', 'футбол', 'матч', 'новини'],
+        ['парламент', 'матч', 'матч', 'новини'],
+    ]
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("П'ять північно-східних регіонів, 2024 року: ДУЖЕ холодно"),
+                         ["п'ять", 'північно-східних', 'регіонів', 'холодно'])
+        self.assertEqual(tokenize(None), [])
+        self.assertEqual(tokenize_article('Вибори', 'Парламент обрав'), ['вибори', 'вибори', 'парламент', 'обрав'])
+
+    def test_document_frequencies(self):
+        update_document_frequencies(self.CORPUS[:2])
+        update_document_frequencies(self.CORPUS[2:])
+        frequencies, total = load_document_frequencies(['вибори', 'новини', 'унікальне', 'невідоме'])
+        self.assertEqual(frequencies, {'вибори': 2, 'новини': 4, 'унікальне': 1})
+        self.assertEqual(total, 4)
+
+    def test_keywords_of_a_fixed_corpus(self):
+        update_document_frequencies(self.CORPUS)
+        self.assertEqual(extract_keywords(self.CORPUS), [
+            ['вибори', 'парламент'],
+            ['вибори', 'футбол'],
+            ['футбол', 'матч'],
+            ['матч', 'парламент'],
+        ])
+        self.assertEqual(extract_keywords([[]]), [[]])
+
+    def test_import_tags_untagged_articles(self):
+        source = make_source('First')
+        tagged = make_news(source, 'Прогноз погоди', content='Погода')
+        tagged.tags.add(Tag.objects.create(name='manual', slug='manual'))
+        untagged = [make_news(source, f'Article {number}', content=' '.join(terms))
+                    for number, terms in enumerate(self.CORPUS)]
+
+        importer = NewsImporter()
+        importer._tag_keywords([tagged, *untagged])
+        self.assertEqual(list(tagged.tags.values_list('name', flat=True)), ['manual'])
+        self.assertEqual([set(news.tags.values_list('name', flat=True)) for news in untagged], [
+            {'вибори', 'парламент'}, {'вибори', 'футбол'}, {'футбол', 'матч'}, {'матч', 'парламент'},
+        ])
+        # The tagged article is counted in the document frequencies as well
+        self.assertEqual(load_document_frequencies([])[1], 5)
+        self.assertEqual(sum(importer.daily_counts.values()), 8)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PruneNewsTests(TestCase):
+    """
+    Archival and removal of old news (prune_news)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.source = make_source('First')
+        cls.tag = Tag.objects.create(name='war', slug='war')
+        cls.old = [make_news(cls.source, f'Old news {number}', timezone.now() - timedelta(days=40 + number))
+                   for number in range(5)]
+        cls.tag.news.add(cls.old[0])
+        cls.recent = make_news(cls.source, 'Recent news', timezone.now() - timedelta(days=20))
+        cls.recent.tags.add(cls.tag)
+
+    def setUp(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        self.archive_dir = archive_dir.name
+
+    def prune(self, **options):
+        call_command('prune_news', older_than=30, batch_size=2, sleep=0, archive_dir=self.archive_dir,
+                     stdout=StringIO(), **options)
+
+    def archived(self):
+        records = {}
+        for name in sorted(os.listdir(self.archive_dir)):
+            with gzip.open(os.path.join(self.archive_dir, name), 'rt', encoding='utf-8') as file:
+                records[name] = [json.loads(line) for line in file]
+        return records
+
+    def test_dry_run_removes_nothing(self):
+        self.prune(dry_run=True)
+        self.assertEqual(News.objects.count(), 6)
+        self.assertEqual(os.listdir(self.archive_dir), [])
+
+    def test_old_news_are_archived_and_removed_in_batches(self):
+        with patch('news.management.commands.prune_news.invalidate_articles') as invalidate_articles, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.prune()
+
+        self.assertEqual(list(News.objects.all()), [self.recent])
+        self.assertFalse(News.tags.through.objects.exclude(news_id=self.recent.id).exists())
+        self.assertEqual(Tag.objects.get().usage_count, 1)
+
+        ids = sorted(news.id for news in self.old)
+        records = self.archived()
+        self.assertEqual(list(records), [f'news-{ids[0]}-{ids[1]}.ndjson.gz', f'news-{ids[2]}-{ids[3]}.ndjson.gz',
+                                         f'news-{ids[4]}-{ids[4]}.ndjson.gz'])
+        archived = [record for batch in records.values() for record in batch]
+        self.assertEqual([record['id'] for record in archived], ids)
+        self.assertEqual((archived[0]['source'], archived[0]['tags']), ('First', ['war']))
+        self.assertEqual(archived[0]['published_at'], str(self.old[0].published_at))
+        # One cache invalidation per batch rather than one per article
+        self.assertEqual(invalidate_articles.call_count, 3)
+
+    def test_failed_batch_leaves_no_archive(self):
+        with patch('django.db.models.query.QuerySet.delete', side_effect=OperationalError('lock timeout')):
+            with self.assertRaises(CommandError):
+                self.prune()
+        self.assertEqual(News.objects.count(), 6)
+        self.assertEqual(os.listdir(self.archive_dir), [])
+
+    def test_without_archive(self):
+        self.prune(no_archive=True)
+        self.assertEqual(list(News.objects.all()), [self.recent])
+        self.assertEqual(os.listdir(self.archive_dir), [])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ExportNewsTests(TestCase):
+    """
+    Streaming export of news with their source, tags and categories (export_news)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.source = make_source('First')
+        cls.news = [make_news(cls.source, f'News {day}', aware(2024, 5, day, 12)) for day in range(1, 6)]
+        category = Category.objects.create(name='Politics', slug='politics')
+        site_category = SiteCategory.objects.create(name='Політика', slug='polityka', category=category)
+        cls.news[0].site_categories.add(site_category, SiteCategory.objects.create(name='Новини', slug='novyny'))
+        cls.news[0].tags.add(Tag.objects.create(name='war', slug='war'))
+
+    def setUp(self):
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        self.output_dir = output_dir.name
+
+    def export(self, **options):
+        path = os.path.join(self.output_dir, 'export.ndjson.gz')
+        call_command('export_news', output=path, chunk_size=2, stdout=StringIO(), **options)
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            return [json.loads(line) for line in file]
+
+    def test_records(self):
+        records = self.export()
+        self.assertEqual([record['id'] for record in records], [news.id for news in self.news])
+        records[0]['site_categories'].sort()
+        first = self.news[0]
+        self.assertEqual(records[0], {
+            'id': first.id,
+            'title': 'News 1',
+            'slug': first.slug,
+            'content': 'News 1 content',
+            'url': first.url,
+            'source': 'First',
+            'site_categories': ['Новини', 'Політика'],
+            'categories': ['politics'],
+            'tags': ['war'],
+            'published_at': str(first.published_at),
+            'created_at': str(first.created_at),
+        })
+        self.assertEqual((records[1]['site_categories'], records[1]['categories'], records[1]['tags']), ([], [], []))
+        self.assertEqual(os.listdir(self.output_dir), ['export.ndjson.gz'])
+
+    def test_row_selection(self):
+        def selected(**options):
+            return [record['id'] for record in self.export(**options)]
+
+        ids = [news.id for news in self.news]
+        self.assertEqual(selected(date_from=date(2024, 5, 2), date_to=date(2024, 5, 3)), ids[1:3])
+        self.assertEqual(selected(id_from=ids[1], id_to=ids[4]), ids[1:4])
+        shards = [selected(shard=(number, 3)) for number in range(1, 4)]
+        self.assertEqual(sorted(sum(shards, [])), ids)
+        self.assertTrue(all(shards))
+        self.assertEqual(selected(shard=(2, 2), id_to=ids[4]), ids[2:4])
+
+    def test_invalid_options(self):
+        for value in ['3/2', 'two']:
+            with self.subTest(shard=value), self.assertRaises(CommandError):
+                call_command('export_news', '--shard', value, output_dir=self.output_dir)
+        with self.assertRaises(CommandError):
+            call_command('export_news', output_dir=self.output_dir, database='missing')
+
+    def test_rows_are_streamed_in_chunks(self):
+        with patch('news.exporters.serialize_news_chunk', wraps=serialize_news_chunk) as serialize, \
+                patch.object(QuerySet, 'iterator', autospec=True, side_effect=QuerySet.iterator) as iterator:
+            self.assertEqual(len(self.export()), 5)
+        # The articles come from a cursor, never as one list, and are serialized a chunk at a time
+        iterator.assert_called_once()
+        self.assertEqual(iterator.call_args.kwargs, {'chunk_size': 2})
+        self.assertEqual([len(call.args[0]) for call in serialize.call_args_list], [2, 2, 1])
+
+    def test_failed_export_leaves_no_file(self):
+        with patch('news.exporters.NDJSONWriter.write', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.export()
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+
+class ArticleRecordTests(TestCase):
+    """
+    Article records handed between the pipeline tasks (news.articles)
+    """
+
+    def article(self, **kwargs):
+        return Article.build(**{
+            'title': 'Заголовок новини', 'content': 'Текст новини', 'url': 'https://first.example.com/1',
+            'source': 'First', 'site_category': 'Політика', 'tags': ['war', 'sport'],
+            'published_at': '2024-05-01T10:00:00+03:00', **kwargs,
+        })
+
+    def test_round_trip(self):
+        article = self.article()
+        self.assertEqual(Article.from_json(article.to_json()), article)
+        self.assertEqual(Article.from_json(article.to_json().encode('utf-8')), article)
+
+        article = self.article(published_at=None, tags=(), site_category='')
+        self.assertEqual(Article.from_json(article.to_json()), article)
+
+    def test_fields_are_stored_in_order(self):
+        article = self.article()
+        self.assertEqual(json.loads(article.to_json()), [
+            'Заголовок новини', 'Текст новини', 'https://first.example.com/1', 'First', 'Політика', ['war', 'sport'],
+            '2024-05-01T10:00:00+03:00', article.slug, article.url_hash, article.content_hash,
+        ])
+
+    def test_publish_time_is_read_by_the_importer(self):
+        published_at = NewsImporter()._parse_published_at(Article.from_json(self.article().to_json()).published_at)
+        self.assertEqual(published_at, datetime(2024, 5, 1, 7, 0, tzinfo=dt_timezone.utc))
+
+    def test_older_payloads(self):
+        article = self.article()
+        # Queued before content hashes were added
+        self.assertEqual(Article.from_json(json.dumps(json.loads(article.to_json())[:9])), article)
+        self.assertEqual(Article.from_json(json.dumps({
+            'title': article.title, 'content': article.content, 'url': article.url, 'source': 'First',
+            'site_category': 'Політика', 'tags': ['war', 'sport'], 'published_at': article.published_at,
+        })), article)
+
+    def test_malformed_payloads_are_rejected(self):
+        values = json.loads(self.article().to_json())
+        for payload in [
+            'not json', b'\xff', 'null', '42', '[]', json.dumps(values[:8]), json.dumps(values + ['extra']),
+            json.dumps(['', *values[1:]]), json.dumps([None, *values[1:]]),
+            json.dumps(values[:5] + ['war'] + values[6:]), json.dumps(values[:6] + [1714546800] + values[7:]),
+            json.dumps({'title': 'No URL'}),
+        ]:
+            with self.subTest(payload=payload):
+                self.assertIsNone(Article.from_json(payload))
+
+    def test_importer_skips_malformed_items(self):
+        importer = NewsImporter()
+        importer.redis_client = MagicMock()
+        importer.redis_client.type.return_value = b'list'
+        importer.redis_client.lrange.return_value = [
+            self.article().to_json(), '["truncated"', self.article(url='https://first.example.com/2').to_json(),
+        ]
+        with self.assertLogs('news.management.commands.import_news_from_redis', 'WARNING'):
+            articles = importer.get_news_from_redis('parsed')
+        self.assertEqual([article.url for article in articles],
+                         ['https://first.example.com/1', 'https://first.example.com/2'])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AdminListTests(TestCase):
+    """
+    Changelist counts and searches of large tables (news.admin)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        source = make_source()
+        for number in range(3):
+            make_news(source, f'Counted news {number}')
+        for name in ('war', 'warsaw', 'sport'):
+            Tag.objects.create(name=name, slug=name)
+
+    def test_exact_count(self):
+        # Small tables are counted exactly, on PostgreSQL too
+        paginator = EstimatedCountPaginator(News.objects.order_by('id'), 2)
+        self.assertEqual((paginator.count, paginator.num_pages), (3, 2))
+        self.assertEqual(EstimatedCountPaginator(News.objects.filter(title__endswith='1').order_by('id'), 2).count, 1)
+
+    @skipUnless(connection.vendor == 'postgresql', "Row estimates are read from PostgreSQL")
+    def test_large_table_uses_the_row_estimate(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {News._meta.db_table}")
+        with patch.object(EstimatedCountPaginator, 'ESTIMATE_THRESHOLD', 1), self.assertNumQueries(1):
+            self.assertEqual(EstimatedCountPaginator(News.objects.order_by('id'), 2).count, 3)
+
+    @skipUnless(connection.vendor == 'postgresql', "Row estimates are read from PostgreSQL")
+    def test_slow_count_uses_the_plan_estimate(self):
+        queryset = News.objects.filter(title__startswith='Counted').order_by('id')
+        timeout = OperationalError("canceling statement due to statement timeout")
+        with patch('django.core.paginator.Paginator.count', new_callable=PropertyMock, side_effect=timeout):
+            count = EstimatedCountPaginator(queryset, 2).count
+        # The planner's guess for the filter, not an exact count
+        self.assertIsInstance(count, int)
+        self.assertGreater(count, 0)
+
+    def test_tag_search_uses_the_name_prefix(self):
+        queryset, may_have_duplicates = TagAdmin(Tag, admin.site).get_search_results(None, Tag.objects.all(), ' WAR ')
+        self.assertEqual(sorted(queryset.values_list('name', flat=True)), ['war', 'warsaw'])
+        self.assertFalse(may_have_duplicates)
+        self.assertNotIn('UPPER', str(queryset.query))
+
+
+@override_settings(CACHES=TEST_CACHES, METRICS_ENABLED=True, METRICS_TOKEN='')
+class PipelineMetricsTests(TestCase):
+    """
+    Pipeline metrics kept per run and in the shared Prometheus store (news.metrics, /metrics)
+    """
+
+    def run_metrics(self):
+        metrics = RunMetrics()
+        metrics.observe('fetch', 0.02, source='First', queries=2)
+        metrics.observe('fetch', 3, source='First')
+        metrics.incr('news_pipeline_entries_total', 'First', 5, outcome='seen')
+        metrics.incr('news_pipeline_fetched_bytes_total', 'First', 1024)
+        return metrics
+
+    def test_run_summary(self):
+        summary = self.run_metrics().as_dict()
+        self.assertEqual(summary['stages']['fetch'], {'calls': 2, 'seconds': 3.02, 'max_seconds': 3, 'queries': 2})
+        self.assertEqual(summary['sources']['First'], {'fetch_seconds': 3.02, 'fetch_queries': 2, 'seen': 5,
+                                                       'fetched_bytes': 1024})
+        merged = merge_summaries(self.run_metrics().as_dict(), summary)
+        self.assertEqual(merged['stages']['fetch'], {'calls': 4, 'seconds': 6.04, 'max_seconds': 3, 'queries': 4})
+
+    @skipUnless(redis_available(), "Needs the Redis server of the settings")
+    def test_flush_and_render(self):
+        key = f'test:metrics:{uuid.uuid4().hex}'
+        self.addCleanup(get_redis_client().delete, key)
+        with override_settings(METRICS_REDIS_KEY=key):
+            self.run_metrics().flush('parse')
+            self.run_metrics().flush('parse')
+            samples = {field.decode(): value.decode() for field, value in get_redis_client().hgetall(key).items()}
+            body = render_prometheus()
+
+        bucket = 'news_pipeline_stage_duration_seconds_bucket{source="First",stage="fetch",le="%s"}'
+        self.assertEqual(samples[bucket % 0.01], '0')
+        self.assertEqual(samples[bucket % 0.025], '2')
+        self.assertEqual(samples[bucket % '+Inf'], '4')
+        self.assertEqual(samples['news_pipeline_stage_duration_seconds_count{source="First",stage="fetch"}'], '4')
+        self.assertEqual(float(samples['news_pipeline_entries_total{outcome="seen",source="First"}']), 10)
+        self.assertEqual(float(samples['news_pipeline_db_queries_total{source="First",stage="fetch"}']), 4)
+        self.assertEqual(samples['news_pipeline_runs_total{step="parse"}'], '2')
+
+        lines = body.splitlines()
+        self.assertEqual(lines[:2], [
+            '# HELP news_pipeline_stage_duration_seconds Time spent in a pipeline stage',
+            '# TYPE news_pipeline_stage_duration_seconds histogram',
+        ])
+        buckets = [line for line in lines if line.startswith('news_pipeline_stage_duration_seconds_bucket')]
+        self.assertEqual(len(buckets), 14)
+        self.assertTrue(buckets[0].startswith(bucket % 0.005))
+        self.assertTrue(buckets[-1].startswith(bucket % '+Inf'))
+        self.assertIn('# TYPE news_pipeline_runs_total counter', lines)
+
+    @skipUnless(redis_available(), "Needs the Redis server of the settings")
+    def test_endpoint_token(self):
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+
+    def test_endpoint_without_store(self):
+        with patch('news.views.render_prometheus', side_effect=redis.ConnectionError("Redis is down")):
+            response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 503)
+
+
+@override_settings(CACHES=TEST_CACHES, KEYWORD_TAGS_ENABLED=False, METRICS_ENABLED=False, PROFILE_TOP_N=5)
+class RunProfileTests(TestCase):
+    """
+    Profiles of pipeline runs (news.profiling, --profile, admin download)
+    """
+
+    def test_import_profile_is_stored_and_served(self):
+        make_source('First')
+        stats = LogStats.objects.create()
+        articles = [Article.build(f'Profiled news {number}', 'Body', f'https://first.example.com/{number}', 'First')
+                    for number in range(3)]
+        stdout = StringIO()
+        with patch('news.management.commands.import_news_from_redis.NewsImporter.get_news_from_redis',
+                   return_value=articles):
+            call_command('import_news_from_redis', key='parsed', stats_id=stats.id, profile=True, stdout=stdout)
+        self.assertIn('== import profile ==', stdout.getvalue())
+
+        report = LogStats.objects.get(id=stats.id).profile['import']
+        self.assertEqual(len(report['functions']), 5)
+        self.assertGreater(report['query_count'], 0)
+        # The same statement for every article is grouped into one entry
+        inserts = [query for query in report['queries'] if query['sql'].startswith('INSERT INTO "news_news"')]
+        self.assertEqual([query['calls'] for query in inserts], [3])
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.post('/admin/news/logstats/', {'action': 'download_profile',
+                                                              '_selected_action': [stats.id]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="pipeline-profile.txt"')
+        self.assertIn('Slowest queries (by total time):', response.content.decode())
+        self.assertIn('INSERT INTO "news_news"', response.content.decode())
+
+    def test_runs_are_not_profiled_by_default(self):
+        stats = LogStats.objects.create()
+        with profile_run(False, 'import', stats.id) as profiler:
+            News.objects.count()
+        self.assertIsNone(profiler)
+        self.assertEqual(LogStats.objects.get(id=stats.id).profile, {})
+
+
+class TaskRoutingTests(SimpleTestCase):
+    """
+    Queues of the pipeline tasks (CELERY_TASK_ROUTES) and the workers consuming them (compose.yml)
+    """
+
+    def route(self, task_name):
+        return celery_app.amqp.router.route({}, task_name)['queue'].name
+
+    def test_pipeline_steps_use_their_queues(self):
+        for task_name, queue in [
+            ('news.tasks.fetch_feed_task', 'fetch'),
+            ('news.tasks.parse_feed_task', 'parse'),
+            ('news.tasks.websub_push_task', 'parse'),
+            ('news.tasks.import_news_task', 'import'),
+            ('news.tasks.import_pushed_news_task', 'import'),
+            ('news.tasks.process_news_chain', 'celery'),
+            ('news.tasks.refresh_feeds_task', 'celery'),
+        ]:
+            with self.subTest(task=task_name):
+                self.assertEqual(self.route(task_name), queue)
+
+    def test_routed_tasks_exist_and_have_workers(self):
+        celery_app.loader.import_default_modules()
+        with open(os.path.join(settings.BASE_DIR, 'compose.yml')) as file:
+            consumed = set(re.findall(r'worker -Q (\w+)', file.read()))
+        for task_name, route in settings.CELERY_TASK_ROUTES.items():
+            with self.subTest(task=task_name):
+                self.assertIn(task_name, celery_app.tasks)
+                self.assertIn(route['queue'], consumed)
+
+
+@override_settings(CACHES=TEST_CACHES, WEBSUB_CALLBACK_BASE_URL='https://news.example.com', WEBSUB_LEASE_SECONDS=3600,
+                   WEBSUB_RENEW_MARGIN=600, WEBSUB_RETRY_INTERVAL=300)
+class WebSubTests(TestCase):
+    """
+    WebSub subscriptions (news.websub) and the subscriber callback receiving the hub's requests
+    """
+
+    def setUp(self):
+        self.source = make_source()
+        self.subscription = WebSubSubscription.objects.create(source=self.source, hub_url='https://hub.example.com/',
+                                                              topic_url=self.source.rss_url)
+        self.url = reverse('websub_callback', args=[self.subscription.id])
+
+    def push(self, body, signature):
+        headers = {'HTTP_X_HUB_SIGNATURE': signature} if signature else {}
+        with patch('news.views.store_raw_feed') as store_raw_feed, \
+                patch('news.views.websub_push_task') as websub_push_task:
+            response = self.client.post(self.url, body, content_type='application/rss+xml', **headers)
+        return response, store_raw_feed, websub_push_task
+
+    def test_signed_push_is_queued(self):
+        body = b'<rss><channel><item><title>Pushed</title></item></channel></rss>'
+        response, store_raw_feed, websub_push_task = self.push(body, websub.sign(self.subscription.secret, body))
+
+        self.assertEqual(response.status_code, 202)
+        run_id, source_id, stored_body, content_type = store_raw_feed.call_args.args
+        self.assertEqual((source_id, stored_body, content_type), (self.subscription.id, body, 'application/rss+xml'))
+        websub_push_task.delay.assert_called_once_with(self.subscription.id, run_id.removeprefix('websub-'))
+        self.subscription.refresh_from_db()
+        self.assertIsNotNone(self.subscription.last_pushed_at)
+
+    def test_push_with_bad_signature_is_dropped(self):
+        body = b'<rss></rss>'
+        for signature in [None, 'sha256=0', 'md5=' + hashlib.md5(body).hexdigest(),
+                          websub.sign('other secret', body, 'sha1'),
+                          websub.sign(self.subscription.secret, b'<rss>tampered</rss>')]:
+            with self.subTest(signature=signature):
+                response, store_raw_feed, websub_push_task = self.push(body, signature)
+                # Acknowledged so the hub does not retry, but never stored or parsed
+                self.assertEqual(response.status_code, 202)
+                store_raw_feed.assert_not_called()
+                websub_push_task.delay.assert_not_called()
+        self.subscription.refresh_from_db()
+        self.assertIsNone(self.subscription.last_pushed_at)
+
+    def test_signature_methods(self):
+        body = b'<rss></rss>'
+        for method in websub.SIGNATURE_METHODS:
+            with self.subTest(method=method):
+                self.assertTrue(websub.is_signature_valid('secret', body, websub.sign('secret', body, method)))
+
+    def test_unknown_subscription_is_gone(self):
+        response = self.client.get(reverse('websub_callback', args=[self.subscription.id + 1]))
+        self.assertEqual(response.status_code, 410)
+
+    def test_subscribe_and_verify(self):
+        self.subscription.delete()
+        subscription = websub.register_hub(self.source, 'https://hub.example.com/')
+        self.assertEqual(subscription.topic_url, self.source.rss_url)
+        with patch('news.websub.requests.post') as post:
+            websub.send_request(subscription)
+        self.assertEqual(post.call_args.args, ('https://hub.example.com/',))
+        self.assertEqual(post.call_args.kwargs['data'], {
+            'hub.mode': 'subscribe',
+            'hub.topic': self.source.rss_url,
+            'hub.callback': f'https://news.example.com/websub/{subscription.id}/',
+            'hub.secret': subscription.secret,
+            'hub.lease_seconds': 3600,
+        })
+        subscription.refresh_from_db()
+        self.assertIsNotNone(subscription.requested_at)
+        # The pending request is not sent again before the hub had time to verify it
+        self.assertIsNone(websub.register_hub(self.source, 'https://hub.example.com/'))
+
+        url = reverse('websub_callback', args=[subscription.id])
+        response = self.client.get(url, {'hub.mode': 'subscribe', 'hub.topic': 'https://other.example.com/rss',
+                                         'hub.challenge': 'challenge'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(url, {'hub.mode': 'subscribe', 'hub.topic': self.source.rss_url,
+                                         'hub.challenge': 'challenge', 'hub.lease_seconds': '7200'})
+        self.assertEqual(response.content, b'challenge')
+        subscription.refresh_from_db()
+        self.assertTrue(subscription.is_active)
+        self.assertAlmostEqual((subscription.lease_expires_at - timezone.now()).total_seconds(), 7200, delta=60)
+
+        # Moving to another hub starts over
+        moved = websub.register_hub(self.source, 'https://hub2.example.com/')
+        self.assertEqual((moved.hub_url, moved.lease_expires_at), ('https://hub2.example.com/', None))
+
+    def test_unsubscribe_and_deny(self):
+        self.subscription.lease_expires_at = timezone.now() + timedelta(hours=1)
+        self.subscription.save()
+        params = {'hub.mode': 'unsubscribe', 'hub.topic': self.source.rss_url, 'hub.challenge': 'challenge'}
+        # Active sources are never unsubscribed
+        self.assertEqual(self.client.get(self.url, params).status_code, 404)
+
+        with self.assertLogs('news.websub', 'WARNING'):
+            response = self.client.get(self.url, {'hub.mode': 'denied', 'hub.topic': self.source.rss_url,
+                                                  'hub.reason': 'not allowed'})
+        self.assertEqual(response.status_code, 200)
+        self.subscription.refresh_from_db()
+        self.assertFalse(self.subscription.is_active)
+
+    def test_renewal(self):
+        now = timezone.now()
+        expiring = self.subscription
+        expiring.lease_expires_at = now + timedelta(minutes=5)
+        expiring.save()
+        lasting = WebSubSubscription.objects.create(source=make_source('Lasting'), hub_url='https://hub.example.com/',
+                                                    topic_url='https://lasting.example.com/rss',
+                                                    lease_expires_at=now + timedelta(hours=1))
+        unverified = WebSubSubscription.objects.create(source=make_source('Unverified'),
+                                                       hub_url='https://hub.example.com/',
+                                                       topic_url='https://unverified.example.com/rss',
+                                                       requested_at=now - timedelta(hours=1))
+        WebSubSubscription.objects.create(source=make_source('Pending'), hub_url='https://hub.example.com/',
+                                          topic_url='https://pending.example.com/rss', requested_at=now)
+        WebSubSubscription.objects.create(source=make_source('Inactive', active=False),
+                                          hub_url='https://hub.example.com/',
+                                          topic_url='https://inactive.example.com/rss')
+
+        self.assertEqual(set(websub.subscriptions_to_renew()), {expiring, unverified})
+        self.assertNotIn(lasting, websub.subscriptions_to_renew())
+        with patch('news.tasks.websub_subscribe_task.delay') as delay:
+            self.assertEqual(renew_websub_subscriptions(), 2)
+        self.assertEqual({call.args[0] for call in delay.call_args_list}, {expiring.id, unverified.id})
+
+        with override_settings(WEBSUB_CALLBACK_BASE_URL=''), patch('news.tasks.websub_subscribe_task.delay') as delay:
+            self.assertEqual(renew_websub_subscriptions(), 0)
+        delay.assert_not_called()
+
+    def test_subscribe_task_retries_hub_errors(self):
+        with patch('news.websub.requests.post', side_effect=requests.ConnectionError("hub is down")), \
+                patch.object(websub_subscribe_task, 'retry', side_effect=Retry()) as retry, \
+                self.assertLogs('news.tasks', 'ERROR'):
+            with self.assertRaises(Retry):
+                websub_subscribe_task(self.subscription.id)
+        retry.assert_called_once()
+        self.assertIsNone(websub_subscribe_task(self.subscription.id + 1))
@@ -0,0 +1,208 @@
+import logging
+import math
+import time
+from collections import Counter
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import SiteCategory, Tag
+from .pipeline import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+TRENDING_PREFIX = 'news:trending'
+TRENDING_CACHE_PREFIX = 'news:trending'
+
+# Kind -> model whose slugs are counted
+KINDS = {
+    'tag': Tag,
+    'site_category': SiteCategory,
+}
+
+
+def bucket_key(kind, hour):
+    """
+    Sorted set counting the articles of one hour (hours since the epoch) per tag or site category slug
+    """
+    return f'{TRENDING_PREFIX}:{kind}:{hour}'
+
+
+def _horizon_hours():
+    # Buckets needed for the longest window, its baseline and the current partial hour
+    return max(settings.TRENDING_WINDOWS) + settings.TRENDING_BASELINE_HOURS + 1
+
+
+def record_links(links):
+    """
+    Count imported articles per hour bucket, given (kind, slug, published_at) of each link
+
+    Called once per committed import batch; articles published before the baseline of the
+    longest window (e.g. backfills) are not counted
+    """
+    oldest_hour = int(time.time() // 3600) - _horizon_hours()
+    counts = Counter()
+    for kind, slug, published_at in links:
+        hour = int(published_at.timestamp() // 3600)
+        if hour > oldest_hour:
+            counts[(kind, hour, slug)] += 1
+    if not counts:
+        return
+
+    ttl = _horizon_hours() * 3600
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        for (kind, hour, slug), count in counts.items():
+            pipe.zincrby(bucket_key(kind, hour), count, slug)
+        for kind, hour in {(kind, hour) for kind, hour, _ in counts}:
+            pipe.expire(bucket_key(kind, hour), ttl)
+        pipe.execute()
+    except redis.RedisError as e:
+        # Trending counters are best-effort and must never fail an import
+        logger.warning(f"Could not update trending counters: {str(e)}")
+
+
+def _window_counts(client, kind, window, now):
+    """
+    Article counts per slug over the last `window` hours and over the baseline hours before them
+
+    The current hour is still filling up, so the window takes it in full and the oldest hour
+    bucket weighted by the part of it still inside the window
+    """
+    current_hour = int(now // 3600)
+    elapsed = (now % 3600) / 3600
+    window_weights = {bucket_key(kind, current_hour - offset): 1 for offset in range(window)}
+    window_weights[bucket_key(kind, current_hour - window)] = 1 - elapsed
+    baseline_keys = [
+        bucket_key(kind, current_hour - window - 1 - offset)
+        for offset in range(settings.TRENDING_BASELINE_HOURS)
+    ]
+
+    window_key = f'{TRENDING_PREFIX}:tmp:{kind}:{window}:window'
+    baseline_key = f'{TRENDING_PREFIX}:tmp:{kind}:{window}:baseline'
+    pipe = client.pipeline()
+    pipe.zunionstore(window_key, window_weights)
+    pipe.zunionstore(baseline_key, baseline_keys)
+    pipe.zrangebyscore(window_key, settings.TRENDING_MIN_COUNT, '+inf', withscores=True)
+    pipe.delete(window_key)
+    results = pipe.execute()
+    counts = {slug.decode('utf-8'): count for slug, count in results[2]}
+
+    baseline = {}
+    if counts:
+        # One ZSCORE per slug in a single round trip (ZMSCORE would need Redis 6.2)
+        pipe = client.pipeline()
+        for slug in counts:
+            pipe.zscore(baseline_key, slug)
+        pipe.delete(baseline_key)
+        *scores, _ = pipe.execute()
+        baseline = {slug: score or 0 for slug, score in zip(counts, scores)}
+    else:
+        client.delete(baseline_key)
+    return counts, baseline
+
+
+def score(count, baseline, window):
+    """
+    How far a window's count rises above what the baseline rate predicts, in standard deviations
+
+    A Poisson-style z-score: rising from 2 to 12 articles scores higher than from 200 to 220
+    """
+    expected = baseline * window / settings.TRENDING_BASELINE_HOURS
+    return (count - expected) / math.sqrt(expected + 1), expected
+
+
+def _describe(kind, slugs):
+    """
+    Name and index filter of each trending slug
+    """
+    if kind == 'tag':
+        return {
+            slug: {'name': name, 'filter': f'tag={slug}'}
+            for slug, name in Tag.objects.filter(slug__in=slugs).values_list('slug', 'name')
+        }
+
+    described = {}
+    for slug, name, category_slug in SiteCategory.objects.filter(slug__in=slugs).values_list(
+            'slug', 'name', 'category__slug'):
+        # Site categories can only be filtered on through the category they are mapped to
+        described[slug] = {'name': name, 'filter': f'category={category_slug}' if category_slug else ''}
+    return described
+
+
+def compute_trending():
+    """
+    Score every window and kind and cache the top TRENDING_TOP_K of each
+
+    Returns the cached results, keyed by window ('1h', '6h', ...)
+    """
+    client = get_redis_client()
+    now = time.time()
+    generated_at = timezone.now().isoformat()
+    results = {}
+
+    for window in settings.TRENDING_WINDOWS:
+        by_kind = {}
+        for kind in KINDS:
+            counts, baseline = _window_counts(client, kind, window, now)
+            scored = []
+            for slug, count in counts.items():
+                value, expected = score(count, baseline.get(slug, 0), window)
+                if value > 0:
+                    scored.append((value, slug, count, expected))
+            top = sorted(scored, reverse=True)[:settings.TRENDING_TOP_K]
+
+            described = _describe(kind, [slug for _, slug, _, _ in top])
+            by_kind[kind] = [
+                {
+                    'slug': slug,
+                    'name': described[slug]['name'],
+                    'filter': described[slug]['filter'],
+                    'count': round(count, 2),
+                    'expected': round(expected, 2),
+                    'score': round(value, 3),
+                }
+                for value, slug, count, expected in top
+                if slug in described
+            ]
+
+        results[f'{window}h'] = {'window': f'{window}h', 'generated_at': generated_at, 'results': by_kind}
+        cache.set(f'{TRENDING_CACHE_PREFIX}:{window}h', results[f'{window}h'], None)
+
+    return results
+
+
+def get_trending(window=None):
+    """
+    Cached trending topics of a window (default: the first of TRENDING_WINDOWS)
+
+    Never computes anything: returns None until the scoring task has run
+    """
+    window = window or f'{settings.TRENDING_WINDOWS[0]}h'
+    return cache.get(f'{TRENDING_CACHE_PREFIX}:{window}')
+
+
+def available_windows():
+    return [f'{window}h' for window in settings.TRENDING_WINDOWS]
+
+
+def trending_now(limit=10):
+    """
+    Top trending tags and site categories together, from the shortest window that has any
+
+    Returns (window, items); items are ranked by score and carry their `kind`
+    """
+    for window in available_windows():
+        trending = get_trending(window)
+        if not trending:
+            continue
+        items = [
+            dict(item, kind=kind)
+            for kind, kind_items in trending['results'].items()
+            for item in kind_items
+        ]
+        if items:
+            return window, sorted(items, key=lambda item: item['score'], reverse=True)[:limit]
+    return None, []
@@ -1,8 +1,28 @@
-from django.urls import path
-from . import views
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from . import views, api
+
+router = DefaultRouter()
+router.register('news', api.NewsViewSet, basename='api-news')
+router.register('sources', api.SourceViewSet, basename='api-sources')
+router.register('tags', api.TagViewSet, basename='api-tags')
+router.register('trending', api.TrendingViewSet, basename='api-trending')
+router.register('stats', api.StatsViewSet, basename='api-stats')
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('news/stream/', views.news_stream, name='news_stream'),
     path('news/<slug:slug>/', views.news_detail, name='news_detail'),
     path('sources/', views.source_list, name='source_list'),
+    path('stats/', views.stats, name='stats'),
+    path('feeds/<str:feed_format>/', views.feed, name='feed'),
+    path('feeds/source/<int:source_id>/<str:feed_format>/', views.source_feed, name='source_feed'),
+    path('feeds/category/<slug:slug>/<str:feed_format>/', views.category_feed, name='category_feed'),
+    path('sitemap.xml', views.sitemap_index, name='sitemap_index'),
+    path('sitemap-news-<int:page>.xml', views.sitemap_page, name='sitemap_page'),
+    path('fragments/news/', views.news_list_fragment, name='news_list_fragment'),
+    path('tags/autocomplete/', views.tag_autocomplete, name='tag_autocomplete'),
+    path('api/v1/', include(router.urls)),
+    path('metrics', views.metrics, name='metrics'),
+    path('websub/<int:subscription_id>/', views.websub_callback, name='websub_callback'),
 ]
@@ -1,108 +1,143 @@
-from django.shortcuts import render, get_object_or_404
+import uuid
+
+import redis
+from django.conf import settings
 from django.core.paginator import Paginator
 from django.db.models import Q
-from datetime import datetime, date
-from .models import News, Source, Category, Tag
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render, get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.utils.text import Truncator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_http_methods
+
+from . import websub
+from .autocomplete import suggest_tags, top_tags
+from .cache import (
+    anonymous_page_cache, public_cache_control, import_etag, import_last_modified, index_cache_key,
+    article_etag, article_last_modified, article_cache_key,
+)
+from .feeds import ALL_SCOPE, FEED_FORMATS, category_scope, get_feed, source_scope
+from .live import stream_new_articles
+from .metrics import render_prometheus
+from .models import DailyCount, News, Source, Category, Tag, WebSubSubscription
+from .pipeline import store_raw_feed
+from .queries import parse_news_filters, parse_stats_period, filter_news
+from .rollups import daily_totals, top_objects
+from .sitemaps import news_queryset, render_sitemap_index, sitemap_pages, stream_sitemap_page
+from .tasks import websub_push_task
+from .trending import trending_now
+
+NEWS_PER_PAGE = 10
+STATS_PERIODS = (7, 30, 90, 365)  # Days offered on the statistics page
+STATS_TOP = 10
+TAG_AUTOCOMPLETE_LIMIT = 10
+TAG_AUTOCOMPLETE_MAX_LIMIT = 50
+
+
+def _get_news_page(request):
+    """
+    Filter and paginate news for the index page and its AJAX fragment
+    Returns parsed filters and the requested page
+    """
+    filters = parse_news_filters(request.GET)
+    # Only load the columns the news list renders
+    news_list = filter_news(News.objects.only('id', 'title', 'slug', 'content', 'published_at'), filters)
+
+    paginator = Paginator(news_list, NEWS_PER_PAGE)
+    page = request.GET.get('page', 1)
+    return filters, paginator.get_page(page)
+
 
+@public_cache_control
+@condition(etag_func=import_etag, last_modified_func=import_last_modified)
+@anonymous_page_cache(index_cache_key)
 def index(request):
     """
     View for the main page displaying the list of news articles
     with filtering and search functionality
     """
-    # Default sorting by newest first
-    news_list = News.objects.all().order_by('-created_at')
-    
-    # Handle search query
-    query = request.GET.get('q')
-    if query:
-        news_list = news_list.filter(
-            Q(title__icontains=query) | 
-            Q(content__icontains=query)
-        )
-
-    # Handle multiple source filters (OR logic within sources)
-    sources_filter = request.GET.getlist('source')
-    if sources_filter:
-        # Remove empty strings
-        sources_filter = [s for s in sources_filter if s]
-        if sources_filter:
-            news_list = news_list.filter(source__id__in=sources_filter)
-
-    # Handle multiple category filters (OR logic within categories)
-    categories_filter = request.GET.getlist('category')
-    if categories_filter:
-        # Remove empty strings
-        categories_filter = [c for c in categories_filter if c]
-        if categories_filter:
-            news_list = news_list.filter(site_categories__category__slug__in=categories_filter)
-
-    # Handle multiple tag filters (OR logic within tags)
-    tags_filter = request.GET.getlist('tag')
-    if tags_filter:
-        # Remove empty strings
-        tags_filter = [t for t in tags_filter if t]
-        if tags_filter:
-            news_list = news_list.filter(tags__slug__in=tags_filter)
-
-    # Handle date range filtering
-    date_range = request.GET.get('date_range')
-    if date_range:
-        try:
-            # Handle single date or date range
-            if ' to ' in date_range:
-                # Date range
-                start_date_str, end_date_str = date_range.split(' to ')
-                start_date = datetime.strptime(start_date_str.strip(), '%Y-%m-%d').date()
-                end_date = datetime.strptime(end_date_str.strip(), '%Y-%m-%d').date()
-                
-                # Filter by date range (inclusive)
-                news_list = news_list.filter(
-                    created_at__date__gte=start_date,
-                    created_at__date__lte=end_date
-                )
-            else:
-                # Single date
-                single_date = datetime.strptime(date_range.strip(), '%Y-%m-%d').date()
-                news_list = news_list.filter(created_at__date=single_date)
-        except (ValueError, AttributeError):
-            # Invalid date format, ignore filter
-            pass
+    filters, news_list = _get_news_page(request)
 
     # Get data for filter dropdowns
     sources = Source.objects.filter(active=True).order_by('name')
     categories = Category.objects.all().order_by('name')
-    tags = Tag.objects.all().order_by('name')
-
-    # Handle sorting (by datetime)
-    sort_by = request.GET.get('sort', '-created_at')
-    allowed_sorts = ['created_at', '-created_at']
-    if sort_by not in allowed_sorts:
-        sort_by = '-created_at'
-
-    news_list = news_list.distinct().order_by(sort_by)
-
-    # Pagination
-    paginator = Paginator(news_list, 10)  # Show 10 news per page
-    page = request.GET.get('page', 1)
-    news_list = paginator.get_page(page)
+    # Only the most used tags (and the selected ones); others are found with the tag autocomplete
+    tags = list(top_tags(settings.TAG_FILTER_TOP))
+    shown = {tag.slug for tag in tags}
+    tags += Tag.objects.filter(slug__in=[slug for slug in filters['tags'] if slug not in shown])
+    trending_window, trending = trending_now()
     
     context = {
         'news_list': news_list,
+        'trending': trending,
+        'trending_window': trending_window,
         'sources': sources,
         'categories': categories,
         'tags': tags,
-        'current_filters': {
-            'sources': sources_filter,
-            'categories': categories_filter,
-            'tags': tags_filter,
-            'date_range': date_range,
-            'sort': sort_by,
-            'query': query
-        }
+        'current_filters': filters,
+        'stream_url': settings.NEWS_STREAM_URL or reverse('news_stream'),
     }
     
     return render(request, 'news/index.html', context)
 
+
+@public_cache_control
+@condition(etag_func=import_etag, last_modified_func=import_last_modified)
+@anonymous_page_cache(index_cache_key)
+def news_list_fragment(request):
+    """
+    View for AJAX filtering and pagination: returns only the news list
+    (HTML fragment, or compact JSON with ?format=json) without the sidebars
+    """
+    filters, news_list = _get_news_page(request)
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'results': [
+                {
+                    'title': news.title,
+                    'url': reverse('news_detail', args=[news.slug]),
+                    'excerpt': Truncator(news.content).words(30),
+                    'published_at': news.published_at.isoformat(),
+                }
+                for news in news_list
+            ],
+            'page': news_list.number,
+            'num_pages': news_list.paginator.num_pages,
+            'has_next': news_list.has_next(),
+            'has_previous': news_list.has_previous(),
+        }, json_dumps_params={'ensure_ascii': False})
+
+    return render(request, 'news/_news_list.html', {'news_list': news_list})
+
+
+@public_cache_control
+@condition(etag_func=import_etag, last_modified_func=import_last_modified)
+def tag_autocomplete(request):
+    """
+    Most used tags starting with ?q=, for the tag filter: compact JSON
+    """
+    try:
+        limit = min(int(request.GET.get('limit', TAG_AUTOCOMPLETE_LIMIT)), TAG_AUTOCOMPLETE_MAX_LIMIT)
+    except ValueError:
+        limit = TAG_AUTOCOMPLETE_LIMIT
+
+    tags = suggest_tags(request.GET.get('q', ''), max(limit, 1)).values('id', 'name', 'slug', 'usage_count')
+    return JsonResponse({
+        'results': [
+            {'id': tag['id'], 'name': tag['name'], 'slug': tag['slug'], 'count': tag['usage_count']}
+            for tag in tags
+        ],
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+@public_cache_control
+@condition(etag_func=article_etag, last_modified_func=article_last_modified)
+@anonymous_page_cache(article_cache_key)
 def news_detail(request, slug):
     """
     View for displaying the details of a specific news article
@@ -113,7 +148,7 @@ def news_detail(request, slug):
     related_news = News.objects.filter(
         Q(source=news.source) | 
         Q(site_categories__in=news.site_categories.all())
-    ).exclude(id=news.id).distinct().order_by('-created_at')[:5]
+    ).exclude(id=news.id).distinct().order_by('-published_at')[:5]
     
     context = {
         'news': news,
@@ -122,6 +157,20 @@ def news_detail(request, slug):
     
     return render(request, 'news/detail.html', context)
 
+
+async def news_stream(request):
+    """
+    Server-sent events stream pushing summaries of newly imported articles
+    Must be served by an ASGI worker: each client holds one long-lived connection
+    """
+    response = StreamingHttpResponse(stream_new_articles(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    # The stream may be served from a separate ASGI origin (see NEWS_STREAM_URL)
+    response['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
 def source_list(request):
     """
     View for displaying the list of news sources
@@ -137,4 +186,149 @@ def source_list(request):
         'sources': sources,
     }
     
-    return render(request, 'news/source_list.html', context)
\ No newline at end of file
+    return render(request, 'news/source_list.html', context)
+
+
+@public_cache_control
+@condition(etag_func=import_etag, last_modified_func=import_last_modified)
+@anonymous_page_cache(index_cache_key)
+def stats(request):
+    """
+    View for news statistics: news per day and the busiest sources, categories and tags of a period
+    Read from the daily counts kept by the importer
+    """
+    try:
+        date_from, date_to = parse_stats_period(request.GET)
+    except ValueError:
+        date_from, date_to = parse_stats_period({})
+
+    daily = daily_totals(date_from, date_to)
+    peak = max(day['count'] for day in daily) or 1
+    for day in daily:
+        day['percent'] = round(100 * day['count'] / peak)
+
+    default_days = '' if request.GET.get('date_range') else str(settings.STATS_DEFAULT_DAYS)
+    context = {
+        'daily': daily,
+        'total': sum(day['count'] for day in daily),
+        'date_from': date_from,
+        'date_to': date_to,
+        'periods': STATS_PERIODS,
+        'current_days': request.GET.get('days', default_days),
+        'top_sources': top_objects(DailyCount.SOURCE, date_from, date_to, STATS_TOP),
+        'top_categories': top_objects(DailyCount.CATEGORY, date_from, date_to, STATS_TOP),
+        'top_tags': top_objects(DailyCount.TAG, date_from, date_to, STATS_TOP),
+    }
+
+    return render(request, 'news/stats.html', context)
+
+
+def _feed_response(request, scope, feed_format):
+    """
+    Serve a feed precomputed by the importer (see news.feeds), answering conditional requests with 304
+    """
+    if feed_format not in FEED_FORMATS:
+        raise Http404("Unknown feed format")
+    entry = get_feed(scope, feed_format)
+    if entry is None:
+        raise Http404("Feed not found")
+
+    etag = quote_etag(entry['etag'])
+    last_modified = int(entry['last_modified'].timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(entry['body'], content_type=FEED_FORMATS[feed_format][0])
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+@public_cache_control
+def feed(request, feed_format):
+    """
+    Outgoing feed of the latest news in RSS 2.0, Atom or JSON Feed format
+    """
+    return _feed_response(request, ALL_SCOPE, feed_format)
+
+
+@public_cache_control
+def source_feed(request, source_id, feed_format):
+    return _feed_response(request, source_scope(source_id), feed_format)
+
+
+@public_cache_control
+def category_feed(request, slug, feed_format):
+    return _feed_response(request, category_scope(slug), feed_format)
+
+
+@public_cache_control
+@condition(etag_func=import_etag, last_modified_func=import_last_modified)
+@anonymous_page_cache(index_cache_key)
+def sitemap_index(request):
+    """
+    Sitemap index listing one sitemap per SITEMAP_PAGE_SIZE range of news IDs
+    """
+    body = render_sitemap_index(request.build_absolute_uri('/')[:-1], sitemap_pages(news_queryset()))
+    return HttpResponse(body, content_type='application/xml; charset=utf-8')
+
+
+@public_cache_control
+@condition(etag_func=import_etag, last_modified_func=import_last_modified)
+def sitemap_page(request, page):
+    """
+    Sitemap of one range of news IDs, streamed a chunk of news at a time
+    """
+    return StreamingHttpResponse(
+        stream_sitemap_page(request.build_absolute_uri('/')[:-1], news_queryset(), page),
+        content_type='application/xml; charset=utf-8'
+    )
+
+
+def metrics(request):
+    """
+    Pipeline metrics in the Prometheus text format
+    Metrics are collected by every web and Celery process into Redis, so any web process serves all of them
+    """
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden()
+
+    try:
+        body = render_prometheus()
+    except redis.RedisError as e:
+        return HttpResponse(f'# metrics store unavailable: {str(e)}\n', status=503, content_type='text/plain')
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def websub_callback(request, subscription_id):
+    """
+    WebSub subscriber callback
+    GET answers the hub's verification of a (un)subscription, POST receives pushed feed content
+    """
+    subscription = WebSubSubscription.objects.select_related('source').filter(id=subscription_id).first()
+    if subscription is None:
+        # 410 tells the hub to drop the subscription
+        return HttpResponse(status=410)
+
+    if request.method == 'GET':
+        if request.GET.get('hub.mode') == 'denied':
+            websub.deny(subscription, request.GET)
+            return HttpResponse(status=200)
+        challenge = websub.verify_intent(subscription, request.GET)
+        if challenge is None:
+            return HttpResponse(status=404)
+        return HttpResponse(challenge, content_type='text/plain')
+
+    body = request.body
+    # Content with a wrong signature must be ignored, but still acknowledged with a 2xx
+    if not websub.is_signature_valid(subscription.secret, body, request.headers.get('X-Hub-Signature')):
+        return HttpResponse(status=202)
+
+    # Parse and import in the background so the hub gets its answer right away
+    push_id = uuid.uuid4().hex
+    store_raw_feed(f'websub-{push_id}', subscription.id, body, request.headers.get('Content-Type', ''))
+    websub_push_task.delay(subscription.id, push_id)
+    WebSubSubscription.objects.filter(id=subscription.id).update(last_pushed_at=timezone.now())
+    return HttpResponse(status=202)
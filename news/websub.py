@@ -0,0 +1,174 @@
+import hashlib
+import hmac
+import logging
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import WebSubSubscription
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a hub to accept a (un)subscription request
+HUB_TIMEOUT = 30
+
+# Signature methods accepted in X-Hub-Signature ("<method>=<hex digest>")
+SIGNATURE_METHODS = {
+    'sha1': hashlib.sha1,
+    'sha256': hashlib.sha256,
+    'sha384': hashlib.sha384,
+    'sha512': hashlib.sha512,
+}
+
+
+def is_enabled():
+    """
+    WebSub needs a callback URL reachable by the hubs
+    """
+    return bool(settings.WEBSUB_CALLBACK_BASE_URL)
+
+
+def discover_hub(feed):
+    """
+    Find the hub and topic URLs advertised by a parsed feed (<atom:link rel="hub"/"self">)
+
+    Returns (hub URL, topic URL or None), or None if the feed has no hub
+    """
+    links = feed.feed.get('links', []) if hasattr(feed, 'feed') else []
+    hub = next((link.get('href') for link in links if link.get('rel') == 'hub' and link.get('href')), None)
+    if not hub:
+        return None
+    topic = next((link.get('href') for link in links if link.get('rel') == 'self' and link.get('href')), None)
+    return hub, topic
+
+
+def callback_url(subscription):
+    return settings.WEBSUB_CALLBACK_BASE_URL.rstrip('/') + reverse('websub_callback', args=[subscription.id])
+
+
+def send_request(subscription, mode='subscribe'):
+    """
+    Ask the hub to (un)subscribe our callback to the topic
+
+    The hub answers 202 Accepted and verifies the request asynchronously with a GET to the callback
+    """
+    response = requests.post(
+        subscription.hub_url,
+        data={
+            'hub.mode': mode,
+            'hub.topic': subscription.topic_url,
+            'hub.callback': callback_url(subscription),
+            'hub.secret': subscription.secret,
+            'hub.lease_seconds': settings.WEBSUB_LEASE_SECONDS,
+        },
+        timeout=HUB_TIMEOUT,
+    )
+    response.raise_for_status()
+    subscription.requested_at = timezone.now()
+    subscription.save(update_fields=['requested_at'])
+    logger.info(f"Requested WebSub {mode} of {subscription.topic_url} at {subscription.hub_url}")
+
+
+def register_hub(source, hub_url, topic_url=None):
+    """
+    Create or update the subscription of a source whose feed advertises a hub
+
+    Returns the subscription if a subscription request should be sent, None otherwise
+    """
+    topic_url = topic_url or source.rss_url
+    subscription = WebSubSubscription.objects.filter(source=source).first()
+
+    if subscription is None:
+        return WebSubSubscription.objects.create(source=source, hub_url=hub_url, topic_url=topic_url)
+
+    if subscription.hub_url != hub_url or subscription.topic_url != topic_url:
+        # The feed moved to another hub or topic: subscribe again from scratch
+        subscription.hub_url = hub_url
+        subscription.topic_url = topic_url
+        subscription.lease_expires_at = None
+        subscription.save(update_fields=['hub_url', 'topic_url', 'lease_expires_at'])
+        return subscription
+
+    if not subscription.is_active and not _recently_requested(subscription):
+        return subscription
+    return None
+
+
+def _recently_requested(subscription):
+    # A pending request is given some time to be verified before it is sent again
+    return (
+        subscription.requested_at is not None
+        and subscription.requested_at > timezone.now() - timedelta(seconds=settings.WEBSUB_RETRY_INTERVAL)
+    )
+
+
+def subscriptions_to_renew():
+    """
+    Subscriptions whose lease runs out before the next renewal check (or that were never verified)
+    """
+    renew_before = timezone.now() + timedelta(seconds=settings.WEBSUB_RENEW_MARGIN)
+    retry_before = timezone.now() - timedelta(seconds=settings.WEBSUB_RETRY_INTERVAL)
+    return (
+        WebSubSubscription.objects.filter(source__active=True)
+        .exclude(lease_expires_at__gt=renew_before)
+        .exclude(requested_at__gt=retry_before)
+    )
+
+
+def verify_intent(subscription, params):
+    """
+    Handle the verification GET of a hub
+
+    Returns the challenge to echo back, or None to refuse the request
+    """
+    mode = params.get('hub.mode')
+    if params.get('hub.topic') != subscription.topic_url:
+        logger.warning(f"WebSub verification for unknown topic {params.get('hub.topic')}")
+        return None
+
+    if mode == 'subscribe':
+        try:
+            lease_seconds = int(params.get('hub.lease_seconds', settings.WEBSUB_LEASE_SECONDS))
+        except ValueError:
+            lease_seconds = settings.WEBSUB_LEASE_SECONDS
+        subscription.lease_expires_at = timezone.now() + timedelta(seconds=lease_seconds)
+        subscription.save(update_fields=['lease_expires_at'])
+        logger.info(f"WebSub subscription of {subscription.source.name} verified for {lease_seconds}s")
+    elif mode == 'unsubscribe':
+        if subscription.source.active:
+            # We never ask to unsubscribe active sources
+            return None
+        subscription.lease_expires_at = None
+        subscription.save(update_fields=['lease_expires_at'])
+    else:
+        return None
+
+    return params.get('hub.challenge')
+
+
+def deny(subscription, params):
+    """
+    Handle a hub refusing the subscription: the source falls back to regular polling
+    """
+    logger.warning(f"WebSub subscription of {subscription.source.name} denied: {params.get('hub.reason', '')}")
+    subscription.lease_expires_at = None
+    subscription.save(update_fields=['lease_expires_at'])
+
+
+def sign(secret, body, method='sha256'):
+    return f"{method}={hmac.new(secret.encode(), body, SIGNATURE_METHODS[method]).hexdigest()}"
+
+
+def is_signature_valid(secret, body, header):
+    """
+    Check the X-Hub-Signature header of pushed content against the subscription secret
+    """
+    if not header or '=' not in header:
+        return False
+    method, _ = header.split('=', 1)
+    if method not in SIGNATURE_METHODS:
+        return False
+    return hmac.compare_digest(sign(secret, body, method), header)
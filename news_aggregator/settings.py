@@ -40,6 +40,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Before the session middleware, so session reads follow the replica routing too
+    'news.db_router.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -122,6 +124,99 @@ REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
 REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
 REDIS_DB = int(os.environ.get('REDIS_DB', 0))
 
+# Cache (separate Redis database from the parsed news data)
+REDIS_CACHE_DB = int(os.environ.get('REDIS_CACHE_DB', 1))
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_CACHE_DB}',
+    }
+}
+
+# HTTP caching for the index and article pages
+# Full-page cache for anonymous users
+PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', 'False').lower() in ('true', '1')
+PAGE_CACHE_TIMEOUT = int(os.environ.get('PAGE_CACHE_TIMEOUT', 60 * 60))
+PAGE_CACHE_MAX_AGE = int(os.environ.get('PAGE_CACHE_MAX_AGE', 60))  # Cache-Control max-age for anonymous responses
+
+# Retention of old news (see the prune_news command)
+NEWS_RETENTION_DAYS = int(os.environ.get('NEWS_RETENTION_DAYS', 365))
+NEWS_ARCHIVE_DIR = os.environ.get('NEWS_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+
+# Full dumps of the news for analytics (see the export_news command)
+NEWS_EXPORT_DIR = os.environ.get('NEWS_EXPORT_DIR', os.path.join(BASE_DIR, 'exports'))
+
+# Live push of newly imported articles (server-sent events, served by the ASGI worker)
+NEWS_LIVE_CHANNEL = os.environ.get('NEWS_LIVE_CHANNEL', 'news:live')
+NEWS_LIVE_HEARTBEAT = 15  # Seconds between keep-alive comments
+NEWS_LIVE_RETRY_MS = 5000  # Client reconnect delay
+NEWS_STREAM_URL = os.environ.get('NEWS_STREAM_URL', '')  # Absolute stream URL if served from another origin
+
+# Pipeline metrics (Prometheus format at /metrics, aggregated across processes in Redis)
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() in ('true', '1')
+METRICS_REDIS_KEY = os.environ.get('METRICS_REDIS_KEY', 'news:metrics')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # Require "Authorization: Bearer <token>" if set
+
+# Profiling of pipeline runs (--profile on rss_parse/import_news_from_redis, or all scheduled runs)
+PIPELINE_PROFILE = os.environ.get('PIPELINE_PROFILE', 'False').lower() in ('true', '1')
+PROFILE_TOP_N = int(os.environ.get('PROFILE_TOP_N', 30))  # Hot functions and slowest queries kept per run
+
+# WebSub: sources whose feed advertises a hub get new content pushed to /websub/<id>/
+WEBSUB_CALLBACK_BASE_URL = os.environ.get('WEBSUB_CALLBACK_BASE_URL', '')  # Public base URL; WebSub is off if empty
+WEBSUB_LEASE_SECONDS = int(os.environ.get('WEBSUB_LEASE_SECONDS', 10 * 24 * 60 * 60))  # Requested lease
+WEBSUB_RENEW_MARGIN = int(os.environ.get('WEBSUB_RENEW_MARGIN', 24 * 60 * 60))  # Renew leases this long before expiry
+WEBSUB_RETRY_INTERVAL = int(os.environ.get('WEBSUB_RETRY_INTERVAL', 60 * 60))  # Resend unverified requests after
+WEBSUB_POLL_INTERVAL = int(os.environ.get('WEBSUB_POLL_INTERVAL', 6 * 60 * 60))  # Fallback polling when subscribed
+
+# Trending tags and site categories: hourly counters in Redis, scored against a baseline by a periodic task
+TRENDING_WINDOWS = (1, 6, 24)  # Hours
+TRENDING_BASELINE_HOURS = int(os.environ.get('TRENDING_BASELINE_HOURS', 7 * 24))  # Hours before each window
+TRENDING_MIN_COUNT = int(os.environ.get('TRENDING_MIN_COUNT', 3))  # Articles needed in a window to trend
+TRENDING_TOP_K = int(os.environ.get('TRENDING_TOP_K', 20))
+TRENDING_SCORE_INTERVAL = int(os.environ.get('TRENDING_SCORE_INTERVAL', 5 * 60))  # Seconds between scoring runs
+
+# Keyword tags: articles imported without tags get their top TF-IDF terms as tags (see news.keywords)
+KEYWORD_TAGS_ENABLED = os.environ.get('KEYWORD_TAGS_ENABLED', 'True').lower() in ('true', '1')
+KEYWORD_TAGS_TOP_K = int(os.environ.get('KEYWORD_TAGS_TOP_K', 3))
+KEYWORD_MIN_DF = int(os.environ.get('KEYWORD_MIN_DF', 2))  # Terms seen in fewer articles are never tags
+KEYWORD_MAX_DF_RATIO = float(os.environ.get('KEYWORD_MAX_DF_RATIO', 0.2))  # Nor terms in more than this share
+KEYWORD_MIN_ARTICLES = 100  # Articles counted before KEYWORD_MAX_DF_RATIO applies
+
+# Tags listed in the tag filter of the main page before a search (most used first, see news.autocomplete)
+TAG_FILTER_TOP = int(os.environ.get('TAG_FILTER_TOP', 30))
+
+# Automatic SiteCategory -> Category mapping (see news.category_mapping)
+CATEGORY_MAPPING_MIN_SIMILARITY = float(os.environ.get('CATEGORY_MAPPING_MIN_SIMILARITY', 0.6))
+
+# Daily news counts per source, category and tag, kept by the importer for the statistics page and API
+STATS_DEFAULT_DAYS = int(os.environ.get('STATS_DEFAULT_DAYS', 30))
+STATS_MAX_DAYS = int(os.environ.get('STATS_MAX_DAYS', 366))  # Longest date range of a statistics request
+
+# Read replicas (see news.db_router): comma-separated host[:port] of PostgreSQL standbys of the primary.
+# Reads of GET requests go to a healthy replica; writes, the admin, Celery and management commands use the primary
+DATABASE_REPLICAS = []
+for number, replica in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    replica_host, _, replica_port = replica.strip().partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'PORT': replica_port or DATABASES['default']['PORT'],
+        'OPTIONS': {'connect_timeout': 2},
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+DATABASE_ROUTERS = ['news.db_router.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))  # Primary-only reads after a write or import
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 10))
+REPLICA_HEALTH_CHECK_INTERVAL = int(os.environ.get('REPLICA_HEALTH_CHECK_INTERVAL', 10))  # Seconds
+# The WebSub callback answers the hub's verification of subscriptions Celery has just created on the primary
+REPLICA_EXEMPT_PATHS = ('/admin/', '/websub/')
+
+# Outgoing RSS/Atom/JSON feeds, precomputed after each import (see news.feeds), and the sitemap
+SITE_URL = os.environ.get('SITE_URL', 'http://localhost:8000')  # Public base URL of the links in feeds
+FEED_ITEMS = int(os.environ.get('FEED_ITEMS', 50))  # Latest news in each feed
+SITEMAP_PAGE_SIZE = 50000  # News IDs per sitemap page; the sitemap protocol allows 50,000 URLs per file
+
 # Celery settings
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://redis:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://redis:6379/0')
@@ -130,6 +225,27 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Each pipeline step has its own queue served by a worker pool sized for its bottleneck (see compose.yml):
+# fetch is network bound (gevent), parse is CPU bound (prefork, one process per core) and import is
+# limited by database connections (small prefork pool). Orchestration tasks stay on the default queue.
+CELERY_TASK_ROUTES = {
+    'news.tasks.fetch_feed_task': {'queue': 'fetch'},
+    'news.tasks.parse_feed_task': {'queue': 'parse'},
+    'news.tasks.parse_rss_task': {'queue': 'parse'},
+    'news.tasks.import_news_task': {'queue': 'import'},
+    'news.tasks.websub_push_task': {'queue': 'parse'},
+    'news.tasks.import_pushed_news_task': {'queue': 'import'},
+}
+# Retries of a failed feed download (delay doubles with each attempt)
+FETCH_MAX_RETRIES = int(os.environ.get('FETCH_MAX_RETRIES', 2))
+FETCH_RETRY_DELAY = int(os.environ.get('FETCH_RETRY_DELAY', 30))
+# Leases (seconds) of the Redis locks on a pipeline run and on a single source; holders renew them while working
+PIPELINE_LOCK_TTL = int(os.environ.get('PIPELINE_LOCK_TTL', 10 * 60))
+SOURCE_LOCK_TTL = int(os.environ.get('SOURCE_LOCK_TTL', 2 * 60))
+# Long tasks are acknowledged after they finish; redeliver them if a worker dies mid-task
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1  # Overridden per worker with --prefetch-multiplier
+
 # Celery Beat settings
 CELERY_BEAT_SCHEDULE = {
     'process-news-every-30-minutes': {
@@ -139,6 +255,17 @@ CELERY_BEAT_SCHEDULE = {
             'expires': 60 * 29,  # Task expires after 29 minutes
         },
     },
+    'score-trending': {
+        'task': 'news.tasks.score_trending_task',
+        'schedule': timedelta(seconds=TRENDING_SCORE_INTERVAL),
+        'options': {
+            'expires': TRENDING_SCORE_INTERVAL,
+        },
+    },
+    'renew-websub-subscriptions-hourly': {
+        'task': 'news.tasks.renew_websub_subscriptions',
+        'schedule': timedelta(hours=1),
+    },
 }
 
 # REST Framework
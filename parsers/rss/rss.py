@@ -1,13 +1,19 @@
+import calendar
 import logging
 import re
+from datetime import datetime, timezone
 from typing import Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 
 import feedparser
+import requests
 from bs4 import BeautifulSoup
 from requests.exceptions import RequestException
 
+from news.articles import Article, content_hash
+from news.metrics import RunMetrics
 from news.models import News, Source
+from news.websub import discover_hub
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -16,6 +22,9 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
+# Seconds to wait for a feed server to respond
+FETCH_TIMEOUT = 30
+
 
 class RSSParser:
     """
@@ -57,9 +66,11 @@ class RSSParser:
         """
         Initialize the RSS parser
         """
-        pass
+        self.metrics = RunMetrics()
+        # Source ID -> (hub URL, topic URL) of parsed feeds that advertise a WebSub hub
+        self.hubs = {}
 
-    def parse_all_active_sources(self) -> Tuple[int, List[Dict]]:
+    def parse_all_active_sources(self) -> Tuple[int, List[Article]]:
         """
         Parse all active sources with RSS URLs from the database
 
@@ -88,7 +99,7 @@ class RSSParser:
 
         return total_sources, all_articles
 
-    def parse_source(self, source: Source) -> List[Dict]:
+    def parse_source(self, source: Source) -> List[Article]:
         """
         Parse RSS feed for a specific source
 
@@ -98,9 +109,56 @@ class RSSParser:
         Returns:
             List of parsed articles
         """
+        fetched = self.fetch_source(source)
+        if fetched is None:
+            return []
+        body, content_type = fetched
+        return self.parse_feed(source, body, content_type)
+
+    def fetch_source(self, source: Source) -> Optional[Tuple[bytes, str]]:
+        """
+        Download the RSS feed of a source
+
+        Args:
+            source: Source model instance
+
+        Returns:
+            Tuple of the feed body and its Content-Type, or None if the request failed
+        """
         try:
             logger.info(f"Fetching RSS feed from: {source.rss_url}")
-            feed = feedparser.parse(source.rss_url)
+            with self.metrics.stage('fetch', source.name):
+                response = requests.get(
+                    source.rss_url, timeout=FETCH_TIMEOUT, headers={'User-Agent': feedparser.USER_AGENT}
+                )
+                response.raise_for_status()
+            self.metrics.incr('news_pipeline_fetched_bytes_total', source.name, len(response.content))
+            return response.content, response.headers.get('Content-Type', '')
+
+        except RequestException as e:
+            logger.error(f"Request error for {source.name}: {str(e)}")
+            return None
+
+    def parse_feed(self, source: Source, body: bytes, content_type: str = '') -> List[Article]:
+        """
+        Parse a downloaded feed body and process its entries
+
+        Args:
+            source: Source model instance the feed belongs to
+            body: Raw feed document
+            content_type: Content-Type the feed was served with (used to detect the encoding)
+
+        Returns:
+            List of parsed articles
+        """
+        try:
+            with self.metrics.stage('parse', source.name):
+                headers = {'content-type': content_type} if content_type else None
+                feed = feedparser.parse(body, response_headers=headers)
+
+            hub = discover_hub(feed)
+            if hub:
+                self.hubs[source.id] = hub
 
             if hasattr(feed, 'bozo_exception'):
                 logger.error(f"Error parsing feed {source.name}: {feed.bozo_exception}")
@@ -110,33 +168,69 @@ class RSSParser:
                 logger.warning(f"No entries found in feed: {source.name}")
                 return []
 
-            # Process entries and filter out None results
-            articles = [article for entry in feed.entries
-                        if (article := self._process_entry(entry, source)) is not None]
+            # Process entries and filter out None results and entries listed twice in the feed
+            articles = []
+            seen_urls = set()
+            with self.metrics.stage('process', source.name):
+                stored = self._stored_articles(feed.entries)
+                for entry in feed.entries:
+                    article = self._process_entry(entry, source, stored)
+                    if article is None:
+                        continue
+                    if article.url_hash in seen_urls:
+                        self.metrics.incr('news_pipeline_entries_total', source.name, outcome='deduped')
+                        continue
+                    seen_urls.add(article.url_hash)
+                    articles.append(article)
 
             # Count articles using list length
             count = len(articles)
+            self.metrics.incr('news_pipeline_entries_total', source.name, len(feed.entries), outcome='seen')
+            self.metrics.incr('news_pipeline_entries_total', source.name, count, outcome='parsed')
 
             logger.info(f"Parsed {count} articles from {source.name}")
             return articles
 
-        except RequestException as e:
-            logger.error(f"Request error for {source.name}: {str(e)}")
-            return []
         except Exception as e:
             logger.error(f"Error parsing {source.name}: {str(e)}")
             return []
 
-    def _process_entry(self, entry, source: Source) -> Optional[Dict]:
+    def _stored_articles(self, entries) -> Tuple[Dict[str, str], set]:
         """
-        Process a single RSS entry and convert to article dict using site configuration
+        Look up which entries are already stored, with two indexed queries for the whole feed
+
+        Args:
+            entries: RSS feed entries
+
+        Returns:
+            Content hashes of stored news by URL, and the slugs of stored news among the entries' titles
+        """
+        urls = set()
+        slugs = set()
+        for entry in entries:
+            url = getattr(entry, 'link', None)
+            if url:
+                urls.add(News.truncate_for_field(url, 'url'))
+                slugs.add(News.get_safe_slug(News.truncate_for_field(getattr(entry, 'title', "Untitled"), 'title')))
+
+        hashes = dict(News.objects.filter(url__in=urls).values_list('url', 'content_hash')) if urls else {}
+        stored_slugs = set(News.objects.filter(slug__in=slugs).values_list('slug', flat=True)) if slugs else set()
+        return hashes, stored_slugs
+
+    def _process_entry(self, entry, source: Source, stored=None) -> Optional[Article]:
+        """
+        Process a single RSS entry and convert to an Article using site configuration
+
+        Entries already stored are skipped before their content is cleaned, unless their title or
+        raw content changed since: those are handed to the importer, which updates the stored article
 
         Args:
             entry: RSS feed entry
             source: Source model instance
+            stored: Result of _stored_articles for the feed (looked up for this entry if not given)
 
         Returns:
-            Dictionary containing article data or None if processing failed
+            Article record or None if processing failed
         """
         try:
             # Extract URL
@@ -145,21 +239,32 @@ class RSSParser:
                 logger.warning("Entry has no URL, skipping")
                 return None
 
-            # Extract title and limit to 480 characters
-            title = getattr(entry, 'title', "Untitled")
-            if len(title) > 480:
-                title = title[:480]
+            # Extract title and limit it to the News title length
+            title = News.truncate_for_field(getattr(entry, 'title', "Untitled"), 'title')
+
+            stored_hashes, stored_slugs = stored if stored is not None else self._stored_articles([entry])
+            stored_hash = stored_hashes.get(News.truncate_for_field(url, 'url'))
 
-            # Check if an article with this title already exists in the database
-            if News.objects.filter(title=title).exists():
+            # An article with this title already exists under another URL
+            if stored_hash is None and News.get_safe_slug(title) in stored_slugs:
                 logger.debug(f"Article with title '{title}' already exists, skipping")
+                self.metrics.incr('news_pipeline_entries_total', source.name, outcome='deduped')
                 return None
 
             # Get site configuration based on URL
             site_config = self._get_site_config(url, source.name)
 
-            # Extract full content using the site configuration
-            content = self._extract_content(entry, url, site_config)
+            # Unchanged since it was stored: skip before the costly cleaning
+            raw_content = self._extract_raw_content(entry, site_config)
+            hashed_content = content_hash(title, raw_content)
+            if stored_hash == hashed_content:
+                logger.debug(f"Article '{title}' is unchanged, skipping")
+                self.metrics.incr('news_pipeline_entries_total', source.name, outcome='deduped')
+                return None
+
+            # Clean the full content using the site configuration
+            with self.metrics.stage('clean', source.name):
+                content = self._clean_content(raw_content, site_config)
 
             # Get site category using the site configuration
             site_category = self._extract_category(entry, site_config)
@@ -167,17 +272,19 @@ class RSSParser:
             # Get tags using the site configuration
             tags = self._extract_tags(entry, site_config)
 
-            # Create article dictionary
-            article = {
-                "title": title,
-                "content": content,
-                "url": url,
-                "source": source.name,
-                "site_category": site_category,
-                "tags": tags
-            }
+            # Get the publish time reported by the feed
+            published_at = self._extract_published_at(entry)
 
-            return article
+            return Article.build(
+                title=title,
+                content=content,
+                url=url,
+                source=source.name,
+                site_category=site_category,
+                tags=tags,
+                published_at=published_at,
+                hashed_content=hashed_content
+            )
 
         except Exception as e:
             logger.error(f"Error processing entry: {str(e)}")
@@ -224,17 +331,16 @@ class RSSParser:
 
         return merged_config
 
-    def _extract_content(self, entry, url: str, site_config: Dict) -> str:
+    def _extract_raw_content(self, entry, site_config: Dict) -> str:
         """
-        Extract full content from the entry using site configuration
+        Extract the content of the entry as delivered by the feed, before cleaning
 
         Args:
             entry: RSS feed entry
-            url: Article URL
             site_config: Site configuration dictionary
 
         Returns:
-            Cleaned full content of the article
+            Raw content found by the first successful content extractor
         """
         content = ""
 
@@ -248,9 +354,6 @@ class RSSParser:
                 logger.debug(f"Content extractor error: {str(e)}")
                 continue
 
-        # Apply content cleaners
-        content = self._clean_content(content, site_config)
-
         return content
 
     def _extract_tags(self, entry, site_config: Dict) -> List[str]:
@@ -307,6 +410,27 @@ class RSSParser:
 
         return category
 
+    def _extract_published_at(self, entry) -> Optional[str]:
+        """
+        Extract the publish time of the entry
+
+        Args:
+            entry: RSS feed entry
+
+        Returns:
+            ISO 8601 UTC timestamp or None if the feed does not provide one
+        """
+        # feedparser normalizes dates to UTC struct_time
+        parsed_time = entry.get('published_parsed') or entry.get('updated_parsed')
+        if not parsed_time:
+            return None
+
+        try:
+            return datetime.fromtimestamp(calendar.timegm(parsed_time), tz=timezone.utc).isoformat()
+        except (OverflowError, ValueError, TypeError) as e:
+            logger.debug(f"Invalid publish time: {str(e)}")
+            return None
+
     def _clean_content(self, content: str, site_config: Dict) -> str:
         """
         Clean article content from HTML tags and other unwanted elements
@@ -348,7 +472,7 @@ class RSSParser:
         return text
 
 
-def run_rss_parser() -> Tuple[int, List[Dict]]:
+def run_rss_parser() -> Tuple[int, List[Article]]:
     """
     Run the RSS parser to fetch news articles
 
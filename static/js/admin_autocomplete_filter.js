@@ -0,0 +1,13 @@
+'use strict';
+// Reload the changelist filtered by the object picked in an AutocompleteFilter
+{
+    const $ = django.jQuery;
+    $(document).on('change', '.autocomplete-filter select', function() {
+        const filter = this.closest('.autocomplete-filter');
+        const params = new URLSearchParams(filter.dataset.queryString);
+        if (this.value) {
+            params.set(filter.dataset.lookup, this.value);
+        }
+        window.location.search = params.toString();
+    });
+}
@@ -36,44 +36,63 @@ $(document).ready(function() {
         icon.toggleClass('collapsed');
     });
 
-    // Tag search functionality
+    // Tag search: the sidebar lists only the most used tags, other tags are looked up on the server
+    let tagSearchTimer = null;
+    let tagSearchRequest = null;
+
+    function showInitialTags() {
+        $('.tag-item').each(function() {
+            const checked = $(this).find('input').prop('checked');
+            $(this).toggle($(this).data('initial') === true || checked);
+        });
+    }
+
+    function showTagSuggestions(tags) {
+        const container = $('#tagCheckboxGroup');
+        // Selected tags stay visible; other tags only if they match
+        $('.tag-item').each(function() {
+            $(this).toggle($(this).find('input').prop('checked'));
+        });
+        tags.forEach(function(tag) {
+            let item = $('#tag' + tag.id).closest('.tag-item');
+            if (!item.length) {
+                item = $('<div class="form-check tag-item"></div>').append(
+                    $('<input class="form-check-input" type="checkbox" name="tag">')
+                        .val(tag.slug).attr('id', 'tag' + tag.id),
+                    $('<label class="form-check-label"></label>').attr('for', 'tag' + tag.id).text(tag.name)
+                );
+            }
+            // Most used matches first, in the order of the results
+            container.append(item.show());
+        });
+    }
+
     $('#tagSearch').on('input', function() {
-        const searchTerm = $(this).val().toLowerCase();
-        const tagItems = $('.tag-item');
-        
+        const searchTerm = $(this).val().trim();
+        const autocompleteUrl = $(this).data('autocomplete-url');
+
+        clearTimeout(tagSearchTimer);
+        if (tagSearchRequest) {
+            tagSearchRequest.abort();
+            tagSearchRequest = null;
+        }
+
         if (searchTerm === '') {
-            // Show all tags in original order if search is empty
-            tagItems.show().sort(function(a, b) {
-                return $(a).find('label').text().localeCompare($(b).find('label').text());
-            }).appendTo('#tagCheckboxGroup');
-        } else {
-            // Filter and sort tags
-            let matchingTags = [];
-            let nonMatchingTags = [];
-            
-            tagItems.each(function() {
-                const tagName = $(this).data('tag-name');
-                if (tagName.includes(searchTerm)) {
-                    if (tagName.startsWith(searchTerm)) {
-                        // Tags that start with search term go first
-                        matchingTags.unshift(this);
-                    } else {
-                        // Tags that contain search term go after
-                        matchingTags.push(this);
-                    }
-                    $(this).show();
-                } else {
-                    nonMatchingTags.push(this);
-                    $(this).hide();
+            showInitialTags();
+            return;
+        }
+
+        // Wait for a pause in typing before asking the server
+        tagSearchTimer = setTimeout(function() {
+            tagSearchRequest = $.ajax({
+                url: autocompleteUrl,
+                data: {q: searchTerm},
+                dataType: 'json',
+                success: function(data) {
+                    showTagSuggestions(data.results);
                 }
             });
-            
-            // Reorder matching tags to show starts-with first
-            const container = $('#tagCheckboxGroup');
-            matchingTags.forEach(function(tag) {
-                container.append(tag);
-            });
-        }
+        }, 200);
     });
 
     // Mobile filter toggle
@@ -148,22 +167,15 @@ $(document).ready(function() {
         // Show loading indicator
         $('#news-container').html('<div class="text-center p-5"><div class="spinner-border" role="status"><span class="visually-hidden">Loading...</span></div></div>');
         
-        // Make AJAX request
+        // Make AJAX request for the news list fragment only (no sidebars)
         $.ajax({
-            url: window.location.pathname,
+            url: $('#news-list').data('fragment-url'),
             data: filters,
             traditional: true, // Important for handling arrays in jQuery AJAX
             dataType: 'html',
             success: function(data) {
-                // Extract news container content from response
-                const tempDiv = document.createElement('div');
-                tempDiv.innerHTML = data;
-                const newContent = $(tempDiv).find('#news-container').html();
-                const pagination = $(tempDiv).find('.pagination').html();
-                
-                // Update the page
-                $('#news-container').html(newContent);
-                $('.pagination').html(pagination);
+                // Replace the news list and pagination
+                $('#news-list').html(data);
                 
                 // Rebind pagination events
                 bindPaginationEvents();
@@ -255,7 +267,7 @@ $(document).ready(function() {
         dateRangePicker.clear();
         
         // Reset sort to default
-        $('#sortBy').val('-created_at');
+        $('#sortBy').val('-published_at');
         
         // Clear tag search
         $('#tagSearch').val('').trigger('input');
@@ -311,4 +323,31 @@ $(document).ready(function() {
     
     // Initialize filters on page load
     initializeFiltersFromURL();
+    
+    // Live updates: newly imported articles are pushed over a single server-sent events connection
+    function initializeLiveUpdates() {
+        const banner = $('#newArticlesBanner');
+        const streamUrl = banner.data('stream-url');
+        if (!streamUrl || !window.EventSource) return;
+
+        let newArticlesCount = 0;
+        
+        const eventSource = new EventSource(streamUrl);
+        eventSource.addEventListener('news', function(e) {
+            const articles = JSON.parse(e.data);
+            newArticlesCount += articles.length;
+            
+            banner.text(newArticlesCount + (newArticlesCount === 1 ? ' new article' : ' new articles') + ' - click to show')
+                  .removeClass('d-none');
+        });
+        
+        // Reload the first page with current filters when the banner is clicked
+        banner.on('click', function() {
+            newArticlesCount = 0;
+            banner.addClass('d-none');
+            loadNews(1);
+        });
+    }
+    
+    initializeLiveUpdates();
 });
\ No newline at end of file